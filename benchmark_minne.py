@@ -0,0 +1,240 @@
+"""
+Benchmark for minne-systemet (utils/minne.py).
+
+Genererer et syntetisk korpus med N meldinger fordelt på servere og kategorier, og måler
+skrive-gjennomstrømning for lagre(), latens (p50/p95/p99) for hent() og søk_i_kilde(),
+og minnebruk. Kjører mot en ChromaDB EphemeralClient i prosessen (ingen Docker nødvendig),
+og alle filer (FTS, embedding-cache, journal) havner i en midlertidig mappe.
+
+Eksempel:
+    python benchmark_minne.py --størrelser 10000,100000 --ut resultater.json
+    python benchmark_minne.py --størrelser 1000000 --embedding hash
+
+Resultatet er JSON, så to kjøringer (f.eks før/etter en endring) kan sammenlignes direkte.
+Hver størrelse kjøres i en egen prosess, så minnetallene ikke blandes.
+Forkaster skrive-køen minner (full kø), er skrivetallene ikke sammenlignbare: kjøringen
+merkes som ugyldig og programmet avslutter med kode 1.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import resource
+import statistics
+import subprocess
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+SERVERE = ["1001", "1002", "1003", "1004", "GLOBAL"]
+KATEGORIER = ["Chatlogg", "Generelt", "RPG_LORE", "Personlig", "Chatlogg_Digest"]
+BRUKERE = ["Kari", "Ola", "Stian", "Pepe", "Albert", "Nora", "Jonas", "Ida"]
+NAVN = [
+    "Zanthrax", "Blodmåne", "Eldring", "Frostklinge", "Skyggevokter", "Jernkrone",
+    "Valheim", "Stormhammer", "Dragefjell", "Nattravn", "Solspyd", "Isbjørnhulen"
+]
+ORD = (
+    "spill raid boss loot patch server kveld helg pizza film musikk kode python bug fiks "
+    "nyhet oppdatering klan turnering strategi level build item sverd skjold magi quest "
+    "kart grotte skatt handel gull sølv jobb skole trening mat oppskrift tur fjell sjø"
+).split()
+
+def lag_melding(rng):
+    ord_liste = rng.choices(ORD, k=rng.randint(6, 20))
+    if rng.random() < 0.3:
+        ord_liste.insert(rng.randrange(len(ord_liste)), rng.choice(NAVN))
+    return " ".join(ord_liste)
+
+def lag_korpus(n, rng, bøker=5):
+    """(tekst, bruker, guild, kanal, kategori, kilde). Ca 5% er bokbiter med egen kilde."""
+    for _ in range(n):
+        if rng.random() < 0.05:
+            bok = f"bok_{rng.randrange(bøker)}.md"
+            tekst = f"| {rng.choice(NAVN)} | {rng.randint(1, 99)} | " + lag_melding(rng)
+            yield tekst, "Bibliotekar", SERVERE[0], "0", "Bibliotek", bok
+        else:
+            yield (
+                lag_melding(rng), rng.choice(BRUKERE), rng.choice(SERVERE),
+                str(rng.randint(1, 20)), rng.choice(KATEGORIER), "Chat"
+            )
+
+def hash_embedding(tekster, dim=384):
+    """Rask, deterministisk 'bag of words'-vektor. Brukes når modellen ville dominert kjøretiden."""
+    vektorer = []
+    for tekst in tekster:
+        v = [0.0] * dim
+        for o in tekst.lower().split():
+            v[zlib.crc32(o.encode("utf-8")) % dim] += 1.0
+        norm = sum(x * x for x in v) ** 0.5 or 1.0
+        vektorer.append([x / norm for x in v])
+    return vektorer
+
+def prosentiler(tider_ms):
+    if len(tider_ms) < 2:
+        verdi = round(tider_ms[0], 3) if tider_ms else None
+        return {"p50": verdi, "p95": verdi, "p99": verdi, "snitt": verdi, "antall": len(tider_ms)}
+    q = statistics.quantiles(tider_ms, n=100, method="inclusive")
+    return {
+        "p50": round(q[49], 3),
+        "p95": round(q[94], 3),
+        "p99": round(q[98], 3),
+        "snitt": round(statistics.fmean(tider_ms), 3),
+        "antall": len(tider_ms)
+    }
+
+def maks_rss_mb():
+    # ru_maxrss er KB på Linux, bytes på macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def fil_mb(sti):
+    totalt = sum(os.path.getsize(sti + ending) for ending in ("", "-wal") if os.path.exists(sti + ending))
+    return round(totalt / (1024 * 1024), 2)
+
+def kjør_én(n, spørringer, embedding, frø):
+    """Kjøres i en egen prosess med en midlertidig arbeidsmappe."""
+    sys.path.insert(0, REPO)
+    arbeidsmappe = tempfile.mkdtemp(prefix="minne_bench_")
+    os.chdir(arbeidsmappe)
+
+    import chromadb
+    from utils import chroma, embedding as emb
+    chroma.sett_klient(chromadb.EphemeralClient(
+        settings=chromadb.config.Settings(allow_reset=True, anonymized_telemetry=False)
+    ))
+    if embedding == "hash":
+        emb._kjør_modell = hash_embedding
+
+    from utils import minne, fulltekst
+    minne.hent_cache.ttl = 0  # Mål selve søket, ikke cachen
+
+    rng = random.Random(frø)
+    rss_før = maks_rss_mb()
+
+    # --- SKRIVING ---
+    lagre_ms = []
+    start = time.perf_counter()
+    for tekst, bruker, guild, kanal, kategori, kilde in lag_korpus(n, rng):
+        t = time.perf_counter()
+        # Med backpressure som alagre(): måler hvor fort skriveren tar unna, ikke hvor fort vi forkaster
+        minne.lagre(tekst, bruker, guild, kanal, kategori=kategori, kilde=kilde, vent=minne.BACKPRESSURE_TIMEOUT)
+        lagre_ms.append((time.perf_counter() - t) * 1000)
+    minne.tøm_minnekø()
+    skrivetid = time.perf_counter() - start
+    forkastet = minne.skriver.forkastet
+
+    # --- HENT ---
+    hent_ms = []
+    for _ in range(spørringer):
+        if rng.random() < 0.5:
+            spørsmål = f"hva vet du om {rng.choice(NAVN)}"
+        else:
+            spørsmål = " ".join(rng.choices(ORD, k=4))
+        guild = rng.choice(SERVERE[:-1])
+        t = time.perf_counter()
+        minne.hent(spørsmål, guild, n_results=5)
+        hent_ms.append((time.perf_counter() - t) * 1000)
+
+    # --- SØK I KILDE ---
+    kilde_ms = []
+    for _ in range(spørringer):
+        spørsmål = f"{rng.choice(NAVN)} {rng.choice(ORD)}"
+        t = time.perf_counter()
+        minne.søk_i_kilde(spørsmål, f"bok_{rng.randrange(5)}.md", SERVERE[0], antall=5)
+        kilde_ms.append((time.perf_counter() - t) * 1000)
+
+    minne.stopp_minneskriver()
+    resultat = {
+        "n": n,
+        "embedding": embedding,
+        "skriv": {
+            "sekunder": round(skrivetid, 3),
+            "dok_per_sek": round((n - forkastet) / skrivetid, 1) if skrivetid else None,
+            "forkastet": forkastet,
+            "gyldig": forkastet == 0,
+            "lagre_kall_ms": prosentiler(lagre_ms)
+        },
+        "hent_ms": prosentiler(hent_ms),
+        "søk_i_kilde_ms": prosentiler(kilde_ms),
+        "minne": {
+            "maks_rss_mb": maks_rss_mb(),
+            "rss_økning_mb": round(maks_rss_mb() - rss_før, 1),
+            "fts_mb": fil_mb(fulltekst.FTS_DB),
+            "embedding_cache_mb": fil_mb(emb.CACHE_DB)
+        },
+        "statistikk": {
+            "embedding": emb.embedding_statistikk(),
+            "fts_dokumenter": fulltekst.antall()
+        }
+    }
+    os.chdir(REPO)
+    shutil.rmtree(arbeidsmappe, ignore_errors=True)
+    return resultat
+
+def git_versjon():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, text=True).strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark for utils/minne.py")
+    parser.add_argument("--størrelser", default="10000", help="Kommaseparert liste, f.eks 10000,100000,1000000")
+    parser.add_argument("--spørringer", type=int, default=200, help="Antall hent()/søk_i_kilde()-kall per størrelse")
+    parser.add_argument("--embedding", choices=["modell", "hash"], default="modell",
+                        help="'modell' = ekte MiniLM (realistisk), 'hash' = rask stand-in for store korpus")
+    parser.add_argument("--frø", type=int, default=42)
+    parser.add_argument("--ut", help="Skriv JSON hit i tillegg til stdout")
+    parser.add_argument("--intern", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.intern is not None:
+        resultat = kjør_én(args.intern, args.spørringer, args.embedding, args.frø)
+        print("RESULTAT " + json.dumps(resultat, ensure_ascii=False))
+        return
+
+    resultater = []
+    for n in [int(x) for x in args.størrelser.split(",") if x.strip()]:
+        print(f"⏱️ Kjører benchmark med {n} meldinger...", file=sys.stderr)
+        prosess = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--intern", str(n),
+             "--spørringer", str(args.spørringer), "--embedding", args.embedding, "--frø", str(args.frø)],
+            capture_output=True, text=True
+        )
+        linje = next((l for l in prosess.stdout.splitlines() if l.startswith("RESULTAT ")), None)
+        if prosess.returncode != 0 or not linje:
+            print(f"❌ Kjøring med {n} feilet:\n{prosess.stderr[-2000:]}", file=sys.stderr)
+            resultater.append({"n": n, "feil": prosess.stderr[-500:]})
+            continue
+        resultater.append(json.loads(linje[len("RESULTAT "):]))
+
+    rapport = {
+        "meta": {
+            "git": git_versjon(),
+            "tidspunkt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "plattform": platform.platform(),
+            "spørringer": args.spørringer,
+            "embedding": args.embedding,
+            "frø": args.frø
+        },
+        "resultater": resultater
+    }
+    tekst = json.dumps(rapport, ensure_ascii=False, indent=2)
+    print(tekst)
+    if args.ut:
+        with open(args.ut, "w", encoding="utf-8") as f:
+            f.write(tekst)
+
+    ugyldige = [r["n"] for r in resultater if r.get("skriv", {}).get("forkastet")]
+    if ugyldige:
+        print(f"❌ Skrive-køen forkastet minner ved n={ugyldige}. Skrivetallene er ikke gyldige.", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,27 @@
 import discord
+import io
 import time
 import asyncio
-import ollama
 import datetime
-import chromadb
 import os
 import subprocess
 from discord.ext import commands
 # Endret import: Bruker nå den nye minne-modulen
-from utils.minne import lagre 
+from utils.minne import alagre, aminne_statistikk, abygg_nøkkelindeks, amigrer_til_shards, alle_minnesamlinger, atøm_minnekø, aglem_ventende
+from utils import fulltekst
+from utils.chroma import samling, chroma_status
+from utils.db_handler import get_latest_telemetri, get_ai_stats, get_user_telemetri, delete_user_telemetri
+from utils.ai_logg import prometheus_tekst
+from utils import semantisk_cache
+from utils.semantisk_cache import semantisk_statistikk
+from utils.lagring import lagring_status
+from utils.ai_motor import ollama_generate, ask_gemini, llm_status, prometheus_ekstra, chat_økt_status
 
 # --- KONFIGURASJON ---
 CATEGORY_NAME = "🤖 Bot Kanaler"
 ADMIN_CHANNEL = "chat-commands"
 LOG_CHANNEL = "albert-logs"
 
-# Database-kobling (Oppdatert til Docker Server)
-CHROMA_HOST = "localhost"
-CHROMA_PORT = 8081
-
 # Kanaler som skal være SYNLIGE for alle fra start
 PUBLIC_CHANNELS = ["meme", "generelt-prat"]
 
@@ -29,18 +32,10 @@ class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         
-        # Koble til ChromaDB Server
-        print(f"[Admin] 🔌 Kobler til ChromaDB på port {CHROMA_PORT}...")
-        try:
-            self.chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
-            
-            # Henter/Lager samlinger (Sikrer at de eksisterer så vi unngår feilmeldinger)
-            self.log_collection = self.chroma_client.get_or_create_collection(name="system_logs")
-            self.mem_collection = self.chroma_client.get_or_create_collection(name="discord_memory")
-            self.news_collection = self.chroma_client.get_or_create_collection(name="news_articles")
-            
-        except Exception as e:
-            print(f"❌ [Admin] KRITISK: Kunne ikke koble til databasen: {e}")
+        # Samlinger fra den felles ChromaDB-klienten (kobler til ved første bruk)
+        self.log_collection = samling("system_logs")
+        self.mem_collection = samling("discord_memory")
+        self.news_collection = samling("news_articles")
 
     async def cog_check(self, ctx):
         # Tillat !meg, !slett_meg og !husk for alle, sjekk admin for resten
@@ -84,6 +79,11 @@ class Admin(commands.Cog):
                 "`!reload_all` - Oppdaterer all kode i alle moduler.\n"
                 "`!test_ai` - Sjekker kontakt med lokale og eksterne AI-modeller.\n"
                 "`!logg [timer]` - Henter systemlogger fra ChromaDB.\n"
+                "`!minne_stats` - Treffrate for minne-cache, svar-cache og skrive-kø.\n"
+                "`!telemetri [kategori]` - Siste kostnads-/ytelseslogger.\n"
+                "`!ai_stats [timer|prom]` - Kall, tokens, latens og kostnad per AI-modell.\n"
+                "`!bygg_søkeindeks` - Bygger nøkkelord-indeksen for minnet på nytt.\n"
+                "`!migrer_minne` - Flytter gammelt felles minne over i egne samlinger per server.\n"
                 "`!meg` - Få en fil med alt boten vet om deg (DM).\n"
                 "`!husk [info]` - Lagre personlig info i mitt minne.\n"
                 "`!slett_meg` - Sletter alle dine data fra boten."
@@ -217,18 +217,12 @@ class Admin(commands.Cog):
         status_msg = await ctx.send("🔍 **Starter AI-diagnose...**")
         local_start = time.time()
         try:
-            await asyncio.to_thread(
-                ollama.chat, 
-                model="command-r", 
-                messages=[{'role': 'user', 'content': 'ping'}],
-                options={"num_predict": 5}
-            )
+            await ollama_generate("command-r", "ping", options={"num_predict": 5})
             local_dur = round(time.time() - local_start, 2)
             local_status = f"✅ **Lokal (Command-R):** OK ({local_dur}s)"
         except Exception as e:
             local_status = f"❌ **Lokal (Command-R):** Feilet ({e})"
 
-        from utils.ai_motor import ask_gemini
         gemini_start = time.time()
         try:
             await ask_gemini("Svar bare 'pong'")
@@ -237,7 +231,18 @@ class Admin(commands.Cog):
         except Exception as e:
             gemini_status = f"❌ **Sky (Gemini):** Feilet ({e})"
 
-        await status_msg.edit(content=f"### 🧠 AI Diagnose-rapport\n{local_status}\n{gemini_status}")
+        kø = llm_status()
+        klasser = " | ".join(f"{navn}: {k['i_kø']} i kø, snitt {k['snitt_ventetid_s']}s" for navn, k in kø["klasser"].items())
+        res = kø["residens"]
+        økter = chat_økt_status()
+        kø_status = (
+            f"🚦 **Lokal kø:** {kø['aktive']}/{kø['samtidige']} aktive (maks kø {kø['maks_kø']})\n{klasser}\n"
+            f"📦 **Lastet modell:** {res['lastet'] or 'ukjent'} | {res['bytter']} bytter, {res['lastetid_s']}s lasting, {res['forvarminger']} forvarminger\n"
+            f"💬 **Chat-økter:** {økter['økter']} aktive ({økter['historikk_tokens']} tokens) | "
+            f"snitt {økter['snitt_evaluert']} evaluerte prompt-tokens mot {økter['snitt_historikk']} i historikk"
+        )
+
+        await status_msg.edit(content=f"### 🧠 AI Diagnose-rapport\n{local_status}\n{gemini_status}\n{kø_status}")
 
     @commands.command(name="logg")
     async def logg(self, ctx, timer: int = 24):
@@ -260,6 +265,94 @@ class Admin(commands.Cog):
         except Exception as e:
             await ctx.send(f"❌ Kunne ikke hente logg: {e}")
 
+    @commands.command(name="minne_stats")
+    async def minne_stats(self, ctx):
+        """Viser treffrate for minne-cachen og lengden på skrive-køen."""
+        stats = await aminne_statistikk()
+        db = chroma_status()
+        c = stats["hent_cache"]
+        e = stats["embedding"]
+        sc = semantisk_statistikk()
+        sq = lagring_status()
+        svar = (
+            "### 🧠 Minne-statistikk\n"
+            f"**ChromaDB:** `{db['tilstand']}` (feil på rad: `{db['feil_på_rad']}`, avvist: `{db['avvist']}`)\n"
+            f"**Hent-cache:** `{c['størrelse']}/{c['maks']}` oppslag (TTL `{c['ttl']}s`)\n"
+            f" ├ Treff: `{c['treff']}` | Bom: `{c['bom']}` | Treffrate: `{c['treffrate']}%`\n"
+            f" └ Utkastet: `{c['utkastet']}` | Invalidert: `{c['invalidert']}`\n"
+            f"**Skrive-kø:** `{stats['skrive_kø']}` minner venter (forkastet ved full kø: `{stats['forkastet']}`)\n"
+            f"**Embedding-cache:** `{e['treff']}` treff / `{e['bom']}` utregnet (`{e['treffrate']}%`, {e['modell']})\n"
+            f"**Semantisk svar-cache:** `{sc['størrelse']}` svar i `{sc['personaer']}` kanaler | Treff: `{sc['treff']}` | Bom: `{sc['bom']}` "
+            f"(`{sc['treffrate']}%`, terskel `{sc['terskel']}`, invalidert `{sc['invalidert']}`)\n"
+            f"**Nøkkelord-indeks:** `{stats['nøkkelindeks']}` dokumenter\n"
+            f"**Lokal journal:** `{stats['journal']}` poster venter på ChromaDB\n"
+            f"**SQLite:** `{sq['i_kø']}` skrivinger i kø | `{sq['jobber']}` skrevet i `{sq['transaksjoner']}` commits (snitt `{sq['snitt_batch']}`) | `{sq['lesinger']}` lesinger | feil: `{sq['feil']}`"
+        )
+        await ctx.send(svar)
+
+    @commands.command(name="bygg_søkeindeks")
+    async def bygg_søkeindeks(self, ctx):
+        """Fyller FTS-indeksen fra alt som ligger i discord_memory (for minner lagret før hybrid-søk)."""
+        status = await ctx.send("🔎 Bygger nøkkelord-indeks fra minnet...")
+        try:
+            antall = await abygg_nøkkelindeks()
+            await status.edit(content=f"✅ Nøkkelord-indeks bygget: `{antall}` dokumenter.")
+        except Exception as e:
+            await status.edit(content=f"❌ Kunne ikke bygge indeksen: {e}")
+
+    @commands.command(name="migrer_minne")
+    async def migrer_minne(self, ctx):
+        """Engangsjobb: flytter discord_memory over i discord_memory_<server> / _GLOBAL."""
+        status = await ctx.send("📦 Migrerer minne til egne samlinger per server...")
+        try:
+            antall = await amigrer_til_shards()
+            await status.edit(content=f"✅ Migrering ferdig: `{antall}` minner flyttet.")
+        except Exception as e:
+            await status.edit(content=f"❌ Migrering stoppet (kan kjøres på nytt): {e}")
+
+    @commands.command(name="telemetri")
+    async def telemetri(self, ctx, kategori: str = None):
+        """Viser siste telemetri-poster (Kostnad, Performance osv.) fra SQLite."""
+        rader = await get_latest_telemetri(kategori, limit=15)
+        if not rader:
+            return await ctx.send("Ingen telemetri funnet.")
+        svar = f"### 📈 Telemetri{f' ({kategori})' if kategori else ''}\n"
+        for ts, kat, bruker, tekst in rader:
+            svar += f"* `{ts[:16]}` [{kat}] {bruker}: {tekst}\n"
+        await ctx.send(svar[:2000])
+
+    @commands.command(name="ai_stats")
+    async def ai_stats(self, ctx, timer: str = "24"):
+        """Oppsummerer AI-kall (tokens, latens, kostnad) siste x timer. `!ai_stats prom` gir Prometheus-tekst."""
+        if timer == "prom":
+            tekst = prometheus_tekst() + prometheus_ekstra()
+            return await ctx.send(file=discord.File(io.BytesIO(tekst.encode("utf-8")), filename="ai_metrics.prom"))
+        try:
+            timer = int(timer)
+        except ValueError:
+            return await ctx.send("Bruk: `!ai_stats [timer]` eller `!ai_stats prom`.")
+
+        per_modell, per_cog = await get_ai_stats(timer)
+        if not per_modell:
+            return await ctx.send(f"Ingen AI-kall logget siste {timer} timer.")
+
+        total_kostnad = sum(r[9] or 0 for r in per_modell)
+        svar = f"### 🤖 AI-bruk siste {timer} timer (≈ ${total_kostnad:.4f})\n"
+        for backend, modell, kall, feil, snitt_ms, maks_ms, ttft_ms, inn, ut, kostnad, tps in per_modell:
+            svar += (
+                f"**{modell}** ({backend}): `{kall}` kall, `{feil or 0}` feil, "
+                f"snitt `{(snitt_ms or 0) / 1000:.1f}s` (maks `{(maks_ms or 0) / 1000:.1f}s`)"
+                + (f", første token `{ttft_ms / 1000:.1f}s`" if ttft_ms else "")
+                + f", tokens `{inn or 0}`/`{ut or 0}`"
+                + (f", `{tps:.1f}` tok/s" if tps else "")
+                + (f", `${kostnad:.4f}`" if kostnad else "")
+                + "\n"
+            )
+        svar += "\n**Mest brukt av:**\n"
+        for cog, kommando, kall, kostnad, snitt_ms in per_cog:
+            svar += f"* `{cog}.{kommando}`: {kall} kall, snitt {(snitt_ms or 0) / 1000:.1f}s" + (f", ${kostnad:.4f}" if kostnad else "") + "\n"
+        await ctx.send(svar[:2000])
+
     # --- BRUKER-DATA KOMMANDOER ---
 
     @commands.command(name="husk")
@@ -267,7 +360,7 @@ class Admin(commands.Cog):
         """Lar brukeren lagre informasjon om seg selv i Alberts minne."""
         try:
             # OPPDATERT: Bruker den nye lagre()-funksjonen riktig
-            lagre(
+            await alagre(
                 tekst=info,
                 user=ctx.author.name,
                 guild_id=ctx.guild.id,
@@ -280,15 +373,43 @@ class Admin(commands.Cog):
         except Exception as e:
             await ctx.send(f"❌ Kunne ikke lagre minne: {e}")
 
+    async def _minnesamlinger(self):
+        """(shard-samlinger, chroma_nede). Listingen går mot serveren, så den feiler når bryteren er åpen."""
+        try:
+            return await asyncio.to_thread(alle_minnesamlinger), False
+        except Exception as e:
+            print(f"⚠️ Kunne ikke liste minnesamlinger: {e}")
+            return [], True
+
+    @staticmethod
+    def _finn_bruker(coll, user_name):
+        """
+        {id: (dokument, metadata)} for alt i samlingen som er knyttet til brukeren. Blokkerende.
+        Filtreres på serveren (metadata user, eller navnet i teksten) i stedet for å hente hele samlingen.
+        """
+        varianter = list(dict.fromkeys([user_name, user_name.lower(), user_name.capitalize()]))
+        tekstfilter = {"$or": [{"$contains": v} for v in varianter]} if len(varianter) > 1 else {"$contains": user_name}
+        funnet = {}
+        for filter in ({"where": {"user": user_name}}, {"where_document": tekstfilter}):
+            res = coll.get(include=["documents", "metadatas"], **filter)
+            for i, doc_id in enumerate(res['ids']):
+                doc, meta = res['documents'][i] or "", res['metadatas'][i] or {}
+                # Samme regel som før: navnet i teksten eller i en metadata-verdi
+                if user_name.lower() in doc.lower() or any(user_name.lower() in str(v).lower() for v in meta.values()):
+                    funnet[doc_id] = (doc, meta)
+        return funnet
+
     @commands.command(name="meg")
     async def meg(self, ctx):
         """Sender en .txt fil med alt boten vet om brukeren på DM."""
         user_name = ctx.author.name
         await ctx.message.add_reaction("📁")
-        
+
+        shards, chroma_nede = await self._minnesamlinger()
         # Sjekker nå i de riktige nye samlingene
         collections = {
             "discord_memory": self.mem_collection,
+            **{s.name: s for s in shards},
             "system_logs": self.log_collection,
             "news_articles": self.news_collection
         }
@@ -296,17 +417,23 @@ class Admin(commands.Cog):
         
         for coll_name, coll in collections.items():
             try:
-                res = coll.get()
-                for i in range(len(res['ids'])):
-                    doc = res['documents'][i]
-                    meta = res['metadatas'][i]
-                    # Enkelt søk etter brukernavn i tekst eller metadata
-                    if user_name.lower() in doc.lower() or any(user_name.lower() in str(v).lower() for v in meta.values()):
-                        all_found.append(f"[{coll_name}] {doc} | Meta: {meta}")
+                funnet = await asyncio.to_thread(self._finn_bruker, coll, user_name)
+                all_found += [f"[{coll_name}] {doc} | Meta: {meta}" for doc, meta in funnet.values()]
             except: continue
 
+        # Telemetri (terningkast, memes, kostnader osv.) ligger i SQLite, ikke i Chroma
+        try:
+            for ts, kategori, kilde, user, guild_id, channel_id, tekst in await get_user_telemetri(user_name):
+                meta = {"timestamp": ts, "kategori": kategori, "kilde": kilde, "user": user, "guild_id": guild_id, "channel_id": channel_id}
+                all_found.append(f"[telemetri] {tekst} | Meta: {meta}")
+        except Exception as e:
+            print(f"⚠️ Kunne ikke hente telemetri for {user_name}: {e}")
+
         if not all_found:
-            await ctx.send(f"Fant ingen lagrede data om deg, {ctx.author.display_name}.")
+            if chroma_nede:
+                await ctx.send("⚠️ Minne-serveren svarer ikke akkurat nå. Prøv `!meg` igjen om litt.")
+            else:
+                await ctx.send(f"Fant ingen lagrede data om deg, {ctx.author.display_name}.")
             return
 
         file_path = f"data_{user_name}.txt"
@@ -315,7 +442,8 @@ class Admin(commands.Cog):
         
         try:
             await ctx.author.send(content="Her er dine data:", file=discord.File(file_path))
-            await ctx.send(f"✅ Sendt på DM til {ctx.author.mention}")
+            await ctx.send(f"✅ Sendt på DM til {ctx.author.mention}"
+                           + (" (minne-serveren svarte ikke, så listen kan være ufullstendig)" if chroma_nede else ""))
         except:
             await ctx.send("❌ Kunne ikke sende DM. Sjekk personverninnstillingene dine.")
         finally:
@@ -331,28 +459,42 @@ class Admin(commands.Cog):
 
         try:
             await self.bot.wait_for('message', check=check, timeout=30.0)
-            
+
+            # Det som fortsatt venter i skrive-køen må inn før vi sletter, ellers dukker det opp igjen
+            await atøm_minnekø()
+            # Poster i den lokale journalen (ChromaDB nede) ville ellers blitt spilt inn igjen senere.
+            # Tas før ChromaDB-slettingen: en avspilling som er midt i en batch, er da ferdig med den.
+            total_deleted = await aglem_ventende(user_name)
+            shards, chroma_nede = await self._minnesamlinger()
             collections = {
                 "discord_memory": self.mem_collection,
+                **{s.name: s for s in shards},
                 "system_logs": self.log_collection,
                 "news_articles": self.news_collection
             }
-            total_deleted = 0
-            
             for coll_name, coll in collections.items():
                 try:
-                    res = coll.get()
-                    to_delete = []
-                    for i in range(len(res['ids'])):
-                        if user_name.lower() in res['documents'][i].lower() or any(user_name.lower() in str(v).lower() for v in res['metadatas'][i].values()):
-                            to_delete.append(res['ids'][i])
-                    
+                    to_delete = list(await asyncio.to_thread(self._finn_bruker, coll, user_name))
                     if to_delete:
-                        coll.delete(ids=to_delete)
+                        await asyncio.to_thread(coll.delete, ids=to_delete)
+                        if coll_name.startswith("discord_memory"):
+                            await asyncio.to_thread(fulltekst.slett, to_delete)
                         total_deleted += len(to_delete)
                 except: continue
 
-            await ctx.send(f"🗑️ Sletting fullført. Fjernet {total_deleted} rader knyttet til deg.")
+            try:
+                total_deleted += await delete_user_telemetri(user_name)
+            except Exception as e:
+                print(f"⚠️ Kunne ikke slette telemetri for {user_name}: {e}")
+
+            # Svar-cachen husker ikke hvem som spurte, så vi glemmer kanalene i alle servere brukeren er i
+            for guild in {ctx.guild, *getattr(ctx.author, "mutual_guilds", [])} - {None}:
+                semantisk_cache.glem(guild_id=guild.id)
+
+            if chroma_nede:
+                await ctx.send(f"⚠️ Minne-serveren svarer ikke, så bare {total_deleted} rader ble fjernet. Kjør `!slett_meg` igjen senere.")
+            else:
+                await ctx.send(f"🗑️ Sletting fullført. Fjernet {total_deleted} rader knyttet til deg.")
         except asyncio.TimeoutError:
             await ctx.send("Sletting avbrutt.")
 
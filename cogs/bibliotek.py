@@ -3,8 +3,9 @@ import os
 import asyncio
 from discord.ext import commands
 from utils.pdf_tools import extract_text_from_pdf, save_temp_pdf
-from utils.minne import lagre, søk_i_kilde
-from utils.ai_motor import ask_mistral
+from utils.minne import alagre, asøk_i_kilde
+from utils.ai_motor import astream_mistral
+from utils.visning import vis_strøm
 
 BOOKS_DIR = "./data/boker"
 
@@ -56,7 +57,7 @@ class Bibliotek(commands.Cog):
             # 3. Lagre i ChromaDB (Nå med server-isolering)
             for i, bit in enumerate(biter):
                 # VIKTIG: Bruker den nye lagre()-syntaksen
-                lagre(
+                await alagre(
                     tekst=bit, 
                     user="Bibliotekar", 
                     guild_id=ctx.guild.id, 
@@ -107,7 +108,7 @@ class Bibliotek(commands.Cog):
     async def bok(self, ctx, filnavn: str, *, spørsmål: str):
         async with ctx.typing():
             # Søk i databasen (Nå med server-isolering)
-            funn = søk_i_kilde(spørsmål, filnavn, guild_id=ctx.guild.id, antall=6)
+            funn = await asøk_i_kilde(spørsmål, filnavn, guild_id=ctx.guild.id, antall=6)
             
             if not funn:
                 await ctx.send(f"Fant ingen svar i **{filnavn}**. (Husk nøyaktig filnavn).")
@@ -122,8 +123,11 @@ class Bibliotek(commands.Cog):
                 "Les tabellene nøye for å finne svaret. Svar KUN basert på teksten."
             )
             
-            svar = await ask_mistral(spørsmål, context=[kontekst], system_prompt=system)
-            await ctx.send(f"📘 **{filnavn}:**\n{svar}")
+            await vis_strøm(
+                ctx.channel,
+                astream_mistral(spørsmål, context=[kontekst], system_prompt=system),
+                overskrift=f"📘 **{filnavn}:**\n"
+            )
 
 async def setup(bot):
     await bot.add_cog(Bibliotek(bot))
\ No newline at end of file
@@ -3,7 +3,7 @@ import os
 import asyncio
 from discord.ext import commands
 import re
-from utils.minne import lagre
+from utils.minne import alagre
 
 # --- KONFIGURASJON ---
 TEMP_DIR = "./data/temp_vods"
@@ -149,7 +149,7 @@ class Clipper(commands.Cog):
 
         if created_files:
             # RETTET: Bruker navngitte argumenter for å treffe riktig i den nye minne.py
-            lagre(
+            await alagre(
                 tekst=f"Genererte {len(created_files)} høydepunkter fra {filnavn}", 
                 user="System", 
                 guild_id=ctx.guild.id, 
@@ -1,7 +1,6 @@
 import discord
 import feedparser
 import asyncio
-import chromadb
 import datetime
 import os
 import sqlite3
@@ -9,6 +8,8 @@ import time
 import aiohttp
 from discord.ext import commands, tasks
 from utils.db_handler import log_hardware, get_latest_hw_logs, log_ai_performance, get_latest_ai_perf
+from utils.embedding import skriv_til_samling
+from utils.chroma import samling
 
 # --- KONFIGURASJON ---
 EXTRA_FEEDS = {
@@ -16,16 +17,8 @@ EXTRA_FEEDS = {
     "Hardware_Updates": "https://www.tomshardware.com/feeds/all",
 }
 
-# VIKTIG ENDRING: Kobler til Server (Docker) i stedet for fil
-CHROMA_HOST = "localhost"
-CHROMA_PORT = 8081
-
-print(f"[DataHarvester] 🔌 Kobler til ChromaDB på port {CHROMA_PORT}...")
-# Bruker HttpClient for å unngå fil-konflikt med Docker
-CHROMA_CLIENT = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
-
-# Sikrer at samlingen finnes
-COLLECTION = CHROMA_CLIENT.get_or_create_collection(name="raw_intel")
+# Felles ChromaDB-klient (utils/chroma.py), samlingen hentes ved første bruk
+COLLECTION = samling("raw_intel")
 
 MSG_STORE_FILE = "last_lager_msg.txt"
 ADMIN_CHANNEL_ID = 1454818043841740989 
@@ -111,8 +104,8 @@ class DataHarvester(commands.Cog):
         success_rate = round((self.harvest_stats["success"] / total_attempts) * 100, 1) if total_attempts > 0 else 100.0
 
         try:
-            news_coll = CHROMA_CLIENT.get_or_create_collection(name="news_articles")
-            raw_coll = CHROMA_CLIENT.get_or_create_collection(name="raw_intel")
+            news_coll = samling("news_articles")
+            raw_coll = COLLECTION
             
             # Sjekk om collection er tom før get()
             if news_coll.count() == 0:
@@ -141,10 +134,10 @@ class DataHarvester(commands.Cog):
                         raw_sources[src] = raw_sources.get(src, 0) + 1
                         if m.get('timestamp', 0) > et_dogn_siden: raw_24h += 1
 
-            latest_logs = get_latest_hw_logs(1)
+            latest_logs = await get_latest_hw_logs(1)
             hw_info = f"`{latest_logs[0][2]}°C` | Load: `{latest_logs[0][5]}`" if latest_logs else "N/A"
             
-            ai_perf = get_latest_ai_perf()
+            ai_perf = await get_latest_ai_perf()
             ai_info = f"`{ai_perf[0]} t/s` @ `{ai_perf[1]}°C`" if ai_perf else "Ingen data"
 
             # Lagringsdata
@@ -213,15 +206,17 @@ class DataHarvester(commands.Cog):
                             if (feed.bozo and not feed.entries) or len(feed.entries) == 0:
                                 raise Exception("Parsing feilet.")
 
+                            nye_docs, nye_metas, nye_ids = [], [], []
                             for entry in feed.entries[:5]:
                                 entry_id = entry.get('id', entry.link)
-                                if entry_id not in self.seen_ids:
-                                    COLLECTION.add(
-                                        documents=[f"{entry.title}: {entry.description}"],
-                                        metadatas=[{"source": name, "timestamp": datetime.datetime.now().timestamp()}],
-                                        ids=[entry_id]
-                                    )
-                                    self.seen_ids.add(entry_id)
+                                if entry_id not in self.seen_ids and entry_id not in nye_ids:
+                                    nye_docs.append(f"{entry.title}: {entry.description}")
+                                    nye_metas.append({"source": name, "timestamp": datetime.datetime.now().timestamp()})
+                                    nye_ids.append(entry_id)
+
+                            if nye_ids:
+                                await asyncio.to_thread(skriv_til_samling, COLLECTION, nye_docs, nye_metas, nye_ids)
+                                self.seen_ids.update(nye_ids)
                             self.harvest_stats["success"] += 1
                         else:
                             self.harvest_stats["fail"] += 1
@@ -235,7 +230,7 @@ class DataHarvester(commands.Cog):
             load = os.getloadavg()[0]
             ipc_sim = round(2.5 - (load * 0.1), 2)
             stalled_sim = round(load * 5.5, 1)
-            log_hardware(temp, ipc_sim, stalled_sim, load)
+            await log_hardware(temp, ipc_sim, stalled_sim, load)
         except Exception as e: print(f"⚠️ Hardware Logger feil: {e}")
 
     @commands.command(name="lager")
@@ -51,7 +51,7 @@ class GameMonitor(commands.Cog):
             duration = int(time.time() - start_time)
             
             if duration > 10:
-                update_game_time(user_id, server_id, game_name, duration)
+                await update_game_time(user_id, server_id, game_name, duration)
 
     def format_time(self, seconds):
         """Konverterer sekunder til timer og minutter."""
@@ -63,7 +63,7 @@ class GameMonitor(commands.Cog):
 
     async def generate_scoreboard_embed(self, guild):
         """Lager det globale scoreboardet (Spill + Total tid)."""
-        data = get_server_scoreboard(guild.id)
+        data = await get_server_scoreboard(guild.id)
         
         embed = discord.Embed(
             title=f"🌍 Global Spill-topp - {guild.name}",
@@ -95,7 +95,7 @@ class GameMonitor(commands.Cog):
         """Går gjennom alle servere og oppdaterer låste meldinger."""
         await self.bot.wait_until_ready()
         for guild in self.bot.guilds:
-            msg_data = get_scoreboard_msg(guild.id)
+            msg_data = await get_scoreboard_msg(guild.id)
             if msg_data:
                 channel_id, message_id = msg_data
                 channel = guild.get_channel(int(channel_id))
@@ -110,7 +110,7 @@ class GameMonitor(commands.Cog):
     @commands.command(name="game_time")
     async def game_time(self, ctx):
         """Viser brukerens personlige topp 5 spill på denne serveren."""
-        data = get_personal_stats(ctx.author.id, ctx.guild.id)
+        data = await get_personal_stats(ctx.author.id, ctx.guild.id)
         
         if not data:
             return await ctx.send(f"❓ Jeg har ikke registrert noe spilletid på deg ennå, {ctx.author.display_name}.")
@@ -142,7 +142,7 @@ class GameMonitor(commands.Cog):
 
         embed = await self.generate_scoreboard_embed(ctx.guild)
         msg = await ctx.send(embed=embed)
-        save_scoreboard_msg(ctx.guild.id, ctx.channel.id, msg.id)
+        await save_scoreboard_msg(ctx.guild.id, ctx.channel.id, msg.id)
 
 async def setup(bot):
     await bot.add_cog(GameMonitor(bot))
\ No newline at end of file
@@ -1,12 +1,14 @@
 import discord
 import asyncio
-import chromadb
 import datetime
 import re
 from discord.ext import commands, tasks
 from collections import Counter
-from utils.ai_motor import ask_gemini
+from utils.ai_motor import ask_gemini, astream_gemini
+from utils.visning import vis_strøm
+from utils.kontekst import apakk
 from utils.gaming_harvester import GamingHarvester
+from utils.chroma import samling
 from dotenv import load_dotenv
 
 # Laster .env for sikkerhets skyld, selv om harvester/ai_motor tar seg av det meste
@@ -16,17 +18,16 @@ load_dotenv()
 harvester = GamingHarvester()
 
 # --- KONFIGURASJON ---
-CHROMA_HOST = "localhost"
-CHROMA_PORT = 8081
-
-CHROMA_CLIENT = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
-GAME_COLLECTION = CHROMA_CLIENT.get_or_create_collection(name="game_stats")
-GUIDE_COLLECTION = CHROMA_CLIENT.get_or_create_collection(name="game_guides")
+GAME_COLLECTION = samling("game_stats")
+GUIDE_COLLECTION = samling("game_guides")
 
 TIME_INCREMENT = 10 
 THRESHOLD_MINUTES = 6000 # 100 timer
 CLEANUP_DAYS = 180 
 STATUS_CHANNEL_ID = 1454801359005290558 
+GENRE_CACHE_TTL = 90 * 86400     # Et spills sjanger endrer seg ikke
+GURU_ID_CACHE_TTL = 7 * 86400    # Samme spørsmål -> samme spill
+GURU_BUDSJETT = 8000             # tokens guide-kontekst til !guru (mest relevante kilde først)
 
 class GameSpy(commands.Cog):
     def __init__(self, bot):
@@ -65,7 +66,7 @@ class GameSpy(commands.Cog):
             "Answer ONLY with the category name."
         )
         try:
-            genre = await ask_gemini(prompt)
+            genre = await ask_gemini(prompt, cache_ttl=GENRE_CACHE_TTL)
             genre = genre.strip().upper().replace(".", "")
             valid_genres = ["FPS", "RPG", "STRATEGY", "MOBA", "SPORTS", "SIMULATION", "HORROR", "OTHER"]
             if genre not in valid_genres: genre = "OTHER"
@@ -180,7 +181,7 @@ class GameSpy(commands.Cog):
                 f"If yes, return the FULL OFFICIAL game title (correct typos like 'Battlefiel' to 'Battlefield'). "
                 f"If no specific game is mentioned, return exactly: NONE"
             )
-            detected_game = await ask_gemini(identification_prompt)
+            detected_game = await ask_gemini(identification_prompt, cache_ttl=GURU_ID_CACHE_TTL)
             detected_game = detected_game.strip().replace('"', '').replace("'", "") # Rydd opp svaret
 
             print(f"[Guru] 🧠 Analyserte forespørsel: '{question}' -> Spill: '{detected_game}'")
@@ -214,7 +215,7 @@ class GameSpy(commands.Cog):
                     source = meta.get('source', 'Ukjent kilde')
                     game_tag = meta.get('game', 'Ukjent spill')
                     context_parts.append(f"[{game_tag}] KILDE {i+1} ({source}):\n{doc}")
-                context = "\n\n---\n\n".join(context_parts)
+                context = await apakk(context_parts, "gemini-2.0-flash", budsjett=GURU_BUDSJETT, skille="\n\n---\n\n", kutt_siste=True)
             else:
                 context = "Ingen spesifikke rådata funnet i biblioteket."
 
@@ -235,21 +236,15 @@ class GameSpy(commands.Cog):
                 f"3. Hvis informasjonen mangler i basen, bruk din generelle kunnskap, men nevn at dette er 'generell kunnskap' og ikke fra guidene."
             )
             
-            answer = await ask_gemini(system_instruction)
-            
-            # 5. SEND SVAR (Splitter ved lange meldinger)
-            if len(answer) > 2000:
-                parts = [answer[i:i+1900] for i in range(0, len(answer), 1900)]
-                for part in parts: await ctx.send(part)
-            else:
-                await ctx.send(answer)
+            # 5. SEND SVAR (Strømmes inn, splitter ved lange meldinger)
+            await vis_strøm(ctx.channel, astream_gemini(system_instruction))
 
     @commands.command(name="guru_test")
     @commands.has_permissions(administrator=True)
     async def guru_test(self, ctx, *, spillnavn: str):
         """Manuelt trigger dyp innhøsting av guider."""
         # Bruk harvesterens autokorrektur først for å sikre riktig navn
-        corrected_name = harvester.autocorrect_game_name(spillnavn)
+        corrected_name = await harvester.autocorrect_game_name(spillnavn)
         
         status = await ctx.send(f"🤿 Albert starter dyp-søking (Deep Dive) etter **{corrected_name}**...")
         
@@ -5,15 +5,19 @@ import random
 import asyncio
 import time
 import math
+from contextlib import aclosing
 import os
-import chromadb
-from ollama import AsyncClient
 from datetime import datetime, time as dtime
 from discord.ext import commands, tasks
-from utils.ai_motor import ask_mistral, ask_gemini, ask_openai
-from utils.minne import hent, lagre
+from utils.ai_motor import ask_mistral, ask_gemini, ask_openai, ollama_chat_stream, ollama_chat_økt, chat_økter, husk_i_økt, astream_gemini
+from utils import semantisk_cache
+from utils.visning import vis_strøm
+from utils.minne import ahent, alagre, atøm_minnekø
+from utils.chroma import samling
 from utils.database import add_event, get_events
 from utils.db_handler import log_ai_performance
+from utils.ai_logg import sett_kaller
+from utils.kontekst import apakk
 from utils.voice_engine import generate_voice 
 
 # --- KONFIGURASJON ---
@@ -22,11 +26,9 @@ CHAN_GPT      = "chatgpt"
 CHAN_KODE     = "kode-hjelp"
 CHAN_MAT      = "matlagingstips"
 CHAN_RPG      = "rpg-eventyr" 
+PREFIKS_AI    = "ai-"  # Personlige kanaler fra Welcome (ai-<brukernavn>)
 CMD_CHANNEL   = "chat-commands"
-
-# DATABASE KOBLING (Server-modus)
-CHROMA_HOST = "localhost"
-CHROMA_PORT = 8081
+VEDLEGG_BUDSJETT = 4000  # tokens (command-r) til vedlagte filer
 
 class HovedChat(commands.Cog):
     def __init__(self, bot):
@@ -37,21 +39,19 @@ class HovedChat(commands.Cog):
         if not os.path.exists("./data"): 
             os.makedirs("./data")
         
-        # Koble til ChromaDB Server
-        print(f"[HovedChat] 🔌 Kobler til ChromaDB på port {CHROMA_PORT}...")
-        self.chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
-        
-        # Hent samlinger
-        self.log_collection = self.chroma_client.get_or_create_collection(name="system_logs")
-        self.news_collection = self.chroma_client.get_or_create_collection(name="news_articles")
+        # Hent samlinger (felles ChromaDB-klient, kobler til ved første bruk)
+        self.log_collection = samling("system_logs")
+        self.news_collection = samling("news_articles")
         
         # Start tidsstyrte oppgaver
         self.daily_hype.start()
         self.daglig_meny_sjekk.start()
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.daily_hype.cancel()
         self.daglig_meny_sjekk.cancel()
+        # Skriv ut ventende chatlogg før modulen forsvinner (i trådpoolen, ikke på loopen)
+        await atøm_minnekø()
 
     # --- HJELPEFUNKSJONER ---
 
@@ -75,7 +75,7 @@ class HovedChat(commands.Cog):
     async def les_vedlegg(self, message):
         """Leser innholdet av tekstfiler lagt ved meldingen."""
         if not message.attachments: return ""
-        tekst_innhold = ""
+        filer = []
         for vedlegg in message.attachments:
             tillatte_typer = ('text', 'json', 'javascript', 'python', 'xml', 'html')
             er_tekst = vedlegg.content_type and any(t in vedlegg.content_type for t in tillatte_typer)
@@ -83,10 +83,11 @@ class HovedChat(commands.Cog):
                 try:
                     fil_bytes = await vedlegg.read()
                     innhold = fil_bytes.decode('utf-8')
-                    tekst_innhold += f"\n\n--- FIL '{vedlegg.filename}' ---\n{innhold}\n"
+                    filer.append(f"\n\n--- FIL '{vedlegg.filename}' ---\n{innhold}\n")
                 except Exception as e: 
                     print(f"Kunne ikke lese vedlegg {vedlegg.filename}: {e}")
-        return tekst_innhold
+        # Store filer kuttes til budsjettet i stedet for å sprenge konteksten
+        return await apakk(filer, "command-r", budsjett=VEDLEGG_BUDSJETT, skille="", kutt_siste=True)
 
     async def send_smart(self, channel, text):
         """Sender lange meldinger i biter på 1900 tegn."""
@@ -124,9 +125,28 @@ class HovedChat(commands.Cog):
                 if ctx.guild.voice_client:
                     await ctx.guild.voice_client.disconnect()
 
-    async def stream_ai_response(self, channel, prompt, system_prompt, status_msg=None, model="command-r", bot_name="Albert", target_len=1800):
-        """Strømmer svar fra lokal AI (Ollama) til Discord."""
+    async def stream_ai_response(self, channel, prompt, system_prompt, status_msg=None, model="command-r", bot_name="Albert", target_len=1800, økt=False, spørsmål=None):
+        """
+        Strømmer svar fra lokal AI (Ollama) til Discord.
+        økt=True: fortsetter samtalen i kanalen (historikk med fast prefiks, så Ollama gjenbruker KV-cachen).
+        spørsmål: selve spørsmålet (uten vedlegg). Slår på den semantiske svar-cachen for kanalen.
+        """
         base_status = status_msg.content if status_msg else ""
+
+        # Svar som avhenger av tidligere turer i samtalen kan ikke gjenbrukes, så cachen brukes
+        # bare når spørsmålet står på egne ben (ingen økt, eller økten starter på nytt)
+        persona = f"{channel.guild.id}/{channel.name}" if channel.guild else f"dm/{channel.id}"
+        frittstående = spørsmål and (not økt or chat_økter.antall_turer(channel.id, model, system_prompt) == 0)
+        if frittstående:
+            treff = await semantisk_cache.afinn(persona, model, system_prompt, spørsmål)
+            if treff:
+                svar, likhet = treff
+                if økt:
+                    await husk_i_økt(channel.id, model, system_prompt, prompt, svar)
+                if status_msg:
+                    await status_msg.edit(content=base_status + f"\n♻️ **Lignende spørsmål besvart nylig ({round(likhet * 100)}% likt).**")
+                await self.send_smart(channel, svar)
+                return svar
         if status_msg:
             await status_msg.edit(content=base_status + f"\n🤖 **Starter generering ({model}).**")
         
@@ -136,36 +156,40 @@ class HovedChat(commands.Cog):
         last_ui_update = 0
 
         try:
-            async for part in await AsyncClient(timeout=None).chat(
-                model=model,
-                messages=[
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': prompt},
-                ],
-                stream=True,
-                options={"num_thread": 8}
-            ):
-                content = part['message']['content']
-                full_text += content
+            if økt:
+                strøm = ollama_chat_økt(channel.id, model, system_prompt, prompt, options={"num_thread": 8})
+            else:
+                strøm = ollama_chat_stream(
+                    model,
+                    [
+                        {'role': 'system', 'content': system_prompt},
+                        {'role': 'user', 'content': prompt},
+                    ],
+                    options={"num_thread": 8}
+                )
+            # Feiler Discord-kallet underveis, lukkes strømmen straks så LLM-køplassen slippes
+            async with aclosing(strøm):
+                async for content in strøm:
+                    full_text += content
                 
-                now = time.time()
-                if now - last_ui_update > 4:
-                    elapsed = now - start_gen
-                    words = len(full_text.split())
-                    wps = round(words / elapsed, 2) if elapsed > 0 else 0
-                    prosent = min(int((len(full_text) / target_len) * 100), 100)
-                    bar = "█" * (prosent // 10) + "░" * (10 - (prosent // 10))
+                    now = time.time()
+                    if now - last_ui_update > 4:
+                        elapsed = now - start_gen
+                        words = len(full_text.split())
+                        wps = round(words / elapsed, 2) if elapsed > 0 else 0
+                        prosent = min(int((len(full_text) / target_len) * 100), 100)
+                        bar = "█" * (prosent // 10) + "░" * (10 - (prosent // 10))
                     
-                    if status_msg:
-                        await status_msg.edit(content=base_status + f"\n🤖 **Fremdrift: `{bar}` {prosent}%**\n⚡ Hastighet: `{wps} ord/sek`")
+                        if status_msg:
+                            await status_msg.edit(content=base_status + f"\n🤖 **Fremdrift: `{bar}` {prosent}%**\n⚡ Hastighet: `{wps} ord/sek`")
                     
-                    preview = f"✍️ **{bot_name} skriver...**\n\n{full_text}"
-                    if not display_msg: 
-                        display_msg = await channel.send(preview)
-                    else:
-                        if len(preview) < 2000: 
-                            await display_msg.edit(content=preview)
-                    last_ui_update = now
+                        preview = f"✍️ **{bot_name} skriver...**\n\n{full_text}"
+                        if not display_msg: 
+                            display_msg = await channel.send(preview)
+                        else:
+                            if len(preview) < 2000: 
+                                await display_msg.edit(content=preview)
+                        last_ui_update = now
 
             duration = round(time.time() - start_gen, 2)
             final_wps = round(len(full_text.split()) / duration, 2) if duration > 0 else 0
@@ -173,12 +197,15 @@ class HovedChat(commands.Cog):
             try:
                 with open("/sys/class/thermal/thermal_zone0/temp", "r") as f:
                     curr_temp = int(f.read().strip()) / 1000
-                log_ai_performance(final_wps, round(curr_temp, 1), os.getloadavg()[0])
+                await log_ai_performance(final_wps, round(curr_temp, 1), os.getloadavg()[0])
             except: pass
 
             if status_msg:
                 await status_msg.edit(content=base_status + f"\n✅ **Ferdig på {duration}s.**")
 
+            if frittstående:
+                await semantisk_cache.alagre(persona, model, system_prompt, spørsmål, full_text)
+
             if display_msg:
                 if len(full_text) < 2000: await display_msg.edit(content=full_text)
                 else:
@@ -327,15 +354,27 @@ class HovedChat(commands.Cog):
             context_str = "\n".join(reversed(context_list))
             await status_msg.edit(content="🧠 **Gemini tenker...**")
             
-            svar = await ask_gemini(prompt, context_str)
-            await status_msg.delete()
-            
             header = f"✨ **Gemini-svar til {ctx.author.display_name}:**\n"
-            await ctx.reply(header + svar)
+            strøm = astream_gemini(prompt, context_str)
+            første = await anext(strøm, "")  # Status-meldingen står til første bit er her
+
+            async def resten():
+                yield første
+                async with aclosing(strøm):
+                    async for bit in strøm: yield bit
+
+            await status_msg.delete()
+            await vis_strøm(ctx.channel, resten(), overskrift=header, svar_til=ctx.message)
             
         except Exception as e:
             await status_msg.edit(content="❌ Kunne ikke kontakte Gemini.")
 
+    @commands.command(name="glem_samtale")
+    async def glem_samtale(self, ctx):
+        """Starter samtalen i denne kanalen på nytt (RPG, kode-hjelp og ai-kanaler)."""
+        chat_økter.glem(ctx.channel.id)
+        await ctx.send("🧹 Samtalen er nullstilt. Jeg husker ikke noe av det vi sa her.")
+
     @commands.command(name="lagre")
     @commands.has_permissions(administrator=True)
     async def lagre_kommando(self, ctx):
@@ -362,7 +401,7 @@ class HovedChat(commands.Cog):
                 leksjon = f"SPØRSMÅL: {prompt_text}\nSVAR: {gemini_svar}"
                 
                 # OPPDATERT: Bruker ny lagre-syntaks
-                lagre(
+                await alagre(
                     tekst=leksjon, 
                     user=ctx.author.name, 
                     guild_id=ctx.guild.id, 
@@ -385,7 +424,7 @@ class HovedChat(commands.Cog):
         
         # OPPDATERT: Bruker ny lagre-syntaks
         if not message.content.startswith("!"):
-            lagre(
+            await alagre(
                 tekst=message.content, 
                 user=message.author.name, 
                 guild_id=message.guild.id, 
@@ -398,12 +437,16 @@ class HovedChat(commands.Cog):
         is_tagged = self.bot.user in message.mentions
         target_channels = [CHAN_GENERELL, CHAN_GPT, CHAN_KODE, CHAN_MAT, CHAN_RPG]
 
-        if is_tagged or channel_name in target_channels:
+        er_ai_kanal = channel_name.startswith(PREFIKS_AI) and not message.content.startswith("!")
+
+        if is_tagged or channel_name in target_channels or er_ai_kanal:
             if channel_name == CHAN_GENERELL and not is_tagged: return 
 
+            sett_kaller("HovedChat", f"chat:{channel_name}")
             async with message.channel.typing():
                 clean = message.content.replace(f"<@{self.bot.user.id}>", "").strip()
                 prompt_full = clean + await self.les_vedlegg(message)
+                spørsmål = clean if prompt_full == clean else None  # Svar på vedlegg caches ikke
                 status_msg = await message.channel.send(f"🔍 **Mottatt fra {message.author.name}...**")
                 
                 # --- RPG LOGIKK ---
@@ -416,7 +459,7 @@ class HovedChat(commands.Cog):
                         "Deretter beskriv hva som skjer."
                     )
                     
-                    svar = await self.stream_ai_response(message.channel, prompt_full, sys_prompt, status_msg)
+                    svar = await self.stream_ai_response(message.channel, prompt_full, sys_prompt, status_msg, økt=True)
                     
                     # Trekk ut stemning og tekst for lyd
                     mood = "neutral"
@@ -441,7 +484,7 @@ class HovedChat(commands.Cog):
                     kontekst_deler = []
                     
                     # OPPDATERT: Hent minne, men EKSKLUDER RPG-lore!
-                    gammel_prat = hent(
+                    gammel_prat = await ahent(
                         clean, 
                         guild_id=message.guild.id, 
                         ekskluder_kategori="RPG_LORE"
@@ -456,12 +499,28 @@ class HovedChat(commands.Cog):
                     await self.stream_ai_response(message.channel, prompt_full, sys_prompt, status_msg)
                 
                 elif channel_name == CHAN_KODE:
-                    await self.stream_ai_response(message.channel, prompt_full, "Du er en koding-ekspert.", status_msg, bot_name="Kode-Pepe")
+                    await self.stream_ai_response(message.channel, prompt_full, "Du er en koding-ekspert.", status_msg, bot_name="Kode-Pepe", økt=True, spørsmål=spørsmål)
+                elif er_ai_kanal:
+                    # Systemprompten må være lik fra gang til gang, ellers starter økten på nytt
+                    sys_prompt = f"Du er Albert, den personlige assistenten til {message.author.display_name}. Svar kort og presist."
+                    await self.stream_ai_response(message.channel, prompt_full, sys_prompt, status_msg, økt=True)
                 elif channel_name == CHAN_GPT:
-                    await self.stream_ai_response(message.channel, prompt_full, "Du er ChatGPT.", status_msg, bot_name="ChatGPT")
+                    await self.stream_ai_response(message.channel, prompt_full, "Du er ChatGPT.", status_msg, bot_name="ChatGPT", spørsmål=spørsmål)
+                elif channel_name == CHAN_MAT:
+                    # Samme semantiske cache som over, foran Gemini (og minneoppslaget)
+                    persona = f"{message.guild.id}/{channel_name}"
+                    treff = await semantisk_cache.afinn(persona, "gemini-2.0-flash", "", spørsmål) if spørsmål else None
+                    if treff:
+                        svar = treff[0]
+                    else:
+                        mem = await ahent(clean, guild_id=message.guild.id)
+                        svar = await ask_gemini(clean, mem)
+                        if spørsmål and svar and not svar.startswith("Gemini feil"):
+                            await semantisk_cache.alagre(persona, "gemini-2.0-flash", "", spørsmål, svar)
+                    await self.send_smart(message.channel, svar)
                 else: 
                     # OPPDATERT: Enkelt søk i generelt minne
-                    mem = hent(clean, guild_id=message.guild.id)
+                    mem = await ahent(clean, guild_id=message.guild.id)
                     svar = await ask_gemini(clean, mem)
                     await self.send_smart(message.channel, svar)
 
@@ -4,7 +4,7 @@ import asyncio
 from discord.ext import commands
 from pydub import AudioSegment
 from pydub.silence import split_on_silence
-from utils.minne import lagre
+from utils.minne import alagre
 
 # --- KONFIGURASJON ---
 TEMP_DIR = "./data/temp_vods"
@@ -98,7 +98,7 @@ class KlippLyd(commands.Cog):
             embed.set_footer(text="Datasettet er nå klart!")
             
             # Lagrer hendelsen i botens minne (OPPDATERT)
-            lagre(
+            await alagre(
                 tekst=f"Lyd-klipping fullført: {resultat['antall']} klipp fra {filnavn}", 
                 user="System", 
                 guild_id=ctx.guild.id, 
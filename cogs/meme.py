@@ -4,7 +4,7 @@ import random
 import datetime
 from discord.ext import commands, tasks
 # Vi legger til logging slik at meme-aktivitet vises i systemloggen
-from utils.minne import lagre
+from utils.minne import alagre
 
 # --- KONFIGURASJON ---
 MEME_CHANNEL_NAME = "memes"
@@ -117,7 +117,7 @@ class MemeManager(commands.Cog):
                     print("✅ Meme postet suksessfullt.")
                     
                     # LOGG TIL DATABASEN (NYTT)
-                    lagre(
+                    await alagre(
                         tekst=f"Postet meme: {meme['title']} (r/{meme['subreddit']})",
                         user="AutoMeme",
                         guild_id=channel.guild.id,
@@ -0,0 +1,165 @@
+import asyncio
+from datetime import datetime, timedelta, time as dtime
+from discord.ext import commands, tasks
+from utils.ai_motor import ask_mistral, num_ctx, BATCH
+from utils.kontekst import tell_tokens, del_opp
+from utils.minne import (
+    OPPBEVARING_DAGER, DIGEST_KATEGORI,
+    ahent_utløpte, aslett_ider, alagre_nå
+)
+
+# --- KONFIGURASJON ---
+KOMPAKT_MAKS_PER_KJØRING = 5000   # Maks antall rå dokumenter vi tar unna per natt
+# Dagslogger deles opp i biter som får plass i mistral sitt vindu (num_ctx) sammen med
+# instruksjonen og svaret. Ellers kutter Ollama starten av hver bit stille.
+SAMMENDRAG_MODELL = "mistral"
+SAMMENDRAG_SVAR = 768             # tokens satt av til selve sammendraget
+SYSTEM_PROMPT = "Du er en nøyaktig arkivar."
+
+class MinneVedlikehold(commands.Cog):
+    """
+    Holder discord_memory i sjakk: gammel rå-chat rulles opp til ett sammendrag
+    per kanal per dag (via lokal modell), og originalene slettes i bulk.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.kjører = False
+
+    async def cog_load(self):
+        print("[MinneVedlikehold] 🧹 Nattlig komprimering av minnet er aktiv.")
+        self.nattlig_komprimering.start()
+
+    def cog_unload(self):
+        self.nattlig_komprimering.cancel()
+
+    def kanal_navn(self, channel_id):
+        try:
+            kanal = self.bot.get_channel(int(channel_id))
+            if kanal: return f"#{kanal.name}"
+        except (TypeError, ValueError):
+            pass
+        return f"kanal {channel_id}"
+
+    @staticmethod
+    def lag_prompt(kanal, dato, bit):
+        return (
+            f"Her er chatloggen fra {kanal} den {dato}:\n{bit}\n\n"
+            "OPPGAVE: Skriv et kort sammendrag på norsk for langtidsminnet. "
+            "Få med hvem som sa hva om viktige ting, navn, avtaler, fakta og preferanser. "
+            "Dropp småprat."
+        )
+
+    def del_transkript(self, kanal, dato, linjer):
+        """Deler dagsloggen i biter (målt i tokens) som får plass i modellens vindu. Blokkerende."""
+        ramme = tell_tokens(f"System: {SYSTEM_PROMPT}\nKontekst:\n\n\nBruker: " + self.lag_prompt(kanal, dato, ""), SAMMENDRAG_MODELL)
+        budsjett = max(100, num_ctx(SAMMENDRAG_MODELL) - ramme - SAMMENDRAG_SVAR)
+        biter, nå, brukt = [], "", 0
+        for linje in linjer:
+            # En enkelt linje som er for lang (limt inn logg, kode) deles for seg
+            for del_linje in del_opp(linje, SAMMENDRAG_MODELL, budsjett - 1):
+                tokens = tell_tokens(del_linje, SAMMENDRAG_MODELL) + 1  # + linjeskift
+                if nå and brukt + tokens > budsjett:
+                    biter.append(nå)
+                    nå, brukt = "", 0
+                nå += del_linje + "\n"
+                brukt += tokens
+        if nå: biter.append(nå)
+        return biter
+
+    async def oppsummer_dag(self, kanal, dato, linjer):
+        """Returnerer sammendrag av en dags chat, eller None hvis modellen feilet."""
+        deler = []
+        # Token-tellingen kan laste tokenizeren, så den går utenfor event-loopen
+        for bit in await asyncio.to_thread(self.del_transkript, kanal, dato, linjer):
+            svar = await ask_mistral(
+                self.lag_prompt(kanal, dato, bit),
+                system_prompt=SYSTEM_PROMPT,
+                prioritet=BATCH
+            )
+            if not svar or svar.startswith(("Mistral feil", "Mistral sover")):
+                return None
+            deler.append(svar.strip())
+        return "\n".join(deler)
+
+    async def komprimer(self, kategori, dager):
+        """Komprimerer én kategori. Returnerer (antall sammendrag, antall slettet)."""
+        grense = (datetime.now() - timedelta(days=dager)).timestamp()
+        rå = await ahent_utløpte(kategori, grense, grense=KOMPAKT_MAKS_PER_KJØRING)
+        if not rå: return 0, 0
+
+        # Grupper per (server, kanal, dag)
+        grupper = {}
+        for doc_id, doc, meta in rå:
+            ts = meta.get("timestamp", 0)
+            dato = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+            nøkkel = (meta.get("guild_id"), meta.get("channel_id"), dato)
+            grupper.setdefault(nøkkel, []).append((ts, meta.get("user", "Ukjent"), doc, doc_id))
+
+        sammendrag, slett, guilds = 0, [], set()
+        for (guild_id, channel_id, dato), meldinger in grupper.items():
+            meldinger.sort()
+            kanal = self.kanal_navn(channel_id)
+            linjer = [f"[{datetime.fromtimestamp(ts).strftime('%H:%M')}] {bruker}: {doc}" for ts, bruker, doc, _ in meldinger]
+
+            digest = await self.oppsummer_dag(kanal, dato, linjer)
+            if not digest:
+                print(f"[MinneVedlikehold] ⚠️ Hoppet over {kanal} {dato} (modellen svarte ikke).")
+                continue
+
+            # Skrives direkte (ikke via skrive-køen): originalene slettes bare hvis sammendraget er lagret
+            try:
+                await alagre_nå(
+                    tekst=f"Sammendrag av {kanal} {dato} ({len(meldinger)} meldinger):\n{digest}",
+                    user="Albert",
+                    guild_id=guild_id,
+                    channel_id=channel_id,
+                    kategori=DIGEST_KATEGORI,
+                    kilde="Komprimering",
+                    timestamp=meldinger[-1][0]
+                )
+            except Exception as e:
+                print(f"[MinneVedlikehold] ⚠️ Kunne ikke lagre sammendrag for {kanal} {dato}, beholder originalene: {e}")
+                continue
+            sammendrag += 1
+            slett.extend(m[3] for m in meldinger)
+            guilds.add(guild_id)
+
+        slettet = await aslett_ider(slett, guilds) if slett else 0
+        return sammendrag, slettet
+
+    async def kjør_alle(self):
+        if self.kjører: return None
+        self.kjører = True
+        resultat = {}
+        try:
+            for kategori, dager in OPPBEVARING_DAGER.items():
+                try:
+                    resultat[kategori] = await self.komprimer(kategori, dager)
+                    print(f"[MinneVedlikehold] ✅ {kategori}: {resultat[kategori][0]} sammendrag, {resultat[kategori][1]} rådokumenter slettet.")
+                except Exception as e:
+                    print(f"[MinneVedlikehold] ❌ Feil under komprimering av {kategori}: {e}")
+        finally:
+            self.kjører = False
+        return resultat
+
+    @tasks.loop(time=dtime(hour=4, minute=15))
+    async def nattlig_komprimering(self):
+        await self.kjør_alle()
+
+    @nattlig_komprimering.before_loop
+    async def before_komprimering(self):
+        await self.bot.wait_until_ready()
+
+    @commands.command(name="komprimer_minne")
+    @commands.has_permissions(administrator=True)
+    async def komprimer_minne(self, ctx):
+        """Kjører komprimeringen av gammelt minne NÅ."""
+        status = await ctx.send("🧹 Komprimerer gammelt minne...")
+        resultat = await self.kjør_alle()
+        if resultat is None:
+            return await status.edit(content="⏳ Komprimering kjører allerede.")
+        linjer = [f"• **{k}**: `{s}` sammendrag, `{d}` slettet" for k, (s, d) in resultat.items()]
+        await status.edit(content="✅ Komprimering ferdig!\n" + ("\n".join(linjer) or "Ingenting å gjøre."))
+
+async def setup(bot):
+    await bot.add_cog(MinneVedlikehold(bot))
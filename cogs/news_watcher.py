@@ -1,6 +1,5 @@
 import discord
 import feedparser
-import chromadb
 import os
 import datetime
 import asyncio
@@ -10,10 +9,12 @@ import aiohttp
 import pytz
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
-from ollama import AsyncClient  # <--- Brukes for lokal generering
-from utils.ai_motor import ask_gemini # <--- Beholdes som backup
+from utils.ai_motor import ask_gemini, ollama_generate, BATCH # <--- Gemini beholdes som backup
 from utils.job_queue import queue_manager
 from utils.minne import lagre
+from utils.embedding import skriv_til_samling
+from utils.chroma import samling
+from utils.kontekst import apakk
 
 load_dotenv()
 
@@ -27,9 +28,10 @@ RSS_FEEDS = {
 }
 
 SUMMARY_CHANNEL_ID = 1454474141565714452
-CHROMA_PORT = 8081
 NORWAY_TZ = pytz.timezone('Europe/Oslo')
 LOCAL_MODEL = "command-r" # Modellen vi bruker lokalt
+KORT_BUDSJETT = 3500   # tokens nyhetsgrunnlag til Discord-oppsummeringen
+LANG_BUDSJETT = 6000   # tokens nyhetsgrunnlag til HTML-utgaven
 
 # Filstier
 WEBSITE_FOLDER = "/home/stianborn/min_discord_bot/prosjekt_v2"
@@ -41,9 +43,7 @@ class NewsWatcher(commands.Cog):
         self.bot = bot
         if not os.path.exists("./data"): os.makedirs("./data")
         
-        print(f"[NewsWatcher] 🔌 Kobler til ChromaDB på port {CHROMA_PORT}...")
-        self.chroma_client = chromadb.HttpClient(host='localhost', port=CHROMA_PORT)
-        self.collection = self.chroma_client.get_or_create_collection(name="news_articles")
+        self.collection = samling("news_articles")
         self.seen_titles = set() 
 
     async def cog_load(self):
@@ -63,8 +63,7 @@ class NewsWatcher(commands.Cog):
         """Hjelpefunksjon for å spørre den lokale modellen."""
         try:
             print(f"[NewsWatcher] 🧠 Albert ({LOCAL_MODEL}) tenker...")
-            response = await AsyncClient().generate(model=LOCAL_MODEL, prompt=prompt)
-            return response['response']
+            return await ollama_generate(LOCAL_MODEL, prompt, prioritet=BATCH)
         except Exception as e:
             print(f"[NewsWatcher] ⚠️ Lokal modell feilet: {e}. Bytter til backup...")
             return None
@@ -85,24 +84,27 @@ class NewsWatcher(commands.Cog):
 
                 if not feed or not hasattr(feed, 'entries'): continue
 
+                nye_docs, nye_metas, nye_ids = [], [], []
                 for entry in feed.entries:
                     url = entry.get('link')
                     title = entry.get('title', 'Ingen tittel')
                     
-                    if not url or self.collection.get(ids=[url])['ids']: continue
+                    if not url or url in nye_ids or self.collection.get(ids=[url])['ids']: continue
                     
                     title_fingerprint = title[:50].lower()
                     if title_fingerprint in self.seen_titles: continue
 
                     summary = self.clean_html(entry.get('summary', entry.get('description', '')))
                     
-                    self.collection.add(
-                        documents=[f"[{category}] {title}: {summary}"],
-                        metadatas=[{"category": category, "timestamp": datetime.datetime.now().timestamp()}],
-                        ids=[url]
-                    )
+                    nye_docs.append(f"[{category}] {title}: {summary}")
+                    nye_metas.append({"category": category, "timestamp": datetime.datetime.now().timestamp()})
+                    nye_ids.append(url)
                     self.seen_titles.add(title_fingerprint)
-                    total_new += 1
+
+                # Én bulk-skriving per feed, med cachede embeddings (utenfor event-loopen)
+                if nye_ids:
+                    await asyncio.to_thread(skriv_til_samling, self.collection, nye_docs, nye_metas, nye_ids)
+                    total_new += len(nye_ids)
             except Exception as e:
                 print(f"❌ RSS Feil ({category}): {e}")
         print(f"[NewsWatcher] 📦 Runden ferdig. Fant {total_new} nye saker.")
@@ -119,9 +121,15 @@ class NewsWatcher(commands.Cog):
             print("[NewsWatcher] ⚠️ Ingen nyheter funnet for i dag.")
             return False
 
-        # Begrenser tekstmengden litt for å ikke kvele den lokale modellen
-        # Command-R har stort vindu (128k), men vi holder det ryddig.
-        raw_text = "\n".join(results['documents'])
+        # Begrenser tekstmengden for å ikke kvele den lokale modellen (prompt-evaluering er
+        # det som tar tid). Hele saker, nyeste først, til token-budsjettet er fylt.
+        saker = sorted(
+            zip(results['documents'], results['metadatas']),
+            key=lambda s: (s[1] or {}).get("timestamp", 0)
+        )
+        saker = [doc for doc, _ in saker]
+        kort_grunnlag = await apakk(saker, LOCAL_MODEL, budsjett=KORT_BUDSJETT, fra_slutten=True)
+        lang_grunnlag = await apakk(saker, LOCAL_MODEL, budsjett=LANG_BUDSJETT, fra_slutten=True)
         
         # --- STEG 1: KORT VERSJON (DISCORD) ---
         short_prompt = (
@@ -129,7 +137,7 @@ class NewsWatcher(commands.Cog):
             f"Bruk punktorlister og emojis.\n"
             f"Maks 1500 tegn totalt.\n"
             f"Ikke bruk markdown overskrifter (#), bruk heller fet tekst (**).\n\n"
-            f"NYHETSKILDER:\n{raw_text[:12000]}"
+            f"NYHETSKILDER:\n{kort_grunnlag}"
         )
         
         # Prøv lokalt først, så backup
@@ -151,7 +159,7 @@ class NewsWatcher(commands.Cog):
             f"3. Bruk <p> for avsnitt.\n"
             f"4. Vær grundig, kritisk og detaljert.\n"
             f"5. Ikke inkluder kodeblokker (```html), kun rå tekst.\n\n"
-            f"NYHETSGRUNNLAG:\n{raw_text[:20000]}"
+            f"NYHETSGRUNNLAG:\n{lang_grunnlag}"
         )
 
         html_body = await self.ask_local_albert(long_prompt)
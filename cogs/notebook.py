@@ -4,10 +4,10 @@ import aiohttp
 import asyncio
 from discord.ext import commands
 from utils.pdf_tools import extract_text_from_pdf, save_temp_pdf
-from google import genai
 from dotenv import load_dotenv
 # Vi legger til logging for systemoversikt
-from utils.minne import lagre
+from utils.minne import alagre
+from utils.ai_motor import gemini_klient
 
 load_dotenv()
 
@@ -17,12 +17,9 @@ class Notebook(commands.Cog):
         self.active_notebooks = {} # {channel_id: {"session": chat, "navn": str}}
 
     async def start_gemini_session(self, bok_tekst):
-        """Starter en chat-sesjon med boka i minnet via Google Cloud"""
-        api_key = os.getenv("GEMINI_KEY")
-        client = genai.Client(api_key=api_key)
-        
+        """Starter en chat-sesjon med boka i minnet via Google Cloud (async, delt klient)"""
         # Vi bruker Flash for hastighet og kostnadseffektivitet
-        chat = client.chats.create(model="gemini-1.5-flash")
+        chat = gemini_klient().aio.chats.create(model="gemini-1.5-flash")
         
         initial_prompt = (
             f"Du er en ekspert på følgende dokument. "
@@ -30,8 +27,7 @@ class Notebook(commands.Cog):
             f"--- START DOKUMENT ---\n{bok_tekst}\n--- SLUTT DOKUMENT ---"
         )
         
-        # Vi bruker thread for å ikke blokkere boten mens Gemini laster inn boka
-        await asyncio.to_thread(chat.send_message, initial_prompt)
+        await chat.send_message(initial_prompt)
         return chat
 
     @commands.command(name="notebook")
@@ -69,7 +65,7 @@ class Notebook(commands.Cog):
             }
             
             # LOGG TIL SYSTEMET (NYTT)
-            lagre(
+            await alagre(
                 tekst=f"Startet Notebook-sesjon: {vedlegg.filename} ({len(bok_tekst)} tegn)",
                 user=ctx.author.name,
                 guild_id=ctx.guild.id,
@@ -94,8 +90,7 @@ class Notebook(commands.Cog):
 
         async with ctx.typing():
             try:
-                # Vi bruker to_thread her også for å unngå 'blocking'
-                response = await asyncio.to_thread(chat.send_message, spørsmål)
+                response = await chat.send_message(spørsmål)
                 svar_tekst = response.text
 
                 # Bruker din smarte send-logikk (hvis du har den tilgjengelig, ellers enkel splitt)
@@ -10,7 +10,7 @@ from utils.database import (
     log_quiz_message, get_active_quiz_messages, clear_quiz_messages
 )
 # NYTT: Logging til systemet
-from utils.minne import lagre
+from utils.minne import alagre
 from difflib import SequenceMatcher
 
 QUIZ_CHANNEL_NAME = "daglig-quiz"
@@ -100,7 +100,7 @@ class Quiz(commands.Cog):
             await set_quiz_state(tittel, kategori, bilde_prompt)
             
             # LOGG START AV QUIZ
-            lagre(
+            await alagre(
                 tekst=f"Ny quiz generert: {tittel} ({kategori})", 
                 user="QuizMaster", 
                 guild_id="GLOBAL", 
@@ -163,7 +163,7 @@ class Quiz(commands.Cog):
             await message.channel.send("Du fikk +1 poeng!")
             
             # LOGG VINNER
-            lagre(
+            await alagre(
                 tekst=f"Vinner funnet: {message.author.name} gjettet {state[0]}", 
                 user=message.author.name, 
                 guild_id="DM", 
@@ -5,13 +5,16 @@ import re
 import random
 from datetime import datetime
 from discord.ext import commands
-from utils.ai_motor import ask_mistral, ask_gemini
-from utils.minne import lagre
+from utils.ai_motor import ask_mistral, ask_gemini, BAKGRUNN
+from utils.minne import alagre
 from utils.voice_engine import generate_voice 
+from utils.kontekst import apakk
 
 # Konfigurasjon
 SUMMARY_CHANNEL = "rpg-oppsummert"
 RPG_CATEGORY_NAME = "RPG Eventyr"
+ARKIV_BUDSJETT = 3000   # tokens med oppsummert historikk per handling (nyeste først)
+SAGA_BUDSJETT = 20000   # tokens logg til sagaen
 
 PACING = {
     "kort": "Dette er et One-Shot. Høyt tempo, driv historien mot en slutt raskt.",
@@ -132,7 +135,8 @@ class RPG(commands.Cog):
     async def summarize_background(self, cid, text):
         summary = await ask_mistral(
             f"Oppsummer dette kort på norsk for DM (Fantasy-kontekst):\n{text}", 
-            system_prompt="Du er en effektiv sekretær."
+            system_prompt="Du er en effektiv sekretær.",
+            prioritet=BAKGRUNN
         )
         if cid in self.active_games:
             self.active_games[cid]["summary_history"].append(f"[Arkiv]: {summary}")
@@ -279,7 +283,7 @@ class RPG(commands.Cog):
             asyncio.create_task(self.summarize_background(ctx.channel.id, "\n".join(old)))
 
         async with ctx.channel.typing():
-            hist = "\n".join(game["summary_history"])
+            hist = await apakk(game["summary_history"], "gemini-2.0-flash", budsjett=ARKIV_BUDSJETT, fra_slutten=True)
             now = "\n".join(game["log"])
             
             prompt = (
@@ -458,7 +462,11 @@ class RPG(commands.Cog):
             await ctx.send("🔥 Avslutter eventyret og skriver sagaen...")
             
             async with ctx.channel.typing():
-                full_text = "\n".join(game["full_transcript"])
+                # Lange eventyr: nyeste del av loggen, og arkiv-oppsummeringene for det som faller ut
+                full_text = await apakk(game["full_transcript"], "gemini-2.0-flash", budsjett=SAGA_BUDSJETT, fra_slutten=True)
+                if len(full_text) < len("\n".join(game["full_transcript"])) and game["summary_history"]:
+                    arkiv = await apakk(game["summary_history"], "gemini-2.0-flash", budsjett=ARKIV_BUDSJETT, fra_slutten=True)
+                    full_text = f"TIDLIGERE (oppsummert):\n{arkiv}\n\nSISTE DEL AV LOGGEN:\n{full_text}"
                 prompt = f"Skriv en episk saga basert på loggen. Maks 1900 tegn.\nVIKTIG: Skriv på NORSK.\nLogg:\n{full_text}"
                 saga = await ask_gemini(prompt, system_prompt="Legendarisk Fantasy-forfatter.")
                 
@@ -483,7 +491,7 @@ class RPG(commands.Cog):
                         except: pass
 
                 # RETTET: Bruker riktig navngitte parametere
-                lagre(
+                await alagre(
                     tekst=f"RPG-SAGA: {saga[:600]}...",
                     user="System", 
                     guild_id=ctx.guild.id, 
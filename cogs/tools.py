@@ -3,7 +3,7 @@ import random
 import re
 from discord.ext import commands
 # Vi legger til logging så vi kan huske hvem som har flaks/uflaks
-from utils.minne import lagre
+from utils.minne import alagre
 
 class Tools(commands.Cog):
     def __init__(self, bot):
@@ -51,7 +51,7 @@ class Tools(commands.Cog):
 
                 # LOGG TIL SYSTEMET (NYTT)
                 # Vi logger resultatet slik at boten husker hvem som har flaks
-                lagre(
+                await alagre(
                     tekst=f"Terningkast D{sider}: {resultat} {status}",
                     user=message.author.name,
                     guild_id=message.guild.id,
@@ -17,8 +17,8 @@ from dotenv import load_dotenv
 from transformers import pipeline
 from utils.job_queue import queue_manager 
 # Importerer den nye motoren og minne-logging
-from utils.ai_motor import ask_gemini
-from utils.minne import lagre
+from utils.ai_motor import ask_gemini_batch, GEMINI_RPM
+from utils.minne import alagre
 
 # Skjul irriterende advarsler
 warnings.filterwarnings("ignore", message=".*return_token_timestamps.*")
@@ -159,9 +159,32 @@ class VodReporter(commands.Cog):
     def calculate_eta(self, current_idx, total_items, batch_size):
         remaining_items = total_items - current_idx
         remaining_batches = (remaining_items + batch_size - 1) // batch_size
-        seconds_left = remaining_batches * 6 
+        seconds_left = remaining_batches * 60 / GEMINI_RPM  # Kvoten er flaskehalsen når bitene går i parallell
         return self.format_duration(seconds_left)
 
+    async def gemini_srt_batch(self, status_msg, tittel, subs, lag_prompt, system_prompt, batch=20):
+        """
+        Sender undertekstene i biter på `batch` til Gemini (parallelt, rate-begrenset i ai_motor)
+        og returnerer de rensede svarene i riktig rekkefølge. Oppdaterer status_msg underveis.
+        """
+        total = len(subs)
+        prompts = [lag_prompt("\n\n".join([str(s) for s in subs[i:i+batch]])) for i in range(0, total, batch)]
+        start = time.time()
+        sist_oppdatert = 0
+
+        async def fremdrift(ferdige, antall):
+            nonlocal sist_oppdatert
+            if time.time() - sist_oppdatert < 3 and ferdige < antall: return  # Ikke spam Discord med redigeringer
+            sist_oppdatert = time.time()
+            percent = int((ferdige/antall)*100)
+            eta = self.format_duration((time.time() - start) / ferdige * (antall - ferdige))
+            try: await status_msg.edit(content=f"{tittel}\n📊 {percent}% ({min(ferdige*batch, total)}/{total})\n⏱️ ETA: {eta}")
+            except discord.HTTPException: pass
+
+        await status_msg.edit(content=f"{tittel}\n📊 0% (0/{total})\n⏱️ ETA: {self.calculate_eta(0, total, batch)}")
+        svar = await ask_gemini_batch(prompts, system_prompt=system_prompt, fremdrift=fremdrift)
+        return [(res_text or "").replace("```srt", "").replace("```", "").strip() for res_text in svar]
+
     # --- JOBB 1: OVERSETT ---
     async def run_translation_job(self, ctx, srt_path, output_path):
         if not os.path.exists(srt_path):
@@ -170,25 +193,11 @@ class VodReporter(commands.Cog):
         status_msg = await ctx.send("🇺🇸 **Starter oversettelse av polert fil...**")
         try:
             subs = pysrt.open(srt_path, encoding='utf-8')
-            total = len(subs)
-            batch = 20
-            parts = []
-            
-            for i in range(0, total, batch):
-                chunk = subs[i:i+batch]
-                text = "\n\n".join([str(s) for s in chunk])
-                
-                percent = int((i/total)*100)
-                eta = self.calculate_eta(i, total, batch)
-                await status_msg.edit(content=f"🇺🇸 **Oversetter til Engelsk**\n📊 {percent}% ({i}/{total})\n⏱️ ETA: {eta}")
-
-                prompt = f"Translate Norsk SRT to idiomatic English. MAINTAIN EXACT TIMING from input. Adapt idioms. KEEP SRT FORMAT. Max 43 chars/line. INPUT:\n{text}"
-                
-                # Bruker den nye ai_motor.ask_gemini
-                res_text = await ask_gemini(prompt, system_prompt="Du er en profesjonell SRT-oversetter.")
-                
-                parts.append(res_text.replace("```srt", "").replace("```", "").strip())
-                await asyncio.sleep(2) # Redusert ventetid siden ask_gemini er mer effektiv
+            parts = await self.gemini_srt_batch(
+                status_msg, "🇺🇸 **Oversetter til Engelsk**", subs,
+                lambda text: f"Translate Norsk SRT to idiomatic English. MAINTAIN EXACT TIMING from input. Adapt idioms. KEEP SRT FORMAT. Max 43 chars/line. INPUT:\n{text}",
+                system_prompt="Du er en profesjonell SRT-oversetter."
+            )
 
             with open(output_path, "w", encoding='utf-8') as f: f.write("\n\n".join(parts))
             await status_msg.delete()
@@ -201,25 +210,11 @@ class VodReporter(commands.Cog):
         status_msg = await ctx.send("🇳🇴 **Vasker norsk tekst...**")
         try:
             subs = pysrt.open(srt_path, encoding='utf-8')
-            total = len(subs)
-            batch = 20
-            parts = []
-            
-            for i in range(0, total, batch):
-                chunk = subs[i:i+batch]
-                text = "\n\n".join([str(s) for s in chunk])
-                
-                percent = int((i/total)*100)
-                eta = self.calculate_eta(i, total, batch)
-                await status_msg.edit(content=f"🇳🇴 **Vasker Norsk Tekst**\n📊 {percent}% ({i}/{total})\n⏱️ ETA: {eta}")
-
-                prompt = f"Fix grammar/spelling in Norwegian Bokmål SRT. KEEP SRT FORMAT. Max 43 chars/line. INPUT:\n{text}"
-                
-                # Bruker den nye ai_motor.ask_gemini
-                res_text = await ask_gemini(prompt, system_prompt="Du er en nøyaktig korrekturleser.")
-                
-                parts.append(res_text.replace("```srt", "").replace("```", "").strip())
-                await asyncio.sleep(2)
+            parts = await self.gemini_srt_batch(
+                status_msg, "🇳🇴 **Vasker Norsk Tekst**", subs,
+                lambda text: f"Fix grammar/spelling in Norwegian Bokmål SRT. KEEP SRT FORMAT. Max 43 chars/line. INPUT:\n{text}",
+                system_prompt="Du er en nøyaktig korrekturleser."
+            )
 
             with open(output_path, "w", encoding='utf-8') as f: f.write("\n\n".join(parts))
             await status_msg.delete()
@@ -232,25 +227,11 @@ class VodReporter(commands.Cog):
         status_msg = await ctx.send("🏋️ **Genererer treningsdata...**")
         try:
             subs = pysrt.open(srt_path, encoding='utf-8')
-            total = len(subs)
-            batch = 20
-            parts = []
-            
-            for i in range(0, total, batch):
-                chunk = subs[i:i+batch]
-                text = "\n\n".join([str(s) for s in chunk])
-                
-                percent = int((i/total)*100)
-                eta = self.calculate_eta(i, total, batch)
-                await status_msg.edit(content=f"🏋️ **Genererer Treningsdata**\n📊 {percent}% ({i}/{total})\n⏱️ ETA: {eta}")
-
-                prompt = f"Create VERBATIM training dataset (Dialect->Bokmål). KEEP SRT FORMAT. No summarizing. INPUT:\n{text}"
-                
-                # Bruker den nye ai_motor.ask_gemini
-                res_text = await ask_gemini(prompt, system_prompt="Du er en ekspert på norske dialekter.")
-                
-                parts.append(res_text.replace("```srt", "").replace("```", "").strip())
-                await asyncio.sleep(2)
+            parts = await self.gemini_srt_batch(
+                status_msg, "🏋️ **Genererer Treningsdata**", subs,
+                lambda text: f"Create VERBATIM training dataset (Dialect->Bokmål). KEEP SRT FORMAT. No summarizing. INPUT:\n{text}",
+                system_prompt="Du er en ekspert på norske dialekter."
+            )
 
             with open(output_path, "w", encoding='utf-8') as f: f.write("\n\n".join(parts))
             await status_msg.delete()
@@ -343,7 +324,7 @@ class VodReporter(commands.Cog):
             with open(srt_sti, "w", encoding="utf-8") as f: f.write(final_srt)
             
             total_tid = time.time() - start_time
-            lagre(
+            await alagre(
                 tekst=f"Transkribering fullført: {jobb_id} (Tid: {total_tid:.1f}s)", 
                 user="WhisperBot", 
                 guild_id=ctx.guild.id, 
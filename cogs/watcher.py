@@ -3,7 +3,7 @@ import os
 import asyncio
 import time
 from discord.ext import commands, tasks
-from utils.minne import lagre
+from utils.minne import alagre
 
 # --- KONFIGURASJON ---
 WATCH_DIR = "./data/temp_vods"
@@ -120,7 +120,7 @@ class FileWatcher(commands.Cog):
                 
                 # Loggfør i Albert sitt minne (OPPDATERT)
                 try:
-                    lagre(
+                    await alagre(
                         tekst=f"Filoverføring fullført: {TARGET_FILE} ({self.format_size(current_size)})", 
                         user="System", 
                         guild_id="LOCAL", 
@@ -4,7 +4,7 @@ import asyncio
 import json
 import os
 # Vi legger til logging for å holde oversikt over hvem som bruker AI-en
-from utils.minne import lagre
+from utils.minne import alagre
 
 class Welcome(commands.Cog):
     def __init__(self, bot):
@@ -148,7 +148,7 @@ class Welcome(commands.Cog):
                     new_chan = await guild.create_text_channel(chan_name, category=category, overwrites=overwrites)
                     
                     # LOGG TIL SYSTEMET (NYTT)
-                    lagre(
+                    await alagre(
                         tekst=f"Opprettet personlig AI-kanal: {chan_name}",
                         user="System",
                         guild_id=guild.id,
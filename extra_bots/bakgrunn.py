@@ -1,7 +1,6 @@
 import discord
 import os
 import datetime
-import chromadb
 import asyncio
 import aiohttp
 import time
@@ -9,14 +8,14 @@ import random
 from discord.ext import tasks
 from dotenv import load_dotenv
 from utils.db_handler import log_hardware, log_ai_performance
+from utils.chroma import samling
 
 load_dotenv()
 
 # --- SERVER KOBLING ---
-CHROMA_CLIENT = chromadb.HttpClient(host='localhost', port=8081)
 # Vi bruker egne kolleksjoner for å skille systemdata fra vanlige minner
-log_collection = CHROMA_CLIENT.get_or_create_collection(name="system_logs")
-perf_collection = CHROMA_CLIENT.get_or_create_collection(name="ai_performance")
+log_collection = samling("system_logs")
+perf_collection = samling("ai_performance")
 
 client = discord.Client(intents=discord.Intents.all())
 
@@ -84,7 +83,7 @@ async def logg_ai_performance_hybrid(model_name, tokens, duration, ram_delta):
     # Vi henter kjapt temp og load for kontekst
     load = os.getloadavg()[0]
     # Her bruker vi en dummy-verdi for temp siden vi ikke vil sinke inference med et API-kall
-    log_ai_performance(tps, 0.0, load) 
+    await log_ai_performance(tps, 0.0, load) 
 
     # 2. Logg til ChromaDB (Semantisk minne)
     perf_collection.add(
@@ -117,7 +116,7 @@ async def hardware_monitor_loop():
     # 1. LOGG TIL SQLITE (Via db_handler)
     # Vi estimerer stalled cycles basert på load siden vi ikke har perf-modul for det direkte
     stalled_cycles = round(load[0] * 4.2, 1) 
-    log_hardware(temp, ipc, stalled_cycles, load[0])
+    await log_hardware(temp, ipc, stalled_cycles, load[0])
 
     # 2. LOGG TIL CHROMADB
     status_doc = (
@@ -4,13 +4,14 @@ import random
 import json
 import os
 import asyncio
-from utils.minne import hent, lagre
+from utils.minne import ahent, lagre
 
 
 
 # 🔹 AI-motor + felles minne (fra kompisen din)
-from utils.ai_motor import ask_mistral, ask_gemini   # async AI-funksjon
-from utils.minne import hent, lagre     # felles minne (Chroma / vector-db)
+from utils.ai_logg import sett_kaller, kaller_fra_ctx
+from utils.ai_motor import ask_mistral, ruter_svar, BAKGRUNN   # async AI-funksjon
+from utils.minne import ahent, lagre     # felles minne (Chroma / vector-db)
 
 # ---------- KONFIG ---------- #
 
@@ -221,6 +222,7 @@ intents.voice_states = True
 intents.guilds = True
 
 bot = commands.Bot(command_prefix="!", intents=intents)
+bot.before_invoke(kaller_fra_ctx)  # AI-kall i kommandoar blir merka med kommandonamnet
 
 
 # ---------- EVENTS ---------- #
@@ -367,32 +369,22 @@ async def on_message(message: discord.Message):
 
     # ----- MODE 3: Pepe svarer på ALT i ein bestemt kanal -----
     if message.channel.id == CHAT_CHANNEL_ID:
+        sett_kaller("Pepe", "auto-chat")
         async with message.channel.typing():
             # hent relevant minne frå felles minnesystem
-            mem = hent(message.content, message.channel.id)
-
-
-                                                                                    #Endringer her også
-            # bruk AI-motoren (Mistral eller kva kompisen din har satt opp)
-            svar = await ask_mistral(
-                clean_text, 
-                context=mem, 
-                system_prompt=PEPE_PERSONA # Bruker persona inkludert feilkoden
+            clean_text = message.content.replace(f"<@{bot.user.id}>", "").strip()
+            mem = await ahent(message.content, message.channel.id)
+
+            # Mistral først, Gemini som reserve. Ruteren sender same spørsmål til Gemini
+            # om Mistral er treg (over sin p95), har feila, eller gir opp med JEG_VET_IKKE.
+            svar = await ruter_svar(
+                clean_text,
+                context=mem,
+                system_prompt=PEPE_PERSONA, # Bruker persona inkludert feilkoden
+                rekkefølge=("mistral", "gemini"),
+                prioritet=BAKGRUNN, # Auto-chat skal ikkje stå framfor @Albert-svar
+                godta=lambda s: "JEG_VET_IKKE" not in s and len(s.strip()) >= 5
             )
-            
-            # --- 2. FALLBACK TIL GEMINI (Kort og Smart) ---
-            # Hvis Mistral feilet, eller ga opp:
-            if "JEG_VET_IKKE" in svar or len(svar.strip()) < 5:
-                print("Pepe: Mistral ga opp. Sender til Gemini.")
-                
-                # Siden PEPE_PERSONA allerede ligger i filen, sender vi den rett til Gemini
-                svar = await ask_gemini(
-                    clean_text, 
-                    context=mem, 
-                    system_prompt=PEPE_PERSONA 
-                )
-                
-                                                                                    #Endringer
 
             # 3. STYLE OG SEND
             svar_stil = pepe_style(svar)
@@ -587,7 +579,7 @@ async def pepechat(ctx: commands.Context, *, message: str):
     Bruker same AI-motor og minne som auto-chat.
     """
     async with ctx.typing():
-        mem = hent(message, ctx.channel.id)
+        mem = await ahent(message, ctx.channel.id)
         svar = await ask_mistral(
             message,
             context=mem,
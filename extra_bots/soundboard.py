@@ -2,7 +2,7 @@ import discord
 import os
 import asyncio
 # Vi legger til logging
-from utils.minne import lagre
+from utils.minne import alagre
 
 SOUNDBOARD_DIR = "./data/soundboard"
 
@@ -57,7 +57,7 @@ async def on_message(message):
             await message.channel.send(f"🔊 Lyd **{navn}** ble lagt til soundboardet!")
             
             # LOGG
-            lagre(
+            await alagre(
                 tekst=f"La til ny lyd: {navn}",
                 user=message.author.name,
                 guild_id=message.guild.id,
@@ -111,7 +111,7 @@ async def on_message(message):
             vc.play(source)
             
             # LOGG
-            lagre(
+            await alagre(
                 tekst=f"Spilte av lyd: {navn}",
                 user=message.author.name,
                 guild_id=message.guild.id,
@@ -4,6 +4,8 @@ import os
 from discord.ext import commands
 from dotenv import load_dotenv
 from utils.database import init_db
+from utils.db_handler import init_db as init_stats_db
+from utils.ai_logg import kaller_fra_ctx, start_metrikk_server
 
 # Laster inn variabler fra .env filen
 load_dotenv()
@@ -17,6 +19,7 @@ intents.members = True
 intents.presences = True # Viktig for GameSpy
 
 bot = commands.Bot(command_prefix="!", intents=intents)
+bot.before_invoke(kaller_fra_ctx)  # Merker AI-kall med cog og kommando (se !ai_stats)
 
 @bot.event
 async def on_ready():
@@ -33,6 +36,7 @@ async def on_ready():
     print("--------------------------------------------------")
     
     await init_db()
+    await init_stats_db()
 
 async def main():
     # 1. Last inn alle Cogs
@@ -83,9 +87,23 @@ async def main():
             bot_tasks.append(bg.start(token_bg))
         except: pass
 
+    # 3. Prometheus-endepunkt for AI-metrikker (valgfritt)
+    metrikk_port = os.getenv("AI_METRICS_PORT")
+    if metrikk_port:
+        from utils.ai_motor import prometheus_ekstra
+        try:
+            await start_metrikk_server(metrikk_port, ekstra=prometheus_ekstra)
+        except Exception as e:
+            print(f"⚠️ Kunne ikke starte metrikk-server: {e}")
+
     # 4. Kjør
     if bot_tasks:
-        await asyncio.gather(*bot_tasks)
+        try:
+            await asyncio.gather(*bot_tasks)
+        finally:
+            # Lukk delte HTTP-sesjoner (Ollama) mens loopen fortsatt lever
+            from utils.ai_motor import lukk_ai_klienter
+            await lukk_ai_klienter()
     else:
         print("❌ Ingen tokens funnet.")
 
@@ -93,4 +111,8 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("\n🛑 Botene er stoppet.")
\ No newline at end of file
+        print("\n🛑 Botene er stoppet.")
+    finally:
+        # Sørg for at minner som venter i skrive-køen havner i databasen
+        from utils.minne import stopp_minneskriver
+        stopp_minneskriver()
\ No newline at end of file
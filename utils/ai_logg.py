@@ -0,0 +1,251 @@
+import time
+import atexit
+import asyncio
+import threading
+import contextvars
+from collections import defaultdict
+from utils.db_handler import log_ai_calls_batch
+
+# --- KONFIGURASJON ---
+# Strukturert logg over hvert AI-kall (backend, modell, hvem som spurte, tokens, latens, kostnad).
+# Postene samles i minnet og legges i batch i skrivekøen til albert_stats.db (tabell ai_calls,
+# se utils/lagring.py), så event-loopen aldri venter på SQLite. Løpende tellere for Prometheus holdes i minnet.
+FLUSH_ANTALL = 20
+FLUSH_INTERVALL = 15.0  # sekunder
+
+# USD per 1M tokens (inn, ut). Lokale modeller koster 0.
+PRISER = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+# USD per enhet (bilde, eller tegn for TTS)
+ENHETSPRISER = {
+    "imagen-3.0-generate-001": 0.03,
+    "dall-e-3": 0.04,
+    "tts-1": 15.0 / 1_000_000,
+}
+
+LATENS_BØTTER = (0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+# Hvem som spør: (cog, kommando). Settes av before_invoke-hooken i main.py for kommandoer,
+# og med sett_kaller() i lyttere/bakgrunnsjobber. Følger med inn i tasks som lages derfra.
+_kaller = contextvars.ContextVar("ai_kaller", default=None)
+
+def sett_kaller(cog, kommando):
+    _kaller.set((cog, kommando))
+
+async def kaller_fra_ctx(ctx):
+    """Brukes som bot.before_invoke: merker alle AI-kall i kommandoen med cog og kommando."""
+    sett_kaller(ctx.cog.qualified_name if ctx.cog else "Bot", ctx.command.qualified_name if ctx.command else "ukjent")
+
+def kaller():
+    verdi = _kaller.get()
+    if verdi: return verdi
+    # discord.ext.tasks navngir oppgavene sine "discord-ext-tasks: Cog.metode"
+    try:
+        navn = asyncio.current_task().get_name()
+    except RuntimeError:
+        navn = ""
+    if navn.startswith("discord-ext-tasks: "):
+        deler = navn.split(": ", 1)[1].split(".")
+        return (deler[0], deler[-1]) if len(deler) > 1 else ("tasks", deler[0])
+    return ("ukjent", "ukjent")
+
+def estimer_tokens(tekst):
+    """Grovt anslag (~4 tegn per token) når backenden ikke oppgir tokens selv."""
+    return max(1, len(tekst) // 4) if tekst else 0
+
+def estimer_kostnad(modell, prompt_tokens=0, completion_tokens=0, enheter=0):
+    if modell in ENHETSPRISER:
+        return enheter * ENHETSPRISER[modell]
+    inn, ut = PRISER.get(modell, (0.0, 0.0))
+    return (prompt_tokens or 0) * inn / 1_000_000 + (completion_tokens or 0) * ut / 1_000_000
+
+# --- LØPENDE TELLERE (for Prometheus) ---
+_lås = threading.Lock()
+_kall = defaultdict(int)            # (backend, modell, cog, status) -> antall
+_tokens = defaultdict(int)          # (backend, modell, type) -> antall
+_kostnad = defaultdict(float)       # (backend, modell) -> USD
+_latens = defaultdict(lambda: [0] * (len(LATENS_BØTTER) + 1))  # (backend, modell) -> bøtter (+Inf sist)
+_latens_sum = defaultdict(float)
+_ttft_sum = defaultdict(float)
+_ttft_antall = defaultdict(int)
+
+_buffer = []
+_sist_flush = time.monotonic()
+# Uten egen tidtaker ble bufferen bare tømt når et nytt kall kom inn, så de siste postene
+# før en stille periode ble liggende. Tråden startes ved første post og tømmer hvert FLUSH_INTERVALL.
+_flusher = None
+_stopp_flush = threading.Event()
+
+class Måling:
+    """
+    Tidtaker for ett AI-kall. Brukes som `with ai_logg.måling("ollama", modell) as m:`.
+    Sett m.prompt_tokens / m.completion_tokens / m.ollama(data) underveis, kall m.første_token()
+    ved første strømmede bit og m.feil() hvis kallet endte i en feilstreng uten unntak.
+    """
+    def __init__(self, backend, modell):
+        self.backend = backend
+        self.modell = modell
+        self.cog, self.kommando = kaller()
+        self.start = time.monotonic()
+        self.ttft = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.eval_count = None
+        self.eval_duration_ms = None
+        self.prompt_eval_duration_ms = None
+        self.enheter = 0
+        self.status = "ok"
+
+    def første_token(self):
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.start
+
+    def ollama(self, data):
+        """Leser tellerne fra Ollama sitt siste svar (done=true). Varighetene er i nanosekunder."""
+        self.prompt_tokens = data.get("prompt_eval_count", self.prompt_tokens)
+        self.completion_tokens = self.eval_count = data.get("eval_count", self.eval_count)
+        if data.get("eval_duration"): self.eval_duration_ms = data["eval_duration"] / 1e6
+        if data.get("prompt_eval_duration"): self.prompt_eval_duration_ms = data["prompt_eval_duration"] / 1e6
+
+    def feil(self):
+        self.status = "feil"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, verdi, tb):
+        if typ is not None:
+            self.status = "avbrutt" if issubclass(typ, (asyncio.CancelledError, GeneratorExit)) else "feil"
+        _registrer(self)
+        return False
+
+def måling(backend, modell):
+    return Måling(backend, modell)
+
+def _registrer(m):
+    total = time.monotonic() - m.start
+    kostnad = estimer_kostnad(m.modell, m.prompt_tokens, m.completion_tokens, m.enheter)
+    post = (
+        time.time(), m.backend, m.modell, m.cog, m.kommando, m.status,
+        m.prompt_tokens, m.completion_tokens,
+        round(m.ttft * 1000, 1) if m.ttft is not None else None, round(total * 1000, 1),
+        m.eval_count, m.eval_duration_ms, m.prompt_eval_duration_ms, kostnad
+    )
+    with _lås:
+        _kall[(m.backend, m.modell, m.cog, m.status)] += 1
+        _tokens[(m.backend, m.modell, "prompt")] += m.prompt_tokens or 0
+        _tokens[(m.backend, m.modell, "completion")] += m.completion_tokens or 0
+        _kostnad[(m.backend, m.modell)] += kostnad
+        bøtter = _latens[(m.backend, m.modell)]
+        bøtter[next((i for i, grense in enumerate(LATENS_BØTTER) if total <= grense), len(LATENS_BØTTER))] += 1
+        _latens_sum[(m.backend, m.modell)] += total
+        if m.ttft is not None:
+            _ttft_sum[(m.backend, m.modell)] += m.ttft
+            _ttft_antall[(m.backend, m.modell)] += 1
+        _buffer.append(post)
+        må_flushe = len(_buffer) >= FLUSH_ANTALL or time.monotonic() - _sist_flush >= FLUSH_INTERVALL
+    if må_flushe:
+        tøm()
+    _start_flusher()
+
+def _flushløkke():
+    while not _stopp_flush.wait(FLUSH_INTERVALL):
+        if _buffer and time.monotonic() - _sist_flush >= FLUSH_INTERVALL:
+            tøm()
+
+def _start_flusher():
+    global _flusher
+    with _lås:
+        if _flusher is not None or _stopp_flush.is_set(): return
+        _flusher = threading.Thread(target=_flushløkke, name="ai-logg-flush", daemon=True)
+    _flusher.start()
+
+def _skrevet(future, antall):
+    if future.exception():
+        print(f"⚠️ Kunne ikke skrive AI-logg ({antall} poster): {future.exception()}")
+
+def tøm():
+    """Legger alt som ligger i bufferen i skrivekøen. Blokkerer ikke, trygg fra hvilken som helst tråd."""
+    global _sist_flush
+    with _lås:
+        poster = _buffer[:]
+        _buffer.clear()
+        _sist_flush = time.monotonic()
+    if not poster: return
+    try:
+        log_ai_calls_batch(poster).add_done_callback(lambda f: _skrevet(f, len(poster)))
+    except Exception as e:
+        print(f"⚠️ Kunne ikke skrive AI-logg ({len(poster)} poster): {e}")
+
+def _avslutt():
+    _stopp_flush.set()
+    tøm()
+
+# Registreres etter lagring (importert via db_handler), så atexit kjører denne først og
+# postene ligger i skrivekøen før motor.stopp() skriver ut køen og lukker databasene.
+atexit.register(_avslutt)
+
+# --- PROMETHEUS ---
+def _etiketter(**kv):
+    def rens(v): return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+    return "{" + ",".join(f'{k}="{rens(v)}"' for k, v in kv.items()) + "}"
+
+def prometheus_tekst():
+    """Alle tellere i Prometheus tekstformat (siden oppstart)."""
+    linjer = []
+    with _lås:
+        linjer += ["# HELP albert_ai_calls_total AI-kall per backend, modell, cog og status.",
+                   "# TYPE albert_ai_calls_total counter"]
+        for (backend, modell, cog, status), n in sorted(_kall.items()):
+            linjer.append(f"albert_ai_calls_total{_etiketter(backend=backend, model=modell, cog=cog, status=status)} {n}")
+
+        linjer += ["# HELP albert_ai_tokens_total Tokens brukt (prompt/completion).",
+                   "# TYPE albert_ai_tokens_total counter"]
+        for (backend, modell, typ), n in sorted(_tokens.items()):
+            linjer.append(f"albert_ai_tokens_total{_etiketter(backend=backend, model=modell, type=typ)} {n}")
+
+        linjer += ["# HELP albert_ai_cost_usd_total Estimert kostnad i USD.",
+                   "# TYPE albert_ai_cost_usd_total counter"]
+        for (backend, modell), usd in sorted(_kostnad.items()):
+            linjer.append(f"albert_ai_cost_usd_total{_etiketter(backend=backend, model=modell)} {usd:.6f}")
+
+        linjer += ["# HELP albert_ai_latency_seconds Total latens per kall.",
+                   "# TYPE albert_ai_latency_seconds histogram"]
+        for (backend, modell), bøtter in sorted(_latens.items()):
+            kumulativ = 0
+            for grense, n in zip(list(LATENS_BØTTER) + ["+Inf"], bøtter):
+                kumulativ += n
+                linjer.append(f"albert_ai_latency_seconds_bucket{_etiketter(backend=backend, model=modell, le=grense)} {kumulativ}")
+            linjer.append(f"albert_ai_latency_seconds_sum{_etiketter(backend=backend, model=modell)} {_latens_sum[(backend, modell)]:.3f}")
+            linjer.append(f"albert_ai_latency_seconds_count{_etiketter(backend=backend, model=modell)} {kumulativ}")
+
+        linjer += ["# HELP albert_ai_ttft_seconds Tid til første token (kun strømmende kall).",
+                   "# TYPE albert_ai_ttft_seconds summary"]
+        for (backend, modell), n in sorted(_ttft_antall.items()):
+            linjer.append(f"albert_ai_ttft_seconds_sum{_etiketter(backend=backend, model=modell)} {_ttft_sum[(backend, modell)]:.3f}")
+            linjer.append(f"albert_ai_ttft_seconds_count{_etiketter(backend=backend, model=modell)} {n}")
+    return "\n".join(linjer) + "\n"
+
+async def start_metrikk_server(port, ekstra=None):
+    """
+    Starter et lite HTTP-endepunkt (/metrics) for Prometheus. ekstra() kan returnere flere linjer.
+    Returnerer runner-en, så den kan stoppes med `await runner.cleanup()`.
+    """
+    from aiohttp import web
+
+    async def metrics(request):
+        tekst = prometheus_tekst()
+        if ekstra:
+            tekst += ekstra()
+        return web.Response(text=tekst, content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", int(port)).start()
+    print(f"📈 Prometheus-metrikker på :{port}/metrics")
+    return runner
@@ -2,46 +2,631 @@ import aiohttp
 import os
 import json
 import base64
+import random
 import asyncio
+import hashlib
+import functools
+import inspect
+import time
+import httpx
+from collections import OrderedDict, Counter, deque
+from contextlib import asynccontextmanager, aclosing
 from pathlib import Path
 from google import genai
-from google.genai import types
-from openai import OpenAI
+from google.genai import types, errors as genai_errors
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-# Vi logger API-bruk for å ha kontroll
-from utils.minne import lagre
+# Vi logger API-bruk (tokens, latens, kostnad) for å ha kontroll
+from utils import ai_logg
+from utils.database import get_ai_cache, set_ai_cache
+from utils.kontekst import tell_tokens
 
 load_dotenv()
 
-# --- HJELPEFUNKSJONER (Synkrone) ---
-def _run_gemini_sync(api_key, model, contents):
-    """Kjører selve Google-kallet synkront (blokkerende)."""
-    client = genai.Client(api_key=api_key)
-    return client.models.generate_content(
-        model=model,
-        contents=contents
-    )
+# --- SINGLEFLIGHT ---
+# Identiske kall som er underveis samtidig (to som kjører !guru for samme spill, !forcequiz
+# to ganger, generer_rapport oppå daily_hype) slås sammen til ett backend-kall, og alle som
+# venter får det samme svaret. Prioritet og cache_ttl er ikke med i nøkkelen.
+_i_luften = {}  # nøkkel -> _Flyvning
+singleflight_stats = {"kall": 0, "sammenslått": 0}
+
+class _Flyvning:
+    def __init__(self, task):
+        self.task = task
+        self.ventere = 0
+
+async def _singleflight(nøkkel, fabrikk):
+    flyvning = _i_luften.get(nøkkel)
+    singleflight_stats["kall"] += 1
+    if flyvning is None:
+        flyvning = _i_luften[nøkkel] = _Flyvning(asyncio.create_task(fabrikk()))
+        flyvning.task.add_done_callback(lambda _: _i_luften.pop(nøkkel, None) if _i_luften.get(nøkkel) is flyvning else None)
+    else:
+        singleflight_stats["sammenslått"] += 1
+    flyvning.ventere += 1
+    try:
+        # shield: én som gir opp skal ikke avbryte kallet for de andre
+        return await asyncio.shield(flyvning.task)
+    except asyncio.CancelledError:
+        if flyvning.ventere == 1 and not flyvning.task.done():
+            flyvning.task.cancel()  # Siste som venter ga opp, da trengs ikke svaret
+        raise
+    finally:
+        flyvning.ventere -= 1
+
+def samkjør(func):
+    """Dekoratør: slår sammen samtidige kall til `func` med like argumenter."""
+    signatur = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def innpakket(*args, **kwargs):
+        bundet = signatur.bind(*args, **kwargs)
+        bundet.apply_defaults()
+        argumenter = {k: v for k, v in bundet.arguments.items() if k not in ("cache_ttl", "prioritet")}
+        nøkkel = (func.__name__, json.dumps(argumenter, sort_keys=True, ensure_ascii=False, default=str))
+        return await _singleflight(nøkkel, lambda: func(*args, **kwargs))
+    return innpakket
+
+def singleflight_status():
+    return {"i_luften": len(_i_luften), **singleflight_stats}
+
+# --- OLLAMA: DELT HTTP-SESJON ---
+# Én sesjon for hele boten (og Pepe/Bakgrunn, som kjører i samme loop), så TCP-forbindelsen
+# til Ollama gjenbrukes (keep-alive) i stedet for at hvert kall kobler opp på nytt.
+OLLAMA_MAKS_TILKOBLINGER = 8
+OLLAMA_TIMEOUT = aiohttp.ClientTimeout(total=600, connect=5, sock_read=300)
+# Strømming kan ta lang tid totalt, men det skal ikke gå 5 min mellom to biter
+OLLAMA_STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, connect=5, sock_read=300)
+
+_ollama_sesjon = None
 
-def _run_imagen_sync(api_key, prompt):
-    """Kjører bildegenerering synkront via SDK."""
-    client = genai.Client(api_key=api_key)
-    return client.models.generate_images(
-        model='imagen-3.0-generate-001',
-        prompt=prompt,
-        config=types.GenerateImageConfig(
-            sample_count=1,
-            include_rai_reason=True,
-            output_mime_type="image/png"
+def ollama_base():
+    """Basis-URL til Ollama. OLLAMA_URL (full /api/generate-URL) brukes hvis den er satt."""
+    url = os.getenv("OLLAMA_URL")
+    if url and "/api/" in url:
+        return url.split("/api/")[0]
+    return (url or os.getenv("OLLAMA_HOST") or "http://127.0.0.1:11434").rstrip("/")
+
+async def ollama_sesjon():
+    """Den delte sesjonen. Lages første gang den trengs (må skje inne i event-loopen)."""
+    global _ollama_sesjon
+    if _ollama_sesjon is None or _ollama_sesjon.closed:
+        _ollama_sesjon = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=OLLAMA_MAKS_TILKOBLINGER, keepalive_timeout=60),
+            timeout=OLLAMA_TIMEOUT
         )
-    )
+    return _ollama_sesjon
+
+# --- OLLAMA: PRIORITERT KØ ---
+# Alt lokalt (svar til brukere, RPG-oppsummering, nyhetsproduksjon, Pepe, minne-vedlikehold)
+# deler én mini-PC. Hvert kall må få en plass før det sendes til Ollama, og ledige plasser
+# gis alltid til høyeste prioritet først. Da venter ikke en @Albert-melding bak nattens batch.
+INTERAKTIV = 0   # En bruker sitter og venter på svaret
+BAKGRUNN = 1     # Bør skje snart, men ingen venter aktivt (RPG-arkiv, Pepe auto-chat)
+BATCH = 2        # Planlagte bulkjobber (nyheter, minnekomprimering)
+PRIORITETSNAVN = {INTERAKTIV: "interaktiv", BAKGRUNN: "bakgrunn", BATCH: "batch"}
+
+# Ollama kjører i praksis én generering av gangen på CPU. Følger serverens egen innstilling.
+OLLAMA_SAMTIDIGE = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+
+# --- MODELL-RESIDENS ---
+# command-r og mistral får ikke plass i minnet samtidig. Hvert bytte koster titalls sekunder
+# med lasting, så køen grupperer kall per modell: innen samme prioritetsklasse går kall til
+# modellen som allerede er lastet først, så lenge de andre ikke har ventet for lenge.
+# keep_alive settes per kall, og i stille perioder lastes modellen vi mest sannsynlig trenger.
+HOVEDMODELL = os.getenv("OLLAMA_HOVEDMODELL", "command-r")
+KEEP_ALIVE = {"command-r": "30m", "mistral": "15m"}
+STANDARD_KEEP_ALIVE = "10m"
+# Kontekstvindu (num_ctx) vi ber om per modell. Sendes på ALLE kall til modellen: Ollama laster
+# modellen på nytt når num_ctx endres, og uten den bruker serveren sitt lille standardvindu og kutter
+# starten av lange prompter stille. Kontekst-budsjettene i utils/kontekst.py må få plass innenfor.
+NUM_CTX = {
+    "command-r": int(os.getenv("OLLAMA_NUM_CTX_COMMAND_R", "8192")),
+    "mistral": int(os.getenv("OLLAMA_NUM_CTX_MISTRAL", "4096")),
+}
+STANDARD_NUM_CTX = 4096
+MAKS_UTSETTELSE = 20.0    # sekunder et kall til en annen modell kan bli forbigått
+LAST_TERSKEL = 0.5        # load_duration over dette (sekunder) betyr at modellen faktisk ble lastet
+FORVARM_ETTER = 120.0     # sekunder uten trafikk før vi forvarmer
+FORVARM_SJEKK = 60.0
+BRUK_VINDU = 3600.0       # sekunder bakover vi ser for å gjette neste modell
+
+def _basenavn(modell):
+    return (modell or "").split(":")[0]
+
+def num_ctx(modell):
+    return NUM_CTX.get(_basenavn(modell), STANDARD_NUM_CTX)
+
+def _med_ctx(modell, options):
+    """options med num_ctx for modellen (hvis kallet ikke har satt den selv)."""
+    if options and "num_ctx" in options: return options
+    return {**(options or {}), "num_ctx": num_ctx(modell)}
+
+class LLMPlanlegger:
+    """
+    Slipper inn maks `samtidige` kall om gangen, i prioritetsrekkefølge (FIFO innen samme klasse,
+    men kall til modellen som er lastet får gå foran). Holder rede på hvilken modell som er lastet.
+    """
+    def __init__(self, samtidige=OLLAMA_SAMTIDIGE):
+        self.samtidige = max(1, samtidige)
+        self.aktive = 0
+        self._kø = []  # [prioritet, modell, innkøet (monotonic), future], i ankomstrekkefølge
+        self._aktive_modeller = Counter()
+        self.behandlet = {p: 0 for p in PRIORITETSNAVN}
+        self.ventetid = {p: 0.0 for p in PRIORITETSNAVN}  # Sum sekunder i kø
+        self.maks_ventetid = {p: 0.0 for p in PRIORITETSNAVN}
+        self.maks_kø = 0
+        # Residens
+        self.resident = None
+        self.bytter = 0
+        self.lastinger = 0
+        self.lastetid = 0.0
+        self.forvarminger = 0
+        self.sist_aktivitet = time.monotonic()
+        self._bruk = deque()  # (monotonic, modell)
+        self.forvarm = None   # async funksjon(modell), settes under
+        self._forvarmer = None
+
+    async def _inn(self, prioritet, modell):
+        if self.aktive < self.samtidige and not self._kø:
+            self.aktive += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._kø.append([prioritet, modell, time.monotonic(), future])
+        self.maks_kø = max(self.maks_kø, self.i_kø())
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Fikk vi plassen samtidig som vi ble avbrutt, må den gis videre
+            if future.done() and not future.cancelled():
+                self._ut()
+            raise
+
+    def _velg_neste(self):
+        self._kø = [k for k in self._kø if not k[3].done()]  # Avbrutte ventere ryddes bort her
+        if not self._kø: return None
+        beste = min(k[0] for k in self._kø)
+        klasse = [k for k in self._kø if k[0] == beste]
+        eldste = klasse[0]
+        if time.monotonic() - eldste[2] < MAKS_UTSETTELSE:
+            samme = next((k for k in klasse if _basenavn(k[1]) == self.resident), None)
+            if samme: return samme
+        return eldste
+
+    def _ut(self):
+        neste = self._velg_neste()
+        if neste is None:
+            self.aktive -= 1
+            return
+        self._kø.remove(neste)
+        neste[3].set_result(None)  # Plassen går rett videre, self.aktive er uendret
+
+    @asynccontextmanager
+    async def plass(self, prioritet=INTERAKTIV, modell=None):
+        if self.forvarm and self._forvarmer is None:
+            self._forvarmer = asyncio.create_task(self._forvarm_løkke())
+        start = time.monotonic()
+        await self._inn(prioritet, modell)
+        ventet = time.monotonic() - start
+        self.behandlet[prioritet] += 1
+        self.ventetid[prioritet] += ventet
+        self.maks_ventetid[prioritet] = max(self.maks_ventetid[prioritet], ventet)
+        if modell:
+            self._aktive_modeller[_basenavn(modell)] += 1
+            self._bruk.append((time.monotonic(), _basenavn(modell)))
+        try:
+            yield
+        finally:
+            if modell:
+                self._aktive_modeller[_basenavn(modell)] -= 1
+            self.sist_aktivitet = time.monotonic()
+            self._ut()
+
+    def keep_alive(self, modell):
+        """
+        Hvor lenge Ollama skal holde modellen etter dette kallet. Venter det bare kall til en
+        annen modell (og ingen andre bruker denne), slipper vi den straks så neste lasting går fortere.
+        """
+        navn = _basenavn(modell)
+        ventende = {_basenavn(k[1]) for k in self._kø if not k[3].done() and k[1]}
+        if ventende and navn not in ventende and self._aktive_modeller[navn] <= 1:
+            return 0
+        return KEEP_ALIVE.get(navn, STANDARD_KEEP_ALIVE)
+
+    def lastet(self, modell, load_duration_ns):
+        """Kalles med load_duration fra Ollama-svaret. Teller bytter og lastetid."""
+        navn = _basenavn(modell)
+        sekunder = (load_duration_ns or 0) / 1e9
+        if sekunder >= LAST_TERSKEL:
+            self.lastinger += 1
+            self.lastetid += sekunder
+            if self.resident and self.resident != navn:
+                self.bytter += 1
+                print(f"🔄 [Ollama] Byttet {self.resident} -> {navn} ({sekunder:.1f}s lasting)")
+        self.resident = navn
+
+    def sannsynlig_neste(self):
+        grense = time.monotonic() - BRUK_VINDU
+        while self._bruk and self._bruk[0][0] < grense:
+            self._bruk.popleft()
+        telling = Counter(m for _, m in self._bruk)
+        if not telling: return _basenavn(HOVEDMODELL)
+        return telling.most_common(1)[0][0]
+
+    async def _forvarm_løkke(self):
+        while True:
+            await asyncio.sleep(FORVARM_SJEKK)
+            try:
+                if self.aktive or self.i_kø(): continue
+                if time.monotonic() - self.sist_aktivitet < FORVARM_ETTER: continue
+                neste = self.sannsynlig_neste()
+                if neste == self.resident: continue
+                print(f"🔥 [Ollama] Stille periode. Forvarmer {neste} (sist lastet: {self.resident}).")
+                await self.forvarm(neste)
+                self.forvarminger += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ [Ollama] Forvarming feilet: {e}")
+
+    def i_kø(self, prioritet=None):
+        return sum(1 for p, _, _, f in self._kø if not f.done() and (prioritet is None or p == prioritet))
+
+    def status(self):
+        return {
+            "samtidige": self.samtidige,
+            "aktive": self.aktive,
+            "maks_kø": self.maks_kø,
+            "klasser": {
+                navn: {
+                    "i_kø": self.i_kø(p),
+                    "behandlet": self.behandlet[p],
+                    "snitt_ventetid_s": round(self.ventetid[p] / self.behandlet[p], 2) if self.behandlet[p] else 0.0,
+                    "maks_ventetid_s": round(self.maks_ventetid[p], 2)
+                }
+                for p, navn in PRIORITETSNAVN.items()
+            },
+            "residens": {
+                "lastet": self.resident,
+                "bytter": self.bytter,
+                "lastinger": self.lastinger,
+                "lastetid_s": round(self.lastetid, 1),
+                "forvarminger": self.forvarminger,
+                "neste": self.sannsynlig_neste()
+            }
+        }
+
+llm_planlegger = LLMPlanlegger()
+
+def llm_status():
+    """Kø-dybde og ventetider per prioritetsklasse, og hvilken modell som er lastet."""
+    return llm_planlegger.status()
+
+def _ollama_ferdig(m, model, data):
+    """Siste svar fra Ollama: tellere til loggen, load_duration til residens-sporingen."""
+    m.ollama(data)
+    llm_planlegger.lastet(model, data.get("load_duration"))
+
+async def ollama_lastede():
+    """Modellene Ollama har i minnet nå (/api/ps), eller None hvis serveren ikke svarer."""
+    try:
+        session = await ollama_sesjon()
+        async with session.get(f"{ollama_base()}/api/ps", timeout=aiohttp.ClientTimeout(total=5)) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+            return {_basenavn(m.get("name")) for m in data.get("models", [])}
+    except Exception:
+        return None
+
+async def ollama_forvarm(model):
+    """Laster modellen uten å generere noe (tom prompt), med lav prioritet."""
+    lastede = await ollama_lastede()
+    if lastede is not None and _basenavn(model) in lastede:
+        llm_planlegger.resident = _basenavn(model)
+        return
+    async with llm_planlegger.plass(BATCH, model):
+        session = await ollama_sesjon()
+        async with session.post(f"{ollama_base()}/api/generate", json={"model": model, "keep_alive": llm_planlegger.keep_alive(model), "options": _med_ctx(model, None)}) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+            llm_planlegger.lastet(model, data.get("load_duration"))
+
+llm_planlegger.forvarm = ollama_forvarm
+
+@samkjør
+async def ollama_generate(model, prompt, system=None, options=None, prioritet=INTERAKTIV):
+    """Ikke-strømmende /api/generate. Returnerer svarteksten, kaster ved feil."""
+    payload = {"model": model, "prompt": prompt, "stream": False}
+    if system: payload["system"] = system
+    payload["options"] = _med_ctx(model, options)
+    async with llm_planlegger.plass(prioritet, model):
+        payload["keep_alive"] = llm_planlegger.keep_alive(model)
+        with ai_logg.måling("ollama", model) as m:
+            session = await ollama_sesjon()
+            async with session.post(f"{ollama_base()}/api/generate", json=payload) as resp:
+                resp.raise_for_status()
+                data = await resp.json()
+                _ollama_ferdig(m, model, data)
+                return data['response']
+
+async def ollama_chat_stream(model, messages, options=None, prioritet=INTERAKTIV, ved_ferdig=None):
+    """
+    Strømmende /api/chat. Gir tekstbitene etter hvert som de kommer. Holder køplassen til strømmen er ferdig.
+    ved_ferdig(data) kalles med Ollama sitt siste svar (done=true) hvis strømmen gikk helt gjennom.
+    Kan kalleren avbryte underveis, må den lese med `async with aclosing(strøm)`, ellers holdes
+    køplassen og tilkoblingen til generatoren blir ryddet av GC.
+    """
+    payload = {"model": model, "messages": messages, "stream": True}
+    payload["options"] = _med_ctx(model, options)
+    async with llm_planlegger.plass(prioritet, model):
+        payload["keep_alive"] = llm_planlegger.keep_alive(model)
+        with ai_logg.måling("ollama", model) as m:
+            session = await ollama_sesjon()
+            async with session.post(f"{ollama_base()}/api/chat", json=payload, timeout=OLLAMA_STREAM_TIMEOUT) as resp:
+                resp.raise_for_status()
+                async for linje in resp.content:
+                    if not linje.strip(): continue
+                    del_svar = json.loads(linje)
+                    if del_svar.get("error"):
+                        raise RuntimeError(del_svar["error"])
+                    innhold = del_svar.get("message", {}).get("content", "")
+                    if innhold:
+                        m.første_token()
+                        yield innhold
+                    if del_svar.get("done"):
+                        _ollama_ferdig(m, model, del_svar)
+                        if ved_ferdig: ved_ferdig(del_svar)
+                        break
+
+async def ollama_generate_stream(model, prompt, system=None, options=None, prioritet=INTERAKTIV):
+    """Strømmende /api/generate. Som ollama_generate, men gir tekstbitene etter hvert."""
+    payload = {"model": model, "prompt": prompt, "stream": True}
+    if system: payload["system"] = system
+    payload["options"] = _med_ctx(model, options)
+    async with llm_planlegger.plass(prioritet, model):
+        payload["keep_alive"] = llm_planlegger.keep_alive(model)
+        with ai_logg.måling("ollama", model) as m:
+            session = await ollama_sesjon()
+            async with session.post(f"{ollama_base()}/api/generate", json=payload, timeout=OLLAMA_STREAM_TIMEOUT) as resp:
+                resp.raise_for_status()
+                async for linje in resp.content:
+                    if not linje.strip(): continue
+                    del_svar = json.loads(linje)
+                    if del_svar.get("error"):
+                        raise RuntimeError(del_svar["error"])
+                    if del_svar.get("response"):
+                        m.første_token()
+                        yield del_svar["response"]
+                    if del_svar.get("done"):
+                        _ollama_ferdig(m, model, del_svar)
+                        break
+
+# --- OLLAMA: CHAT-ØKTER (gjenbruk av KV-cache) ---
+# I de personlige ai-<navn>-kanalene, #kode-hjelp og RPG er hver melding en fortsettelse av
+# samtalen. Vi holder historikken per kanal og sender den med uendret prefiks (samme systemprompt,
+# samme tidligere turer), så Ollama gjenbruker KV-cachen for det den allerede har evaluert og bare
+# regner på den nye meldingen. Historikken kuttes i store jafs når den blir for lang, slik at
+# prefikset holder seg stabilt mange turer mellom hver gang cachen må bygges på nytt.
+ØKT_TIMEOUT = 1800.0   # sekunder uten aktivitet før økten glemmes (som keep_alive for command-r)
+MAKS_ØKTER = 50        # Flere kanaler enn dette: den minst brukte økten kastes
+# Historikken må få plass i num_ctx sammen med systemprompt, ny melding og svar, ellers kutter
+# Ollama starten stille og prefikset (og cachen) går tapt. Budsjettet regnes derfor ut per økt
+# fra num_ctx(modell), og svaret begrenses til ØKT_SVAR tokens (num_predict).
+ØKT_SVAR = int(os.getenv("CHAT_OKT_SVAR", "1024"))
+
+class _Økt:
+    def __init__(self, modell, system):
+        self.modell = modell
+        self.system = system
+        self.turer = []  # [brukermelding, svar, tokens]
+        self.tokens = 0
+        self.system_tokens = None  # Telles første gang økten brukes
+        self.sist_brukt = time.monotonic()
+
+class ChatØkter:
+    """Samtalehistorikk per kanal for /api/chat, med utløp ved inaktivitet og tak på minnebruk."""
+    def __init__(self, timeout=ØKT_TIMEOUT, maks=MAKS_ØKTER, svar=ØKT_SVAR):
+        self.timeout = timeout
+        self.maks = maks
+        self.svar = svar
+        self._økter = OrderedDict()
+        self.fortsatt = 0        # Kall som bygde videre på en eksisterende økt
+        self.nye = 0
+        self.kuttet = 0
+        self.prompt_evaluert = 0  # Prompt-tokens Ollama faktisk regnet på (prompt_eval_count)
+        self.historikk_sendt = 0  # Tokens historikk vi sendte med (kandidater for gjenbruk)
+
+    def _rydd(self):
+        grense = time.monotonic() - self.timeout
+        for nøkkel in [n for n, økt in self._økter.items() if økt.sist_brukt < grense]:
+            del self._økter[nøkkel]
+        while len(self._økter) > self.maks:
+            self._økter.popitem(last=False)
+
+    def hent(self, nøkkel, modell, system, tell=True):
+        """Økten for `nøkkel`. Starter på nytt hvis den er utløpt, eller modell/systemprompt er endret."""
+        self._rydd()
+        økt = self._økter.get(nøkkel)
+        if økt is None or økt.modell != modell or økt.system != system:
+            økt = self._økter[nøkkel] = _Økt(modell, system)
+            if tell: self.nye += 1
+        elif tell:
+            self.fortsatt += 1
+        self._økter.move_to_end(nøkkel)
+        økt.sist_brukt = time.monotonic()
+        return økt
+
+    def antall_turer(self, nøkkel, modell, system):
+        """Turer en ny melding ville bygd videre på (0 hvis økten er ny, utløpt eller endret)."""
+        self._rydd()
+        økt = self._økter.get(nøkkel)
+        if økt is None or økt.modell != modell or økt.system != system: return 0
+        return len(økt.turer)
+
+    def meldinger(self, økt, prompt):
+        meldinger = [{"role": "system", "content": økt.system}]
+        for bruker, svar, _ in økt.turer:
+            meldinger.append({"role": "user", "content": bruker})
+            meldinger.append({"role": "assistant", "content": svar})
+        meldinger.append({"role": "user", "content": prompt})
+        return meldinger
+
+    def budsjett(self, økt):
+        """Tokens historikk økten har plass til: num_ctx minus systemprompt og plass til svaret."""
+        return max(0, num_ctx(økt.modell) - (økt.system_tokens or 0) - self.svar)
+
+    def gi_plass(self, økt, ny=0):
+        """Kutter historikken hvis den (pluss `ny` tokens) ikke får plass i budsjettet."""
+        budsjett = self.budsjett(økt)
+        if økt.tokens + ny > budsjett:
+            # Ned til halve budsjettet på én gang, så slipper vi å flytte prefikset hver tur
+            while økt.turer and (økt.tokens > budsjett // 2 or økt.tokens + ny > budsjett):
+                økt.tokens -= økt.turer.pop(0)[2]
+            self.kuttet += 1
+
+    def husk(self, økt, prompt, svar, tokens):
+        økt.turer.append([prompt, svar, tokens])
+        økt.tokens += tokens
+        self.gi_plass(økt)
+        økt.sist_brukt = time.monotonic()
+
+    def glem(self, nøkkel):
+        self._økter.pop(nøkkel, None)
+
+    def status(self):
+        self._rydd()
+        kall = self.fortsatt + self.nye
+        return {
+            "økter": len(self._økter),
+            "turer": sum(len(økt.turer) for økt in self._økter.values()),
+            "historikk_tokens": sum(økt.tokens for økt in self._økter.values()),
+            "fortsatt": self.fortsatt,
+            "nye": self.nye,
+            "kuttet": self.kuttet,
+            "snitt_evaluert": round(self.prompt_evaluert / kall) if kall else 0,
+            "snitt_historikk": round(self.historikk_sendt / kall) if kall else 0,
+        }
+
+chat_økter = ChatØkter()
+
+async def _tell_system(økt):
+    if økt.system_tokens is None:
+        økt.system_tokens = await asyncio.to_thread(tell_tokens, økt.system, økt.modell)
+
+async def ollama_chat_økt(nøkkel, model, system_prompt, prompt, options=None, prioritet=INTERAKTIV):
+    """
+    Som ollama_chat_stream, men med historikken til økten `nøkkel` (f.eks. kanal-id) foran.
+    Turen lagres først når svaret er strømmet helt ferdig; avbrutte svar og feil glemmes.
+    """
+    økt = chat_økter.hent(nøkkel, model, system_prompt)
+    await _tell_system(økt)
+    # Historikk + ny melding må få plass i num_ctx før vi sender, ellers kutter Ollama starten
+    chat_økter.gi_plass(økt, await asyncio.to_thread(tell_tokens, prompt, model))
+    chat_økter.historikk_sendt += økt.tokens
+    options = dict(_med_ctx(model, options))
+    options.setdefault("num_predict", chat_økter.svar)
+    ferdig = {}
+    svar = ""
+    async with aclosing(ollama_chat_stream(model, chat_økter.meldinger(økt, prompt), options, prioritet, ved_ferdig=ferdig.update)) as strøm:
+        async for bit in strøm:
+            svar += bit
+            yield bit
+    chat_økter.prompt_evaluert += ferdig.get("prompt_eval_count") or 0
+    if ferdig and svar.strip():
+        tokens = await asyncio.to_thread(tell_tokens, prompt + "\n" + svar, model)
+        chat_økter.husk(økt, prompt, svar, tokens)
+
+async def husk_i_økt(nøkkel, model, system_prompt, prompt, svar):
+    """Legger en tur inn i økten uten å spørre modellen (f.eks. når svaret kom fra cache)."""
+    økt = chat_økter.hent(nøkkel, model, system_prompt, tell=False)
+    await _tell_system(økt)
+    tokens = await asyncio.to_thread(tell_tokens, prompt + "\n" + svar, model)
+    chat_økter.husk(økt, prompt, svar, tokens)
+
+def chat_økt_status():
+    return chat_økter.status()
+
+# --- SKY-KLIENTER (Google / OpenAI) ---
+# Lages én gang og gjenbrukes (egne connection-pools). Alle kall går via async-APIene,
+# så ingenting her blokkerer event-loopen.
+_gemini_klient = None
+_openai_klient = None
+
+def gemini_klient():
+    """Delt google-genai klient. Bruk gemini_klient().aio for async kall."""
+    global _gemini_klient
+    if _gemini_klient is None:
+        _gemini_klient = genai.Client(api_key=os.getenv("GEMINI_KEY"))
+    return _gemini_klient
+
+def openai_klient():
+    """Delt AsyncOpenAI-klient."""
+    global _openai_klient
+    if _openai_klient is None:
+        _openai_klient = AsyncOpenAI(api_key=os.getenv("OPENAI_KEY"))
+    return _openai_klient
+
+async def lukk_ai_klienter():
+    """Lukker delte HTTP-sesjoner og sky-klienter. Kalles ved nedstenging."""
+    global _ollama_sesjon, _gemini_klient, _openai_klient
+    if llm_planlegger._forvarmer is not None:
+        llm_planlegger._forvarmer.cancel()
+        llm_planlegger._forvarmer = None
+    if _ollama_sesjon is not None and not _ollama_sesjon.closed:
+        await _ollama_sesjon.close()
+    _ollama_sesjon = None
+    if _gemini_klient is not None:
+        try: await _gemini_klient.aio.aclose()
+        except Exception: pass
+        _gemini_klient = None
+    if _openai_klient is not None:
+        try: await _openai_klient.close()
+        except Exception: pass
+        _openai_klient = None
+    ai_logg.tøm()  # Ligger i SQLite-skrivekøen, som tømmes ved nedstenging
+
+# --- SVAR-CACHE (opt-in) ---
+# For prompts som i praksis er rene funksjoner (sjanger, navnesjekk, spill-gjenkjenning).
+# Kallstedet sender cache_ttl (sekunder) for å slå det på. SQLite (bot_data.db) overlever restart,
+# og en liten LRU i minnet foran gjør gjentatte treff nesten gratis.
+SVAR_CACHE_MAKS = 1000
+_svar_cache = OrderedDict()  # nøkkel -> (utløper, svar)
+
+def _cache_nøkkel(modell, system_prompt, prompt):
+    return hashlib.sha256(f"{modell}\0{system_prompt}\0{prompt}".encode("utf-8")).hexdigest()
+
+async def _fra_cache(nøkkel):
+    element = _svar_cache.get(nøkkel)
+    if element and element[0] > time.time():
+        _svar_cache.move_to_end(nøkkel)
+        return element[1]
+    try:
+        rad = await get_ai_cache(nøkkel)
+    except Exception:
+        return None  # Tabellen finnes ikke ennå (init_db ikke kjørt) e.l.
+    if rad:
+        _svar_cache[nøkkel] = (rad[1], rad[0])
+        return rad[0]
+    return None
+
+async def _til_cache(nøkkel, modell, svar, ttl):
+    _svar_cache[nøkkel] = (time.time() + ttl, svar)
+    _svar_cache.move_to_end(nøkkel)
+    while len(_svar_cache) > SVAR_CACHE_MAKS:
+        _svar_cache.popitem(last=False)
+    try:
+        await set_ai_cache(nøkkel, modell, svar, ttl)
+    except Exception as e:
+        print(f"⚠️ Kunne ikke lagre AI-svar i cache: {e}")
 
 # --- ALBERT / COMMAND-R (Lokal) ---
-async def ask_albert(prompt, context_text="", system_prompt=""):
+@samkjør
+async def ask_albert(prompt, context_text="", system_prompt="", prioritet=INTERAKTIV):
     """
     Sender forespørsel til lokal Ollama (Command-R).
     context_text bør være ferdig formatert fra utils.minne.hent().
     """
-    url = os.getenv("OLLAMA_URL")
+    url = f"{ollama_base()}/api/generate"
     
     instruks = (
         "Du er Albert. Bruk informasjonen under 'MINNE/KONTEKST' "
@@ -55,156 +640,490 @@ async def ask_albert(prompt, context_text="", system_prompt=""):
     )
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={"model": "command-r", "prompt": full_prompt, "stream": False}) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data['response']
-                return f"Albert feil: {resp.status}"
+        async with llm_planlegger.plass(prioritet, "command-r"):
+            with ai_logg.måling("ollama", "command-r") as m:
+                session = await ollama_sesjon()
+                payload = {"model": "command-r", "prompt": full_prompt, "stream": False, "keep_alive": llm_planlegger.keep_alive("command-r")}
+                async with session.post(url, json=payload) as resp:
+                    if resp.status == 200:
+                        data = await resp.json()
+                        _ollama_ferdig(m, "command-r", data)
+                        return data['response']
+                    m.feil()
+                    return f"Albert feil: {resp.status}"
     except Exception as e:
         return f"Ollama Error: {e}"
 
 # --- GEMINI TEKST (Google) ---
-async def ask_gemini(prompt, context_text="", system_prompt="", model="gemini-2.0-flash"):
+def _gemini_innhold(prompt, context_text, system_prompt):
+    return (
+        f"System Instruks: {system_prompt}\n\n"
+        f"RELEVANT KONTEKST:\n{context_text}\n\n"
+        f"Oppgave/Spørsmål: {prompt}"
+    )
+
+def _gemini_bruk(m, svar):
+    """Leser token-tellerne fra et Gemini-svar (eller siste bit av en strøm)."""
+    bruk = getattr(svar, "usage_metadata", None)
+    if bruk:
+        m.prompt_tokens = bruk.prompt_token_count or m.prompt_tokens
+        m.completion_tokens = bruk.candidates_token_count or m.completion_tokens
+
+@samkjør
+async def ask_gemini(prompt, context_text="", system_prompt="", model="gemini-2.0-flash", cache_ttl=None):
     """
-    Sender forespørsel til Google Gemini.
-    Kjører i tråd for å unngå å blokkere boten.
+    Sender forespørsel til Google Gemini (async, delt klient).
+    cache_ttl (sekunder) slår på svar-cachen for dette kallet.
     """
+    nøkkel = _cache_nøkkel(model, system_prompt, f"{context_text}\0{prompt}") if cache_ttl else None
+    if nøkkel:
+        svar = await _fra_cache(nøkkel)
+        if svar is not None: return svar
+
     try:
-        full_content = (
-            f"System Instruks: {system_prompt}\n\n"
-            f"RELEVANT KONTEKST:\n{context_text}\n\n"
-            f"Oppgave/Spørsmål: {prompt}"
-        )
-        
-        # Kjør det blokkerende kallet i en egen tråd så boten ikke fryser
-        response = await asyncio.to_thread(
-            _run_gemini_sync, 
-            os.getenv("GEMINI_KEY"), 
-            model, 
-            full_content
-        )
-        
-        # LOGG TIL SYSTEMET
-        try:
-            lagre(
-                tekst=f"Gemini forespørsel ({model})",
-                user="AI_Motor",
-                guild_id="API",
-                channel_id="Google",
-                kategori="Kostnad",
-                kilde="Auto"
-            )
-        except: pass
-        
-        return response.text
+        svar = await _gemini_generer(prompt, context_text, system_prompt, model)
+        if nøkkel and svar:
+            await _til_cache(nøkkel, model, svar, cache_ttl)
+        return svar
     except Exception as e: 
         return f"Gemini feil: {e}"
 
-# --- MISTRAL (Lokal) ---
-async def ask_mistral(prompt, context=[], system_prompt=""):
+async def _gemini_generer(prompt, context_text, system_prompt, model):
+    """Ett kall til Gemini. Kaster ved feil (ask_gemini gjør det om til en feilstreng)."""
+    with ai_logg.måling("gemini", model) as m:
+        response = await gemini_klient().aio.models.generate_content(
+            model=model,
+            contents=_gemini_innhold(prompt, context_text, system_prompt)
+        )
+        _gemini_bruk(m, response)
+    return response.text
+
+async def astream_gemini(prompt, context_text="", system_prompt="", model="gemini-2.0-flash"):
     """
-    Enkel Mistral-hjelper. Context kan være liste eller streng.
+    Som ask_gemini, men gir teksten bit for bit (async generator).
+    Feiler kallet før første bit, kommer "Gemini feil: ..." som eneste bit, akkurat som fra ask_gemini.
     """
-    url = os.getenv("OLLAMA_URL")
-    
+    fikk_noe = False
+    try:
+        with ai_logg.måling("gemini", model) as m:
+            strøm = await gemini_klient().aio.models.generate_content_stream(
+                model=model,
+                contents=_gemini_innhold(prompt, context_text, system_prompt)
+            )
+            async for bit in strøm:
+                _gemini_bruk(m, bit)
+                if bit.text:
+                    fikk_noe = True
+                    m.første_token()
+                    yield bit.text
+    except Exception as e:
+        if fikk_noe:
+            yield f"\n\n⚠️ (Gemini stoppet: {e})"
+        else:
+            yield f"Gemini feil: {e}"
+
+# --- GEMINI BATCH (rate-begrenset, parallelt) ---
+# For lange jobber med mange like kall (VOD-undertekster i biter på 20). Kallene går i parallell,
+# men en token-bøtte per modell holder oss under kvoten (delt mellom samtidige jobber), og
+# 429/5xx prøves på nytt med eksponentiell backoff og jitter i stedet for at hele jobben feiler.
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "15"))   # Kall per minutt. Gratisnivået for flash er 15
+GEMINI_BATCH_SAMTIDIGE = 4
+BATCH_FORSØK = 5
+BATCH_BACKOFF = 2.0        # sekunder før første nye forsøk, dobles for hvert forsøk
+BATCH_MAKS_BACKOFF = 60.0
+
+class TokenBøtte:
+    """Slipper gjennom `rpm` kall per minutt i snitt, med inntil `kapasitet` kall i ett rykk."""
+    def __init__(self, rpm, kapasitet=None):
+        self.sett_rate(rpm, kapasitet)
+        self.tokens = self.kapasitet
+        self.sist = time.monotonic()
+        self._lås = asyncio.Lock()
+
+    def sett_rate(self, rpm, kapasitet=None):
+        self.rpm = max(1, rpm)
+        self.kapasitet = kapasitet or max(1, self.rpm // 6)  # Ca. 10 sekunder med kall
+        if getattr(self, "tokens", 0) > self.kapasitet:
+            self.tokens = self.kapasitet
+
+    def _fyll(self):
+        nå = time.monotonic()
+        self.tokens = min(self.kapasitet, self.tokens + (nå - self.sist) * self.rpm / 60)
+        self.sist = nå
+
+    async def ta(self):
+        async with self._lås:  # Én venter om gangen, så bøtta deles ut i ankomstrekkefølge
+            self._fyll()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) * 60 / self.rpm)
+                self._fyll()
+            self.tokens -= 1
+
+_gemini_bøtter = {}
+
+def _gemini_bøtte(model, rpm):
+    bøtte = _gemini_bøtter.get(model)
+    if bøtte is None:
+        bøtte = _gemini_bøtter[model] = TokenBøtte(rpm)
+    elif bøtte.rpm != rpm:
+        bøtte.sett_rate(rpm)
+    return bøtte
+
+def _kan_prøves_igjen(feil):
+    if isinstance(feil, genai_errors.APIError):
+        return feil.code == 429 or (feil.code or 0) >= 500
+    # google-genai går over httpx: brutte tilkoblinger og lese-timeouts kommer som TransportError
+    return isinstance(feil, (asyncio.TimeoutError, ConnectionError, httpx.TransportError))
+
+async def ask_gemini_batch(prompts, context_text="", system_prompt="", model="gemini-2.0-flash",
+                           concurrency=GEMINI_BATCH_SAMTIDIGE, rpm=GEMINI_RPM, fremdrift=None):
+    """
+    Sender alle `prompts` til Gemini, maks `concurrency` samtidig og maks `rpm` kall per minutt.
+    Returnerer svarene i samme rekkefølge som promptene. Et kall som feiler for godt gir
+    "Gemini feil: ..." på sin plass, som ask_gemini, så resten av jobben ikke går tapt.
+    fremdrift(ferdige, totalt) kalles etter hvert svar (kan være async).
+    """
+    bøtte = _gemini_bøtte(model, rpm)
+    sluse = asyncio.Semaphore(max(1, concurrency))
+    svar = [None] * len(prompts)
+    ferdige = 0
+
+    async def én(i, prompt):
+        nonlocal ferdige
+        async with sluse:
+            for forsøk in range(BATCH_FORSØK):
+                await bøtte.ta()
+                try:
+                    svar[i] = await _gemini_generer(prompt, context_text, system_prompt, model)
+                    break
+                except Exception as e:
+                    if forsøk == BATCH_FORSØK - 1 or not _kan_prøves_igjen(e):
+                        svar[i] = f"Gemini feil: {e}"
+                        break
+                    pause = random.uniform(0, min(BATCH_MAKS_BACKOFF, BATCH_BACKOFF * 2 ** forsøk))
+                    print(f"⏳ [Gemini batch] Del {i + 1}/{len(prompts)} feilet ({e}). Nytt forsøk om {pause:.1f}s.")
+                    await asyncio.sleep(pause)
+        ferdige += 1
+        if fremdrift:
+            resultat = fremdrift(ferdige, len(prompts))
+            if inspect.isawaitable(resultat): await resultat
+
+    await asyncio.gather(*(én(i, p) for i, p in enumerate(prompts)))
+    return svar
+
+# --- MISTRAL (Lokal) ---
+def _mistral_prompt(prompt, context, system_prompt):
     if isinstance(context, list):
         history_txt = "\n".join(context)
     else:
         history_txt = context
+    return f"System: {system_prompt}\nKontekst:\n{history_txt}\n\nBruker: {prompt}"
 
-    full_prompt = f"System: {system_prompt}\nKontekst:\n{history_txt}\n\nBruker: {prompt}"
+@samkjør
+async def ask_mistral(prompt, context=[], system_prompt="", cache_ttl=None, prioritet=INTERAKTIV):
+    """
+    Enkel Mistral-hjelper. Context kan være liste eller streng.
+    cache_ttl (sekunder) slår på svar-cachen for dette kallet.
+    prioritet: INTERAKTIV / BAKGRUNN / BATCH (se LLMPlanlegger).
+    """
+    url = f"{ollama_base()}/api/generate"
+    full_prompt = _mistral_prompt(prompt, context, system_prompt)
+    nøkkel = _cache_nøkkel("mistral", "", full_prompt) if cache_ttl else None
+    if nøkkel:
+        svar = await _fra_cache(nøkkel)
+        if svar is not None: return svar
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={"model": "mistral", "prompt": full_prompt, "stream": False}) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data['response']
-                return f"Mistral feil: {resp.status}"
-    except: 
+        async with llm_planlegger.plass(prioritet, "mistral"):
+            with ai_logg.måling("ollama", "mistral") as m:
+                session = await ollama_sesjon()
+                payload = {"model": "mistral", "prompt": full_prompt, "stream": False, "keep_alive": llm_planlegger.keep_alive("mistral"),
+                           "options": _med_ctx("mistral", None)}
+                async with session.post(url, json=payload) as resp:
+                    if resp.status == 200:
+                        data = await resp.json()
+                        _ollama_ferdig(m, "mistral", data)
+                        if nøkkel:
+                            await _til_cache(nøkkel, "mistral", data['response'], cache_ttl)
+                        return data['response']
+                    m.feil()
+                    return f"Mistral feil: {resp.status}"
+    except Exception: 
         return "Mistral sover..."
 
+async def astream_mistral(prompt, context=[], system_prompt="", prioritet=INTERAKTIV):
+    """
+    Som ask_mistral, men gir teksten bit for bit (async generator).
+    Hvis Mistral ikke svarer før første bit, kommer "Mistral sover..." som eneste bit.
+    """
+    fikk_noe = False
+    try:
+        async with aclosing(ollama_generate_stream("mistral", _mistral_prompt(prompt, context, system_prompt), prioritet=prioritet)) as strøm:
+            async for bit in strøm:
+                fikk_noe = True
+                yield bit
+    except Exception as e:
+        if fikk_noe:
+            yield f"\n\n⚠️ (Mistral stoppet: {e})"
+        else:
+            yield "Mistral sover..."
+
 # --- CHATGPT (OpenAI) ---
-async def ask_openai(prompt, context_text="", system_prompt=""):
+@samkjør
+async def ask_openai(prompt, context_text="", system_prompt="", cache_ttl=None):
+    """cache_ttl (sekunder) slår på svar-cachen for dette kallet."""
+    nøkkel = _cache_nøkkel("gpt-4o-mini", system_prompt, f"{context_text}\0{prompt}") if cache_ttl else None
+    if nøkkel:
+        svar = await _fra_cache(nøkkel)
+        if svar is not None: return svar
+
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_KEY"))
         msgs = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Kontekst:\n{context_text}\n\nSpørsmål: {prompt}"}
         ]
-        # OpenAI-kall er også blokkerende, men vi lar det stå for nå (eller bruk to_thread her også hvis du vil)
-        res = client.chat.completions.create(model="gpt-4o-mini", messages=msgs)
+        with ai_logg.måling("openai", "gpt-4o-mini") as m:
+            res = await openai_klient().chat.completions.create(model="gpt-4o-mini", messages=msgs)
+            if res.usage:
+                m.prompt_tokens = res.usage.prompt_tokens
+                m.completion_tokens = res.usage.completion_tokens
         
-        # LOGG TIL SYSTEMET
-        try:
-            lagre(
-                tekst=f"OpenAI forespørsel (GPT-4o-mini)",
-                user="AI_Motor",
-                guild_id="API",
-                channel_id="OpenAI",
-                kategori="Kostnad",
-                kilde="Auto"
-            )
-        except: pass
-        
-        return res.choices[0].message.content
+        svar = res.choices[0].message.content
+        if nøkkel and svar:
+            await _til_cache(nøkkel, "gpt-4o-mini", svar, cache_ttl)
+        return svar
     except Exception as e: 
         return f"OpenAI feil: {e}"
 
+# --- RUTER (lokal vs sky, med hedging) ---
+# Holder rullerende latens og feilrate per backend. Primær-backenden får svare fram til sin
+# egen p95-latens; svarer den ikke innen da, sendes samme spørsmål også til neste backend,
+# og det første brukbare svaret vinner (taperen avbrytes). Backends med mange feil på rad
+# hoppes over en stund.
+FEILSVAR = ("Mistral feil", "Mistral sover", "Gemini feil", "OpenAI feil", "Albert feil", "Ollama Error")
+RUTER_VINDU = 50            # Antall kall latens/feilrate regnes over
+RUTER_MIN_MÅLINGER = 5      # Før dette brukes RUTER_STANDARD_HEDGE i stedet for p95
+RUTER_STANDARD_HEDGE = 20.0 # sekunder
+RUTER_MAKS_VENTETID = 120.0 # Ingen backend får henge lenger enn dette
+SYK_TERSKEL = 3             # Feil på rad før en backend regnes som syk
+SYK_PAUSE = 60.0            # sekunder den hoppes over
+
+def er_feilsvar(svar):
+    return not svar or svar.startswith(FEILSVAR)
+
+def _tekst_kontekst(context):
+    return "\n".join(context) if isinstance(context, list) else (context or "")
+
+BACKENDS = {
+    "mistral": lambda prompt, context, system_prompt, prioritet: ask_mistral(prompt, context=context, system_prompt=system_prompt, prioritet=prioritet),
+    "gemini": lambda prompt, context, system_prompt, prioritet: ask_gemini(prompt, context_text=_tekst_kontekst(context), system_prompt=system_prompt),
+    "openai": lambda prompt, context, system_prompt, prioritet: ask_openai(prompt, context_text=_tekst_kontekst(context), system_prompt=system_prompt),
+}
+
+class BackendHelse:
+    def __init__(self, navn):
+        self.navn = navn
+        self.latens = deque(maxlen=RUTER_VINDU)
+        self.utfall = deque(maxlen=RUTER_VINDU)  # True = ok, False = feil
+        self.feil_på_rad = 0
+        self.syk_siden = None
+        self.hedget = 0
+        self.vunnet = 0
+
+    def p95(self):
+        if len(self.latens) < RUTER_MIN_MÅLINGER:
+            return RUTER_STANDARD_HEDGE
+        sortert = sorted(self.latens)
+        return sortert[min(len(sortert) - 1, int(len(sortert) * 0.95))]
+
+    def frisk(self):
+        if self.syk_siden is None: return True
+        return time.monotonic() - self.syk_siden >= SYK_PAUSE  # Etter pausen får den en ny sjanse
+
+    def ok(self, sekunder):
+        self.latens.append(sekunder)
+        self.utfall.append(True)
+        self.feil_på_rad = 0
+        self.syk_siden = None
+
+    def feil(self):
+        self.utfall.append(False)
+        self.feil_på_rad += 1
+        if self.feil_på_rad >= SYK_TERSKEL:
+            if self.syk_siden is None:
+                print(f"🚑 [Ruter] {self.navn} har feilet {self.feil_på_rad} ganger på rad. Hopper over i {SYK_PAUSE:.0f}s.")
+            self.syk_siden = time.monotonic()
+
+    def status(self):
+        return {
+            "frisk": self.frisk(),
+            "p95_s": round(self.p95(), 2),
+            "feilrate": round(self.utfall.count(False) / len(self.utfall), 2) if self.utfall else 0.0,
+            "kall": len(self.utfall),
+            "hedget": self.hedget,
+            "vunnet": self.vunnet
+        }
+
+_helse = {navn: BackendHelse(navn) for navn in BACKENDS}
+
+def ruter_status():
+    return {navn: h.status() for navn, h in _helse.items()}
+
+async def _kall_backend(navn, prompt, context, system_prompt, prioritet):
+    """Kjører én backend og oppdaterer helsen. Returnerer svaret (eller feilstrengen)."""
+    helse = _helse[navn]
+    start = time.monotonic()
+    try:
+        svar = await asyncio.wait_for(BACKENDS[navn](prompt, context, system_prompt, prioritet), RUTER_MAKS_VENTETID)
+    except asyncio.TimeoutError:
+        svar = f"{navn.capitalize()} feil: ingen svar etter {RUTER_MAKS_VENTETID:.0f}s"
+    except Exception as e:
+        svar = f"{navn.capitalize()} feil: {e}"
+    if er_feilsvar(svar):
+        helse.feil()
+    else:
+        helse.ok(time.monotonic() - start)
+    return svar
+
+async def ruter_svar(prompt, context=[], system_prompt="", rekkefølge=("mistral", "gemini"), prioritet=INTERAKTIV, godta=None):
+    """
+    Spør backends i `rekkefølge` med hedging. godta(svar) -> bool kan avvise svar som ikke
+    er feil, men heller ikke brukbare (f.eks "JEG_VET_IKKE"); da går vi videre til neste.
+    Returnerer det første brukbare svaret, ellers det siste svaret vi fikk.
+    """
+    kandidater = [n for n in rekkefølge if _helse[n].frisk()] or list(rekkefølge)
+    brukbart = lambda svar: not er_feilsvar(svar) and (godta is None or godta(svar))
+
+    siste_svar = "Ingen AI svarte."
+    aktive = {}  # task -> navn
+    try:
+        for i, navn in enumerate(kandidater):
+            aktive[asyncio.create_task(_kall_backend(navn, prompt, context, system_prompt, prioritet))] = navn
+            if i > 0:
+                _helse[navn].hedget += 1
+            er_siste = i == len(kandidater) - 1
+            # Vent på den nyeste til dens p95, eller (for siste backend) til alle er ferdige
+            frist = None if er_siste else _helse[navn].p95()
+            while aktive:
+                ferdige, _ = await asyncio.wait(aktive, timeout=frist, return_when=asyncio.FIRST_COMPLETED)
+                if not ferdige:
+                    break  # Fristen gikk ut: start neste backend i tillegg (hedge)
+                for task in ferdige:
+                    vinner = aktive.pop(task)
+                    svar = task.result()
+                    siste_svar = svar
+                    if brukbart(svar):
+                        _helse[vinner].vunnet += 1
+                        return svar
+                if not er_siste:
+                    break  # Noen svarte ubrukelig: gå straks videre til neste backend
+        return siste_svar
+    finally:
+        for task in aktive:
+            task.cancel()
+
+def prometheus_ekstra():
+    """Kø- og ruter-tilstand i Prometheus-format. Brukes sammen med ai_logg.start_metrikk_server."""
+    kø = llm_status()
+    linjer = [
+        "# HELP albert_llm_queue_depth Kall som venter på lokal modell, per prioritetsklasse.",
+        "# TYPE albert_llm_queue_depth gauge",
+    ]
+    linjer += [f'albert_llm_queue_depth{{klasse="{navn}"}} {k["i_kø"]}' for navn, k in kø["klasser"].items()]
+    linjer += [
+        "# HELP albert_llm_active Kall som kjører mot lokal modell nå.",
+        "# TYPE albert_llm_active gauge",
+        f"albert_llm_active {kø['aktive']}",
+        "# HELP albert_ollama_model_swaps_total Ganger Ollama måtte bytte til en annen modell.",
+        "# TYPE albert_ollama_model_swaps_total counter",
+        f"albert_ollama_model_swaps_total {kø['residens']['bytter']}",
+        "# HELP albert_ollama_load_seconds_total Samlet tid brukt på å laste modeller.",
+        "# TYPE albert_ollama_load_seconds_total counter",
+        f"albert_ollama_load_seconds_total {kø['residens']['lastetid_s']}",
+        "# HELP albert_ollama_prewarms_total Forvarminger i stille perioder.",
+        "# TYPE albert_ollama_prewarms_total counter",
+        f"albert_ollama_prewarms_total {kø['residens']['forvarminger']}",
+        "# HELP albert_ollama_resident 1 for modellen vi tror er lastet.",
+        "# TYPE albert_ollama_resident gauge",
+        f'albert_ollama_resident{{model="{kø["residens"]["lastet"] or "ingen"}"}} 1',
+        "# HELP albert_backend_healthy 1 hvis ruteren regner backenden som frisk.",
+        "# TYPE albert_backend_healthy gauge",
+    ]
+    linjer += [f'albert_backend_healthy{{backend="{navn}"}} {int(h["frisk"])}' for navn, h in ruter_status().items()]
+    linjer += [
+        "# HELP albert_singleflight_coalesced_total Kall som ble slått sammen med et identisk kall underveis.",
+        "# TYPE albert_singleflight_coalesced_total counter",
+        f"albert_singleflight_coalesced_total {singleflight_stats['sammenslått']}",
+    ]
+    økter = chat_økt_status()
+    linjer += [
+        "# HELP albert_chat_sessions Aktive chat-økter (kanaler med historikk i minnet).",
+        "# TYPE albert_chat_sessions gauge",
+        f"albert_chat_sessions {økter['økter']}",
+        "# HELP albert_chat_session_history_tokens Tokens historikk holdt i chat-øktene.",
+        "# TYPE albert_chat_session_history_tokens gauge",
+        f"albert_chat_session_history_tokens {økter['historikk_tokens']}",
+        "# HELP albert_chat_session_prompt_eval_tokens_total Prompt-tokens Ollama regnet på i chat-økter.",
+        "# TYPE albert_chat_session_prompt_eval_tokens_total counter",
+        f"albert_chat_session_prompt_eval_tokens_total {chat_økter.prompt_evaluert}",
+        "# HELP albert_chat_session_history_sent_tokens_total Tokens historikk sendt med (gjenbrukbart prefiks).",
+        "# TYPE albert_chat_session_history_sent_tokens_total counter",
+        f"albert_chat_session_history_sent_tokens_total {chat_økter.historikk_sendt}",
+    ]
+    return "\n".join(linjer) + "\n"
+
 # --- BILDEGENERERING ---
+@samkjør
 async def generate_and_save_image(prompt, filename="./data/dagens_quiz.png"):
     """
     Genererer bilde med Imagen 3 via SDK (eller DALL-E 3 fallback).
     """
     # 1. Prøv Google Imagen 3 via SDK
     try:
-        response = await asyncio.to_thread(
-            _run_imagen_sync,
-            os.getenv("GEMINI_KEY"),
-            prompt
-        )
+        with ai_logg.måling("gemini", "imagen-3.0-generate-001") as m:
+            response = await gemini_klient().aio.models.generate_images(
+                model='imagen-3.0-generate-001',
+                prompt=prompt,
+                config=types.GenerateImagesConfig(
+                    number_of_images=1,
+                    include_rai_reason=True,
+                    output_mime_type="image/png"
+                )
+            )
+            m.enheter = len(response.generated_images or [])
+            if not m.enheter: m.feil()
         
         # Hent første bilde fra responsen
         if response.generated_images:
             image_bytes = response.generated_images[0].image.image_bytes
-            with open(filename, "wb") as f:
-                f.write(image_bytes)
-            
-            # Logg
-            try:
-                lagre("Genererte bilde (Imagen 3 SDK)", "AI_Motor", "API", "Google", "Bilde", "Auto")
-            except: pass
-            
+            await asyncio.to_thread(Path(filename).write_bytes, image_bytes)
             return filename
     except Exception as e:
         print(f"Imagen 3 feilet, prøver DALL-E. Feil: {e}")
 
     # 2. Fallback til DALL-E 3 hvis Gemini feiler
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_KEY"))
-        response = client.images.generate(model="dall-e-3", prompt=prompt, n=1)
+        with ai_logg.måling("openai", "dall-e-3") as m:
+            response = await openai_klient().images.generate(model="dall-e-3", prompt=prompt, n=1)
+            m.enheter = len(response.data)
         image_url = response.data[0].url
         async with aiohttp.ClientSession() as session:
             async with session.get(image_url) as resp:
                 if resp.status == 200:
-                    with open(filename, "wb") as f:
-                        f.write(await resp.read())
-                    
-                    # Logg
-                    try:
-                        lagre("Genererte bilde (DALL-E 3)", "AI_Motor", "API", "OpenAI", "Bilde", "Auto")
-                    except: pass
-                    
+                    await asyncio.to_thread(Path(filename).write_bytes, await resp.read())
                     return filename
     except: return None
 
 # --- TTS (OpenAI - for Quiz/Generelt) ---
+@samkjør
 async def generate_narrator_voice(text, filename="forteller.mp3"):
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_KEY"))
         if len(text) > 4000: text = text[:4000]
-        response = client.audio.speech.create(model="tts-1", voice="onyx", input=text)
-        response.stream_to_file(Path(filename))
+        with ai_logg.måling("openai", "tts-1") as m:
+            m.enheter = len(text)
+            async with openai_klient().audio.speech.with_streaming_response.create(
+                model="tts-1", voice="onyx", input=text
+            ) as response:
+                await response.stream_to_file(Path(filename))
         return filename
     except: return None
\ No newline at end of file
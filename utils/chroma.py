@@ -0,0 +1,190 @@
+import os
+import time
+import threading
+import chromadb
+
+# --- KONFIGURASJON ---
+# Felles ChromaDB-kobling for hele boten. Alle moduler henter samlinger herfra i stedet for
+# å lage sin egen HttpClient, så vi har én klient (ett HTTP-connection-pool) og null
+# nettverkskall ved import. Selve tilkoblingen skjer første gang en samling faktisk brukes.
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8081"))
+
+# Effektbryter: Etter BRYTER_TERSKEL tilkoblingsfeil på rad svarer vi "nede" umiddelbart
+# i BRYTER_PAUSE sekunder, i stedet for at hvert kall henger til det får timeout.
+BRYTER_TERSKEL = 3
+BRYTER_PAUSE = 30.0
+
+class ChromaUtilgjengelig(Exception):
+    """Kastes straks (uten nettverkskall) når minne-serveren er markert som nede."""
+
+class Effektbryter:
+    """Lukket -> åpen etter for mange feil -> halvåpen (ett prøvekall) -> lukket igjen."""
+    def __init__(self, terskel=BRYTER_TERSKEL, pause=BRYTER_PAUSE):
+        self.terskel = terskel
+        self.pause = pause
+        self._lås = threading.Lock()
+        self.feil_på_rad = 0
+        self.åpnet = None       # monotonic tidspunkt bryteren gikk, None = lukket
+        self._prøver = False    # et prøvekall er underveis (halvåpen)
+        self.antall_avvist = 0
+
+    @property
+    def tilstand(self):
+        with self._lås:
+            if self.åpnet is None: return "lukket"
+            if time.monotonic() - self.åpnet >= self.pause: return "halvåpen"
+            return "åpen"
+
+    def før_kall(self):
+        with self._lås:
+            if self.åpnet is None:
+                return
+            if time.monotonic() - self.åpnet >= self.pause and not self._prøver:
+                self._prøver = True  # Slipper gjennom ett kall for å sjekke om serveren er tilbake
+                return
+            self.antall_avvist += 1
+        raise ChromaUtilgjengelig(f"ChromaDB ({CHROMA_HOST}:{CHROMA_PORT}) er nede, prøver igjen om litt.")
+
+    def suksess(self):
+        with self._lås:
+            var_åpen = self.åpnet is not None
+            self.feil_på_rad = 0
+            self.åpnet = None
+            self._prøver = False
+        if var_åpen:
+            print("✅ ChromaDB svarer igjen. Effektbryteren er lukket.")
+
+    def uavklart(self):
+        """Kallet feilet av andre grunner enn nettverket. Teller verken som feil eller suksess."""
+        with self._lås:
+            self._prøver = False  # Neste kall får være prøvekallet
+
+    def feil(self):
+        with self._lås:
+            self.feil_på_rad += 1
+            if self._prøver or (self.åpnet is None and self.feil_på_rad >= self.terskel):
+                if self.åpnet is None:
+                    print(f"🔌 ChromaDB svarer ikke ({self.feil_på_rad} feil). Kobler ut i {self.pause:.0f}s.")
+                self.åpnet = time.monotonic()
+            self._prøver = False
+
+bryter = Effektbryter()
+
+_klient = None
+_samlinger = {}
+_lås = threading.Lock()
+
+def _er_tilkoblingsfeil(e):
+    """Nettverks-/timeoutfeil teller mot bryteren. Feil i selve spørringen gjør ikke det."""
+    if isinstance(e, (ConnectionError, TimeoutError, OSError)):
+        return True
+    modul = type(e).__module__ or ""
+    return modul.startswith(("httpx", "httpcore", "requests", "urllib3"))
+
+def _beskyttet(func, *args, **kwargs):
+    bryter.før_kall()
+    try:
+        svar = func(*args, **kwargs)
+    except Exception as e:
+        if _er_tilkoblingsfeil(e):
+            bryter.feil()
+        else:
+            bryter.uavklart()
+        raise
+    bryter.suksess()
+    return svar
+
+def _hent_klient():
+    global _klient
+    with _lås:
+        if _klient is not None:
+            return _klient
+    # HttpClient gjør et nettverkskall når den lages. Det skjer utenfor låsen, så en treg eller
+    # nede server ikke blokkerer samling()/sett_klient() i andre tråder. Vinneren publiseres under låsen.
+    print(f"🔌 Kobler til ChromaDB Server på {CHROMA_HOST}:{CHROMA_PORT}...")
+    try:
+        ny_klient = chromadb.HttpClient(
+            host=CHROMA_HOST,
+            port=CHROMA_PORT,
+            settings=chromadb.config.Settings(allow_reset=True, anonymized_telemetry=False)
+        )
+    except Exception as e:
+        # chromadb kaster ValueError("Could not connect ...") når serveren ikke svarer.
+        # Som ConnectionError teller den mot bryteren, og skrivinger går til journalen.
+        raise ConnectionError(f"Kunne ikke koble til ChromaDB på {CHROMA_HOST}:{CHROMA_PORT}: {e}") from e
+    with _lås:
+        if _klient is None:
+            _klient = ny_klient
+            print("✅ Tilkobling til minne-server opprettet.")
+        return _klient
+
+def sett_klient(ny_klient):
+    """
+    Bytter ut den delte klienten, f.eks med chromadb.EphemeralClient() i benchmark.
+    Alle stedfortredere (samling(...)) peker automatisk til den nye klienten.
+    """
+    global _klient
+    with _lås:
+        _klient = ny_klient
+        _samlinger.clear()
+
+def klient():
+    """Den delte HttpClient-en (kobler til første gang). Går via effektbryteren."""
+    return _beskyttet(_hent_klient)
+
+def _hent_samling(navn):
+    with _lås:
+        ekte = _samlinger.get(navn)
+    if ekte is None:
+        ekte = _hent_klient().get_or_create_collection(name=navn)
+        with _lås:
+            _samlinger[navn] = ekte
+    return ekte
+
+class Samling:
+    """
+    Stedfortreder for en Chroma-samling. Koster ingenting å lage; samlingen hentes
+    (og caches) ved første kall, og alle kall går gjennom effektbryteren.
+    """
+    def __init__(self, navn):
+        self.name = navn
+
+    def __getattr__(self, metode):
+        def kall(*args, **kwargs):
+            return _beskyttet(lambda: getattr(_hent_samling(self.name), metode)(*args, **kwargs))
+        return kall
+
+    def __repr__(self):
+        return f"<Samling {self.name}>"
+
+_stedfortredere = {}
+
+def samling(navn):
+    """Henter (lat) en navngitt samling. Samme objekt returneres for samme navn."""
+    with _lås:
+        s = _stedfortredere.get(navn)
+        if s is None:
+            s = _stedfortredere[navn] = Samling(navn)
+        return s
+
+def liste_samlinger():
+    """Navn på alle samlinger på serveren."""
+    return [getattr(c, "name", c) for c in _beskyttet(lambda: _hent_klient().list_collections())]
+
+def er_utilgjengelig(e):
+    """True hvis feilen betyr at serveren er nede (og ikke at selve kallet var feil)."""
+    return isinstance(e, ChromaUtilgjengelig) or _er_tilkoblingsfeil(e)
+
+def chroma_oppe():
+    """False mens bryteren er åpen. Halvåpen teller som oppe (neste kall er prøvekallet)."""
+    return bryter.tilstand != "åpen"
+
+def chroma_status():
+    return {
+        "tilstand": bryter.tilstand,
+        "feil_på_rad": bryter.feil_på_rad,
+        "avvist": bryter.antall_avvist,
+        "tilkoblet": _klient is not None,
+        "samlinger": len(_samlinger)
+    }
@@ -1,89 +1,100 @@
-import aiosqlite
-import os
 import json
+import time
+from utils.lagring import motor
 
 DB_FILE = "./data/bot_data.db"
+DB = "bot"
 
-async def init_db():
-    if not os.path.exists("./data"): os.makedirs("./data")
-    async with aiosqlite.connect(DB_FILE) as db:
-        # Tabell for Kalender-events
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS events (
-                dato TEXT, tittel TEXT, lagt_til_av TEXT
-            )
-        """)
-        # Tabell for Quiz (Global state)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS quiz_state (
-                id INTEGER PRIMARY KEY CHECK (id = 1),
-                answer TEXT, category TEXT, prompt TEXT, active INTEGER
-            )
-        """)
-        # Tabell for Quiz Poeng
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS quiz_scores (
-                user_id TEXT, score INTEGER, PRIMARY KEY (user_id)
-            )
-        """)
-        
-        # Tabell for aktive meldinger
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS active_quiz_messages (
-                guild_id TEXT, channel_id TEXT, message_id TEXT
-            )
-        """)
+SKJEMA = (
+    # Tabell for Kalender-events
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        dato TEXT, tittel TEXT, lagt_til_av TEXT
+    )
+    """,
+    # Tabell for Quiz (Global state)
+    """
+    CREATE TABLE IF NOT EXISTS quiz_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        answer TEXT, category TEXT, prompt TEXT, active INTEGER
+    )
+    """,
+    # Tabell for Quiz Poeng
+    """
+    CREATE TABLE IF NOT EXISTS quiz_scores (
+        user_id TEXT, score INTEGER, PRIMARY KEY (user_id)
+    )
+    """,
+    # Tabell for aktive meldinger
+    """
+    CREATE TABLE IF NOT EXISTS active_quiz_messages (
+        guild_id TEXT, channel_id TEXT, message_id TEXT
+    )
+    """,
+    # Cache for AI-svar på faste spørsmål (sjanger, navnesjekk osv). Se utils/ai_motor.py
+    """
+    CREATE TABLE IF NOT EXISTS ai_cache (
+        nøkkel TEXT PRIMARY KEY,
+        modell TEXT,
+        svar TEXT,
+        utløper REAL
+    )
+    """,
+    # NY: Tabell for å logge Albert sine AI-oppslag (valgfri, men nyttig)
+    """
+    CREATE TABLE IF NOT EXISTS bot_stats (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    """,
+)
+
+# Tilkoblinger, WAL og skrivekø håndteres av den felles motoren i utils/lagring.py
+motor.registrer(DB, DB_FILE, SKJEMA)
 
-        # NY: Tabell for å logge Albert sine AI-oppslag (valgfri, men nyttig)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS bot_stats (
-                key TEXT PRIMARY KEY,
-                value INTEGER
-            )
-        """)
-        
-        await db.commit()
+async def init_db():
+    """Lager tabellene (første skriving gjør det) og rydder utløpt AI-cache."""
+    await motor.skriv(DB, "DELETE FROM ai_cache WHERE utløper < ?", (time.time(),))
 
 # --- EVENTS ---
 async def add_event(dato, tittel, bruker):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("INSERT INTO events VALUES (?, ?, ?)", (dato, tittel, bruker))
-        await db.commit()
+    await motor.skriv(DB, "INSERT INTO events VALUES (?, ?, ?)", (dato, tittel, bruker))
 
 async def get_events(dato):
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.execute("SELECT tittel, lagt_til_av FROM events WHERE dato = ?", (dato,)) as cursor:
-            return await cursor.fetchall()
+    return await motor.les(DB, "SELECT tittel, lagt_til_av FROM events WHERE dato = ?", (dato,))
 
 # --- QUIZ STATE ---
 async def set_quiz_state(answer, category, prompt):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("INSERT OR REPLACE INTO quiz_state (id, answer, category, prompt, active) VALUES (1, ?, ?, ?, 1)", (answer, category, prompt))
-        await db.commit()
+    await motor.skriv(DB, "INSERT OR REPLACE INTO quiz_state (id, answer, category, prompt, active) VALUES (1, ?, ?, ?, 1)", (answer, category, prompt))
 
 async def get_quiz_state():
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.execute("SELECT answer, category, active FROM quiz_state WHERE id = 1") as cursor:
-            return await cursor.fetchone()
+    return await motor.les(DB, "SELECT answer, category, active FROM quiz_state WHERE id = 1", én=True)
 
 async def add_quiz_score(user_id):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("INSERT INTO quiz_scores (user_id, score) VALUES (?, 1) ON CONFLICT(user_id) DO UPDATE SET score = score + 1", (str(user_id),))
-        await db.commit()
+    await motor.skriv(DB, "INSERT INTO quiz_scores (user_id, score) VALUES (?, 1) ON CONFLICT(user_id) DO UPDATE SET score = score + 1", (str(user_id),))
 
 # --- QUIZ MELDINGS-LOGG ---
 async def log_quiz_message(guild_id, channel_id, message_id):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("INSERT INTO active_quiz_messages VALUES (?, ?, ?)", 
-                         (str(guild_id), str(channel_id), str(message_id)))
-        await db.commit()
+    await motor.skriv(DB, "INSERT INTO active_quiz_messages VALUES (?, ?, ?)", 
+                      (str(guild_id), str(channel_id), str(message_id)))
 
 async def get_active_quiz_messages():
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.execute("SELECT guild_id, channel_id, message_id FROM active_quiz_messages") as cursor:
-            return await cursor.fetchall()
+    return await motor.les(DB, "SELECT guild_id, channel_id, message_id FROM active_quiz_messages")
 
 async def clear_quiz_messages():
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("DELETE FROM active_quiz_messages")
-        await db.commit()
\ No newline at end of file
+    await motor.skriv(DB, "DELETE FROM active_quiz_messages")
+
+# --- AI-SVAR CACHE ---
+async def get_ai_cache(nøkkel):
+    """Returnerer (svar, utløper) eller None hvis ikke funnet / utløpt."""
+    rad = await motor.les(DB, "SELECT svar, utløper FROM ai_cache WHERE nøkkel = ?", (nøkkel,), én=True)
+    if rad and rad[1] > time.time():
+        return rad
+    return None
+
+async def set_ai_cache(nøkkel, modell, svar, ttl):
+    await motor.skriv(
+        DB,
+        "INSERT OR REPLACE INTO ai_cache (nøkkel, modell, svar, utløper) VALUES (?, ?, ?, ?)",
+        (nøkkel, modell, svar, time.time() + ttl)
+    )
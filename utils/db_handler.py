@@ -1,126 +1,200 @@
-import sqlite3
-import os
 import datetime
 import json
+from utils.lagring import motor
 
 DB_PATH = "./data/albert_stats.db"
+DB = "stats"
 
-def init_db():
-    """Oppretter databasen og tabeller hvis de ikke finnes."""
-    if not os.path.exists("./data"):
-        os.makedirs("./data")
-        
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+SKJEMA = (
     # 1. Hardware-profilering (Endret timestamp til TEXT for Python 3.12 kompatibilitet)
-    c.execute('''CREATE TABLE IF NOT EXISTS hardware_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT,
-                    temp REAL,
-                    ipc REAL,
-                    stalled_cycles REAL,
-                    load REAL
-                )''')
+    '''CREATE TABLE IF NOT EXISTS hardware_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        temp REAL,
+        ipc REAL,
+        stalled_cycles REAL,
+        load REAL
+    )''',
 
     # 2. AI-ytelse (token speed vs ressurser)
-    c.execute('''CREATE TABLE IF NOT EXISTS ai_performance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT,
-                    tokens_per_sec REAL,
-                    temp REAL,
-                    load REAL
-                )''')
+    '''CREATE TABLE IF NOT EXISTS ai_performance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        tokens_per_sec REAL,
+        temp REAL,
+        load REAL
+    )''',
 
     # 3. Game Tracker (Scoreboard)
-    c.execute('''CREATE TABLE IF NOT EXISTS game_tracker (
-                    user_id TEXT,
-                    server_id TEXT,
-                    game_name TEXT,
-                    duration_seconds INTEGER DEFAULT 0,
-                    PRIMARY KEY (user_id, server_id, game_name)
-                )''')
+    '''CREATE TABLE IF NOT EXISTS game_tracker (
+        user_id TEXT,
+        server_id TEXT,
+        game_name TEXT,
+        duration_seconds INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, server_id, game_name)
+    )''',
 
     # 4. Lagring av meldings-IDer for scoreboard-kanaler
-    c.execute('''CREATE TABLE IF NOT EXISTS scoreboard_settings (
-                    server_id TEXT PRIMARY KEY,
-                    channel_id TEXT,
-                    message_id TEXT
-                )''')
-    
-    conn.commit()
-    conn.close()
+    '''CREATE TABLE IF NOT EXISTS scoreboard_settings (
+        server_id TEXT PRIMARY KEY,
+        channel_id TEXT,
+        message_id TEXT
+    )''',
+
+    # 5. Telemetri fra minne.lagre() (kostnad, ytelse, terningkast osv.) - append-only
+    '''CREATE TABLE IF NOT EXISTS telemetri (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        kategori TEXT,
+        kilde TEXT,
+        user TEXT,
+        guild_id TEXT,
+        channel_id TEXT,
+        tekst TEXT
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_telemetri_kategori ON telemetri (kategori, timestamp)",
+
+    # 6. Ett rad per AI-kall fra utils/ai_motor.py (via utils/ai_logg.py)
+    '''CREATE TABLE IF NOT EXISTS ai_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        backend TEXT,
+        modell TEXT,
+        cog TEXT,
+        kommando TEXT,
+        status TEXT,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        ttft_ms REAL,
+        total_ms REAL,
+        eval_count INTEGER,
+        eval_duration_ms REAL,
+        prompt_eval_duration_ms REAL,
+        kostnad_usd REAL
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_ai_calls_tid ON ai_calls (timestamp)",
+)
+
+# Databasen opprettes første gang den brukes (felles motor i utils/lagring.py)
+motor.registrer(DB, DB_PATH, SKJEMA)
+
+async def init_db():
+    """Oppretter databasen og tabeller hvis de ikke finnes."""
+    await motor.utfør(DB, lambda conn: None)
 
 # --- HARDWARE & AI FUNKSJONER ---
 
-def log_hardware(temp, ipc, stalled, load):
+async def log_hardware(temp, ipc, stalled, load):
     """Logger hardware-stats til SQLite uten deprecation warnings."""
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
     # Bruker isoformat() for å unngå SQLite adapter-advarsler i Python 3.12
     timestamp = datetime.datetime.now().isoformat()
-    c.execute("INSERT INTO hardware_logs (timestamp, temp, ipc, stalled_cycles, load) VALUES (?, ?, ?, ?, ?)",
-              (timestamp, temp, ipc, stalled, load))
-    conn.commit(); conn.close()
+    await motor.skriv(DB, "INSERT INTO hardware_logs (timestamp, temp, ipc, stalled_cycles, load) VALUES (?, ?, ?, ?, ?)",
+                      (timestamp, temp, ipc, stalled, load))
 
-def get_latest_hw_logs(limit=10):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute("SELECT * FROM hardware_logs ORDER BY timestamp DESC LIMIT ?", (limit,))
-    rows = c.fetchall(); conn.close(); return rows
+async def get_latest_hw_logs(limit=10):
+    return await motor.les(DB, "SELECT * FROM hardware_logs ORDER BY timestamp DESC LIMIT ?", (limit,))
 
-def log_ai_performance(tps, temp, load):
+async def log_ai_performance(tps, temp, load):
     """Logger AI-ytelse til SQLite."""
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
     timestamp = datetime.datetime.now().isoformat()
-    c.execute("INSERT INTO ai_performance (timestamp, tokens_per_sec, temp, load) VALUES (?, ?, ?, ?)",
-              (timestamp, tps, temp, load))
-    conn.commit(); conn.close()
-
-def get_latest_ai_perf():
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute("SELECT tokens_per_sec, temp FROM ai_performance ORDER BY timestamp DESC LIMIT 1")
-    row = c.fetchone(); conn.close(); return row
+    await motor.skriv(DB, "INSERT INTO ai_performance (timestamp, tokens_per_sec, temp, load) VALUES (?, ?, ?, ?)",
+                      (timestamp, tps, temp, load))
+
+async def get_latest_ai_perf():
+    return await motor.les(DB, "SELECT tokens_per_sec, temp FROM ai_performance ORDER BY timestamp DESC LIMIT 1", én=True)
+
+# --- TELEMETRI ---
+
+def log_telemetri_batch(poster):
+    """
+    Skriver en batch telemetri-poster: liste av (tekst, metadata) fra minne.lagre().
+    Kalles fra minnets skrivetråd, så den legger batchen rett i skrivekøen uten å vente.
+    Returnerer en concurrent.futures.Future (kall .result() for å vente på commit).
+    """
+    rader = [(
+        datetime.datetime.fromtimestamp(meta.get("timestamp", 0)).isoformat(),
+        meta.get("kategori"), meta.get("kilde"), meta.get("user"),
+        meta.get("guild_id"), meta.get("channel_id"), tekst
+    ) for tekst, meta in poster]
+    return motor.send(DB, lambda conn: conn.executemany('''INSERT INTO telemetri (timestamp, kategori, kilde, user, guild_id, channel_id, tekst)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', rader).rowcount)
+
+async def get_latest_telemetri(kategori=None, limit=15):
+    if kategori:
+        return await motor.les(DB, "SELECT timestamp, kategori, user, tekst FROM telemetri WHERE kategori = ? ORDER BY id DESC LIMIT ?", (kategori, limit))
+    return await motor.les(DB, "SELECT timestamp, kategori, user, tekst FROM telemetri ORDER BY id DESC LIMIT ?", (limit,))
+
+_BRUKER_FILTER = "instr(lower(user), ?) > 0 OR instr(lower(tekst), ?) > 0"
+
+async def get_user_telemetri(user_name):
+    """Alle telemetri-rader som nevner brukeren (i user-feltet eller teksten). Brukes av !meg."""
+    navn = str(user_name).lower()
+    return await motor.les(DB, f"SELECT timestamp, kategori, kilde, user, guild_id, channel_id, tekst FROM telemetri WHERE {_BRUKER_FILTER} ORDER BY id", (navn, navn))
+
+async def delete_user_telemetri(user_name):
+    """Sletter brukerens telemetri-rader (samme utvalg som get_user_telemetri). Returnerer antall."""
+    navn = str(user_name).lower()
+    return await motor.skriv(DB, f"DELETE FROM telemetri WHERE {_BRUKER_FILTER}", (navn, navn))
+
+# --- AI-KALL ---
+
+def log_ai_calls_batch(poster):
+    """
+    Skriver en batch AI-kall (tupler fra utils/ai_logg.py, første felt er unix-tid).
+    Som log_telemetri_batch: legges i skrivekøen og returnerer en concurrent.futures.Future.
+    """
+    rader = [(datetime.datetime.fromtimestamp(p[0]).isoformat(),) + tuple(p[1:]) for p in poster]
+    return motor.send(DB, lambda conn: conn.executemany('''INSERT INTO ai_calls (timestamp, backend, modell, cog, kommando, status,
+                     prompt_tokens, completion_tokens, ttft_ms, total_ms,
+                     eval_count, eval_duration_ms, prompt_eval_duration_ms, kostnad_usd)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rader).rowcount)
+
+async def get_ai_stats(timer=24):
+    """
+    Oppsummering av AI-kall siste `timer` timer.
+    Returnerer (per_modell, per_cog): per_modell-rader er
+    (backend, modell, kall, feil, snitt_ms, maks_ms, snitt_ttft_ms, prompt_tokens, completion_tokens, kostnad, tokens_per_sek).
+    """
+    fra = (datetime.datetime.now() - datetime.timedelta(hours=timer)).isoformat()
+    per_modell = await motor.les(DB, '''SELECT backend, modell, COUNT(*), SUM(status != 'ok'),
+                        AVG(total_ms), MAX(total_ms), AVG(ttft_ms),
+                        SUM(prompt_tokens), SUM(completion_tokens), SUM(kostnad_usd),
+                        SUM(eval_count) * 1000.0 / NULLIF(SUM(eval_duration_ms), 0)
+                 FROM ai_calls WHERE timestamp >= ?
+                 GROUP BY backend, modell ORDER BY COUNT(*) DESC''', (fra,))
+    per_cog = await motor.les(DB, '''SELECT cog, kommando, COUNT(*), SUM(kostnad_usd), AVG(total_ms)
+                 FROM ai_calls WHERE timestamp >= ?
+                 GROUP BY cog, kommando ORDER BY COUNT(*) DESC LIMIT 10''', (fra,))
+    return per_modell, per_cog
 
 # --- GAME TRACKER FUNKSJONER ---
 
-def update_game_time(user_id, server_id, game_name, seconds):
+async def update_game_time(user_id, server_id, game_name, seconds):
     """Oppdaterer total spilletid for en bruker på en spesifikk server."""
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute('''INSERT INTO game_tracker (user_id, server_id, game_name, duration_seconds)
+    await motor.skriv(DB, '''INSERT INTO game_tracker (user_id, server_id, game_name, duration_seconds)
                  VALUES (?, ?, ?, ?)
                  ON CONFLICT(user_id, server_id, game_name) 
                  DO UPDATE SET duration_seconds = duration_seconds + ?''',
               (str(user_id), str(server_id), game_name, seconds, seconds))
-    conn.commit(); conn.close()
 
-def get_server_scoreboard(server_id):
+async def get_server_scoreboard(server_id):
     """Henter global toppliste for spill (summen av alle brukeres tid)."""
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute('''SELECT game_name, SUM(duration_seconds) as total_time
+    return await motor.les(DB, '''SELECT game_name, SUM(duration_seconds) as total_time
                  FROM game_tracker 
                  WHERE server_id = ? 
                  GROUP BY game_name
                  ORDER BY total_time DESC LIMIT 15''', (str(server_id),))
-    rows = c.fetchall(); conn.close(); return rows
 
-def get_personal_stats(user_id, server_id):
+async def get_personal_stats(user_id, server_id):
     """Henter topp 5 spill for en spesifikk bruker på en server."""
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute('''SELECT game_name, duration_seconds 
+    return await motor.les(DB, '''SELECT game_name, duration_seconds 
                  FROM game_tracker 
                  WHERE user_id = ? AND server_id = ? 
                  ORDER BY duration_seconds DESC LIMIT 5''', (str(user_id), str(server_id)))
-    rows = c.fetchall(); conn.close(); return rows
-
-def save_scoreboard_msg(server_id, channel_id, message_id):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO scoreboard_settings VALUES (?, ?, ?)", 
-              (str(server_id), str(channel_id), str(message_id)))
-    conn.commit(); conn.close()
 
-def get_scoreboard_msg(server_id):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute("SELECT channel_id, message_id FROM scoreboard_settings WHERE server_id = ?", (str(server_id),))
-    row = c.fetchone(); conn.close(); return row
+async def save_scoreboard_msg(server_id, channel_id, message_id):
+    await motor.skriv(DB, "INSERT OR REPLACE INTO scoreboard_settings VALUES (?, ?, ?)", 
+                      (str(server_id), str(channel_id), str(message_id)))
 
-# Initialiser databasen ved import
-init_db()
\ No newline at end of file
+async def get_scoreboard_msg(server_id):
+    return await motor.les(DB, "SELECT channel_id, message_id FROM scoreboard_settings WHERE server_id = ?", (str(server_id),), én=True)
@@ -0,0 +1,175 @@
+import os
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+
+# --- KONFIGURASJON ---
+# Felles embedding-lag for alle som skriver til Chroma.
+# Vi regner ut vektorene selv (batchvis, CPU) og cacher dem på innholds-hash,
+# så like tekster (kostnadslogger, guider som høstes på nytt osv.) bare embeddes én gang.
+CACHE_DB = "./data/embedding_cache.db"
+EMBED_BATCH = 32
+
+# Cachen skal ikke vokse uten grense: bare dokument-embeddings lagres (ikke engangs-spørringer),
+# og minst nylig brukte rader ryddes bort når tabellen blir for stor eller for gammel.
+MAKS_RADER = int(os.getenv("EMBEDDING_CACHE_MAKS", "200000"))
+MAKS_ALDER = 90 * 24 * 3600   # sekunder uten bruk før en rad kan ryddes
+RYDD_HVER = 1000              # nye rader mellom hver opprydding
+BERØR_ETTER = 24 * 3600       # sist_brukt oppdateres maks én gang i døgnet per rad (sparer skrivinger)
+
+# Standard er samme ONNX-modell som Chroma bruker (all-MiniLM-L6-v2), slik at nye
+# vektorer er kompatible med det som allerede ligger i samlingene.
+# Sett EMBEDDING_MODELL til et sentence-transformers-navn for å bytte (krever re-embedding).
+MODELL_NAVN = os.getenv("EMBEDDING_MODELL", "all-MiniLM-L6-v2")
+
+_modell = None
+_modell_lås = threading.Lock()
+_db = None
+_db_lås = threading.Lock()
+_nye_siden_rydding = 0
+
+stats = {"treff": 0, "bom": 0, "feil": 0, "ryddet": 0}
+
+def _hent_modell():
+    """Laster modellen første gang den trengs (tar noen sekunder)."""
+    global _modell
+    with _modell_lås:
+        if _modell is None:
+            if MODELL_NAVN == "all-MiniLM-L6-v2":
+                from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+                _modell = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+            else:
+                from sentence_transformers import SentenceTransformer
+                _modell = SentenceTransformer(MODELL_NAVN, device="cpu")
+            print(f"🧮 Embedding-modell lastet: {MODELL_NAVN}")
+        return _modell
+
+def _kjør_modell(tekster):
+    modell = _hent_modell()
+    if hasattr(modell, "encode"):
+        vektorer = modell.encode(tekster, batch_size=EMBED_BATCH, convert_to_numpy=True)
+    else:
+        vektorer = modell(tekster)
+    return [[float(x) for x in v] for v in vektorer]
+
+def _hent_db():
+    global _db
+    if _db is None:
+        if not os.path.exists("./data"): os.makedirs("./data")
+        _db = sqlite3.connect(CACHE_DB, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vektor BLOB, sist_brukt REAL)")
+        kolonner = {rad[1] for rad in _db.execute("PRAGMA table_info(embeddings)")}
+        if "sist_brukt" not in kolonner:
+            # Eldre cache-fil: regn eksisterende rader som brukt nå, så de ikke ryddes med en gang
+            _db.execute("ALTER TABLE embeddings ADD COLUMN sist_brukt REAL")
+            _db.execute("UPDATE embeddings SET sist_brukt = ?", (time.time(),))
+        _db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_sist_brukt ON embeddings (sist_brukt)")
+        _db.commit()
+        _rydd(_db)
+    return _db
+
+def _rydd(db):
+    """Sletter rader som ikke er brukt på MAKS_ALDER, og de minst nylig brukte over MAKS_RADER. Låsen holdes."""
+    slettet = db.execute("DELETE FROM embeddings WHERE sist_brukt < ?", (time.time() - MAKS_ALDER,)).rowcount
+    overskudd = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - MAKS_RADER
+    if overskudd > 0:
+        slettet += db.execute(
+            "DELETE FROM embeddings WHERE hash IN (SELECT hash FROM embeddings ORDER BY sist_brukt LIMIT ?)",
+            (overskudd,)
+        ).rowcount
+    db.commit()
+    if slettet:
+        stats["ryddet"] += slettet
+        print(f"🧹 Embedding-cache: ryddet {slettet} gamle rader.")
+
+def tekst_hash(tekst):
+    return hashlib.sha256(f"{MODELL_NAVN}\0{tekst}".encode("utf-8")).hexdigest()
+
+def _til_blob(vektor):
+    return array.array("f", vektor).tobytes()
+
+def _fra_blob(blob):
+    v = array.array("f")
+    v.frombytes(blob)
+    return v.tolist()
+
+def embed(tekster, lagre=True):
+    """
+    Returnerer en vektor per tekst (samme rekkefølge).
+    Slår opp i cachen først og regner bare ut de som mangler, i batcher.
+    lagre=False: nye vektorer skrives ikke til cachen (søkespørsmål og andre engangstekster).
+    """
+    global _nye_siden_rydding
+    tekster = [str(t) for t in tekster]
+    hashes = [tekst_hash(t) for t in tekster]
+    funnet = {}
+
+    unike = list(dict.fromkeys(hashes))
+    nå = time.time()
+    with _db_lås:
+        db = _hent_db()
+        berør = []
+        for i in range(0, len(unike), 500):
+            del_hashes = unike[i:i+500]
+            plass = ",".join("?" * len(del_hashes))
+            for h, blob, sist in db.execute(f"SELECT hash, vektor, sist_brukt FROM embeddings WHERE hash IN ({plass})", del_hashes):
+                funnet[h] = _fra_blob(blob)
+                if (sist or 0) < nå - BERØR_ETTER:
+                    berør.append((nå, h))
+        if berør:
+            db.executemany("UPDATE embeddings SET sist_brukt = ? WHERE hash = ?", berør)
+            db.commit()
+
+    mangler = {}
+    for h, t in zip(hashes, tekster):
+        if h not in funnet and h not in mangler:
+            mangler[h] = t
+    stats["treff"] += len(unike) - len(mangler)
+    stats["bom"] += len(mangler)
+
+    if mangler:
+        nye_hashes = list(mangler.keys())
+        nye_tekster = list(mangler.values())
+        for i in range(0, len(nye_tekster), EMBED_BATCH):
+            vektorer = _kjør_modell(nye_tekster[i:i+EMBED_BATCH])
+            for h, v in zip(nye_hashes[i:i+EMBED_BATCH], vektorer):
+                funnet[h] = v
+        if lagre:
+            with _db_lås:
+                db = _hent_db()
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (hash, vektor, sist_brukt) VALUES (?, ?, ?)",
+                    [(h, _til_blob(funnet[h]), nå) for h in nye_hashes]
+                )
+                db.commit()
+                _nye_siden_rydding += len(nye_hashes)
+                if _nye_siden_rydding >= RYDD_HVER:
+                    _nye_siden_rydding = 0
+                    _rydd(db)
+
+    return [funnet[h] for h in hashes]
+
+def skriv_til_samling(samling, documents, metadatas, ids, upsert=False):
+    """
+    add/upsert mot en Chroma-samling med ferdig utregnede (cachede) embeddings.
+    Hvis embedding-laget feiler, lar vi Chroma-klienten embedde som før.
+    """
+    metode = samling.upsert if upsert else samling.add
+    try:
+        vektorer = embed(documents)
+    except Exception as e:
+        stats["feil"] += 1
+        print(f"⚠️ Embedding-cache feilet, lar Chroma embedde selv: {e}")
+        return metode(documents=documents, metadatas=metadatas, ids=ids)
+    return metode(documents=documents, metadatas=metadatas, ids=ids, embeddings=vektorer)
+
+def embedding_statistikk():
+    totalt = stats["treff"] + stats["bom"]
+    return {
+        **stats,
+        "treffrate": round(stats["treff"] / totalt * 100, 1) if totalt else 0.0,
+        "modell": MODELL_NAVN
+    }
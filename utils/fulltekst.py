@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+import threading
+
+# --- KONFIGURASJON ---
+# Nøkkelord-indeks (SQLite FTS5 / BM25) som ligger ved siden av discord_memory i Chroma.
+# Vektorsøk bommer ofte på eksakte navn (spillere, items, tabelloverskrifter i bøker),
+# så hent() og søk_i_kilde() kjører begge søkene og fletter resultatene (se utils/minne.py).
+FTS_DB = "./data/minne_fts.db"
+MAKS_ORD = 16  # Lange spørsmål kortes ned, ellers blir OR-spørringen treg og upresis
+
+_db = None
+_db_lås = threading.Lock()
+
+def _hent_db():
+    global _db
+    if _db is None:
+        if not os.path.exists("./data"): os.makedirs("./data")
+        _db = sqlite3.connect(FTS_DB, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        # Bare teksten indekseres. Resten er med for filtrering og for å bygge svaret.
+        _db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS minne_fts USING fts5(
+                tekst,
+                doc_id UNINDEXED,
+                guild_id UNINDEXED,
+                channel_id UNINDEXED,
+                user UNINDEXED,
+                kategori UNINDEXED,
+                kilde UNINDEXED,
+                timestamp UNINDEXED,
+                tokenize = 'unicode61'
+            )
+        """)
+        # doc_id er UNINDEXED i FTS-tabellen, så sletting på id ville skannet hele indeksen.
+        # Denne tabellen peker fra doc_id til rowid, og slett() går via den.
+        ny = _db.execute("SELECT 1 FROM sqlite_master WHERE name = 'minne_fts_id'").fetchone() is None
+        _db.execute("CREATE TABLE IF NOT EXISTS minne_fts_id (doc_id TEXT PRIMARY KEY, rid INTEGER)")
+        if ny:
+            _db.execute("INSERT OR REPLACE INTO minne_fts_id (doc_id, rid) SELECT doc_id, rowid FROM minne_fts")
+        _db.commit()
+    return _db
+
+def _slett_rowids(db, doc_ids):
+    # Kalles med låsen holdt. Fjerner eksisterende rader for disse id-ene (via oppslagstabellen).
+    plass = ",".join("?" * len(doc_ids))
+    rids = [r[0] for r in db.execute(f"SELECT rid FROM minne_fts_id WHERE doc_id IN ({plass})", doc_ids)]
+    if rids:
+        db.execute(f"DELETE FROM minne_fts WHERE rowid IN ({','.join('?' * len(rids))})", rids)
+    db.execute(f"DELETE FROM minne_fts_id WHERE doc_id IN ({plass})", doc_ids)
+
+def _lag_spørring(tekst):
+    """Gjør fritekst om til en trygg FTS5-spørring: "ord1" OR "ord2" ..."""
+    ord_liste = list(dict.fromkeys(o for o in re.findall(r"\w+", str(tekst).lower()) if len(o) > 1))
+    if not ord_liste:
+        return None
+    return " OR ".join(f'"{o}"' for o in ord_liste[:MAKS_ORD])
+
+def indekser(poster):
+    """Legger til (doc_id, tekst, metadata) i indeksen. Kalles fra skrivetråden i minne.py."""
+    if not poster: return
+    rader = [(
+        str(tekst), str(doc_id),
+        str(meta.get("guild_id", "")), str(meta.get("channel_id", "")),
+        str(meta.get("user", "")), str(meta.get("kategori", "")),
+        str(meta.get("kilde", "")), meta.get("timestamp", 0)
+    ) for doc_id, tekst, meta in poster]
+    with _db_lås:
+        db = _hent_db()
+        # Samme id indeksert på nytt (journal-avspilling, upsert) erstatter den gamle raden
+        ider = list(dict.fromkeys(r[1] for r in rader))
+        for i in range(0, len(ider), 500):
+            _slett_rowids(db, ider[i:i+500])
+        for rad in rader:
+            rid = db.execute(
+                "INSERT INTO minne_fts (tekst, doc_id, guild_id, channel_id, user, kategori, kilde, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rad
+            ).lastrowid
+            db.execute("INSERT OR REPLACE INTO minne_fts_id (doc_id, rid) VALUES (?, ?)", (rad[1], rid))
+        db.commit()
+
+def søk(tekst, guild_ids, n=5, ekskluder_kategori=None, kun_kategori=None, kilde=None):
+    """
+    BM25-søk. Returnerer liste med (doc_id, tekst, metadata), beste treff først.
+    guild_ids er en liste (f.eks [guild, "GLOBAL"]).
+    """
+    spørring = _lag_spørring(tekst)
+    if not spørring: return []
+
+    sql = (
+        "SELECT doc_id, tekst, guild_id, channel_id, user, kategori, kilde, timestamp "
+        "FROM minne_fts WHERE minne_fts MATCH ?"
+    )
+    args = [spørring]
+    guild_ids = [str(g) for g in guild_ids]
+    sql += f" AND guild_id IN ({','.join('?' * len(guild_ids))})"
+    args += guild_ids
+    if ekskluder_kategori:
+        sql += " AND kategori != ?"
+        args.append(ekskluder_kategori)
+    if kun_kategori:
+        sql += " AND kategori = ?"
+        args.append(kun_kategori)
+    if kilde:
+        sql += " AND kilde = ?"
+        args.append(kilde)
+    sql += " ORDER BY bm25(minne_fts) LIMIT ?"
+    args.append(n)
+
+    with _db_lås:
+        rader = _hent_db().execute(sql, args).fetchall()
+
+    return [(
+        doc_id, tekst,
+        {"guild_id": g, "channel_id": c, "user": u, "kategori": k, "kilde": ki, "timestamp": ts}
+    ) for doc_id, tekst, g, c, u, k, ki, ts in rader]
+
+def slett(ids, batch=500):
+    """Fjerner dokumenter fra indeksen (samme id som i Chroma)."""
+    ids = [str(i) for i in ids]
+    with _db_lås:
+        db = _hent_db()
+        for i in range(0, len(ids), batch):
+            _slett_rowids(db, ids[i:i+batch])
+        db.commit()
+
+def slett_kategori(guild_id, kategori):
+    with _db_lås:
+        db = _hent_db()
+        db.execute(
+            "DELETE FROM minne_fts_id WHERE rid IN (SELECT rowid FROM minne_fts WHERE guild_id = ? AND kategori = ?)",
+            (str(guild_id), kategori)
+        )
+        db.execute("DELETE FROM minne_fts WHERE guild_id = ? AND kategori = ?", (str(guild_id), kategori))
+        db.commit()
+
+def tøm():
+    """Tømmer hele indeksen (brukes før full gjenoppbygging)."""
+    with _db_lås:
+        db = _hent_db()
+        db.execute("DELETE FROM minne_fts")
+        db.execute("DELETE FROM minne_fts_id")
+        db.commit()
+
+def antall():
+    with _db_lås:
+        # Oppslagstabellen har én rad per dokument og teller via primærnøkkelen (FTS-tabellen skannes)
+        return _hent_db().execute("SELECT COUNT(*) FROM minne_fts_id").fetchone()[0]
@@ -1,28 +1,28 @@
 import requests
 from bs4 import BeautifulSoup
 from duckduckgo_search import DDGS
-import chromadb
 import re
 import time
+import asyncio
 import hashlib
 import random
 from urllib.parse import urlparse, parse_qs
 from youtube_transcript_api import YouTubeTranscriptApi
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
+from utils.embedding import skriv_til_samling
+from utils.chroma import samling
+from utils.ai_motor import ask_gemini
 
 # Laster inn miljøvariabler fra .env
 load_dotenv()
 
 # --- KONFIGURASJON ---
-CHROMA_HOST = "localhost"
-CHROMA_PORT = 8081
-CHROMA_CLIENT = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
-GUIDE_COLLECTION = CHROMA_CLIENT.get_or_create_collection(name="game_guides")
+GUIDE_COLLECTION = samling("game_guides")
 
 # Henter nøkkel fra .env
 GEMINI_API_KEY = os.getenv("GEMINI_KEY")
+NAVNESJEKK_CACHE_TTL = 30 * 86400  # Samme skrivefeil -> samme tittel
 
 class GamingHarvester:
     def __init__(self):
@@ -30,9 +30,8 @@ class GamingHarvester:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
         
-        # Konfigurer Gemini
+        # Gemini-klienten deles med utils.ai_motor
         if GEMINI_API_KEY:
-            genai.configure(api_key=GEMINI_API_KEY)
             self.has_gemini = True
         else:
             self.has_gemini = False
@@ -83,7 +82,7 @@ class GamingHarvester:
         except Exception:
             return None
 
-    def autocorrect_game_name(self, raw_name):
+    async def autocorrect_game_name(self, raw_name):
         """
         Bruker Gemini til å finne korrekt, offisiell tittel.
         """
@@ -93,7 +92,6 @@ class GamingHarvester:
             return raw_name
 
         try:
-            model = genai.GenerativeModel('gemini-pro')
             prompt = f"""
             Task: Verify and standardize this video game title.
             Input: "{raw_name}"
@@ -104,8 +102,10 @@ class GamingHarvester:
             3. Do NOT assume it is a different game unless it is clearly a misspelling.
             4. Return ONLY the title.
             """
-            response = model.generate_content(prompt)
-            corrected = response.text.strip()
+            svar = await ask_gemini(prompt, cache_ttl=NAVNESJEKK_CACHE_TTL)
+            if not svar or svar.startswith("Gemini feil"):
+                raise RuntimeError(svar)
+            corrected = svar.strip()
             return corrected
         except Exception as e:
             print(f"[Harvester] ⚠️ Gemini feilet i navnesjekk: {e}")
@@ -138,7 +138,7 @@ class GamingHarvester:
 
     async def harvest_game(self, raw_input):
         # 1. AUTOKORREKTUR
-        game_name = self.autocorrect_game_name(raw_input)
+        game_name = await self.autocorrect_game_name(raw_input)
         
         if game_name.lower() != raw_input.lower():
             print(f"[Harvester] ✨ Endret navn fra '{raw_input}' -> '{game_name}'")
@@ -251,15 +251,19 @@ class GamingHarvester:
                     
                     is_nordic = any(x in url for x in [".no", ".se", ".dk", "gamer.no", "tek.no", "sweclockers", "pressfire"])
                     
-                    GUIDE_COLLECTION.upsert(
+                    # Embedding (og første modell-lasting) + Chroma-kallet kjøres utenfor event-loopen
+                    await asyncio.to_thread(
+                        skriv_til_samling,
+                        GUIDE_COLLECTION,
                         ids=[doc_id],
                         documents=[raw_content],
-                        metadatas={
+                        metadatas=[{
                             "game": game_name, 
                             "source": url, 
                             "timestamp": str(time.time()),
                             "lang": "no" if is_nordic else "en"
-                        }
+                        }],
+                        upsert=True
                     )
                     sources_found += 1
                     print(f"   ✅ Lagret ({dom}) - Lengde: {len(raw_content)}")
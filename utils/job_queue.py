@@ -1,15 +1,8 @@
 import asyncio
 import time
 import datetime
-import chromadb
 import statistics
-
-# --- KONFIGURASJON ---
-# Vi kobler nå til serveren som kjører i bakgrunnen
-# Dette hindrer "Database Locked" feil
-CHROMA_HOST = 'localhost'
-# Endret fra 8000 til 8081 for å matche Docker-containeren
-CHROMA_PORT = 8081
+from utils.chroma import samling
 
 class JobQueue:
     def __init__(self):
@@ -17,11 +10,8 @@ class JobQueue:
         self.is_processing = False
         self.current_job = None
         
-        # --- ENDRING: SERVER KOBLING ---
-        # Bruker HttpClient mot systemd-tjenesten din
-        print(f"[KØ] 🔌 Kobler til ChromaDB på port {CHROMA_PORT}...")
-        self.chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
-        self.log_collection = self.chroma_client.get_or_create_collection(name="system_logs")
+        # Felles ChromaDB-klient (utils/chroma.py), kobler til ved første logging
+        self.log_collection = samling("system_logs")
         
         # Start arbeideren
         asyncio.create_task(self.worker())
@@ -0,0 +1,124 @@
+import os
+import json
+import shutil
+import struct
+import threading
+from contextlib import contextmanager
+
+# --- KONFIGURASJON ---
+# Lokal skrive-journal for minner (og feillogger) som ikke kom inn i ChromaDB fordi serveren
+# var nede. Append-only fil med lengde-prefiksede poster (4 byte lengde + JSON), fsync per skriving.
+# Skrivetråden i utils/minne.py spiller journalen av i bulk når serveren svarer igjen.
+JOURNAL_FIL = "./data/minne_journal.bin"
+AVSPILL_FIL = JOURNAL_FIL + ".spilles"  # Øyeblikksbilde som er under avspilling
+KARANTENE_FIL = JOURNAL_FIL + ".karantene"  # Poster ChromaDB avviser gang på gang (ikke nettverksfeil)
+
+_HODE = struct.Struct(">I")
+_lås = threading.Lock()
+# Avspillingen har postene fra ta_ut() i minnet. fjern() må derfor vente på batchen som skrives nå,
+# og id-ene den fjerner huskes, så avspilleren hopper over dem i resten av runden.
+_avspill_lås = threading.Lock()
+_fjernet_under_avspilling = set()
+
+def skriv(poster):
+    """Legger poster i journalen. Hver post er (mål, dokument, metadata, id), mål = "minne"/"logg"."""
+    if not poster: return
+    if not os.path.exists("./data"): os.makedirs("./data")
+    with _lås:
+        with open(JOURNAL_FIL, "ab") as f:
+            for post in poster:
+                data = json.dumps(list(post), ensure_ascii=False).encode("utf-8")
+                f.write(_HODE.pack(len(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+
+def _les(sti):
+    """Leser alle hele poster. En halvskrevet post på slutten (krasj midt i skriving) hoppes over."""
+    poster = []
+    if not os.path.exists(sti): return poster
+    with open(sti, "rb") as f:
+        while True:
+            hode = f.read(_HODE.size)
+            if len(hode) < _HODE.size: break
+            (lengde,) = _HODE.unpack(hode)
+            data = f.read(lengde)
+            if len(data) < lengde: break
+            poster.append(tuple(json.loads(data.decode("utf-8"))))
+    return poster
+
+def ta_ut():
+    """
+    Flytter journalen over i avspillingsfilen og returnerer alle poster som venter.
+    Nye skrivinger går til en ny journalfil mens avspillingen pågår.
+    Rester fra en avbrutt avspilling er med først.
+    """
+    with _avspill_lås, _lås:
+        _fjernet_under_avspilling.clear()
+        if os.path.exists(JOURNAL_FIL):
+            if os.path.exists(AVSPILL_FIL):
+                with open(JOURNAL_FIL, "rb") as inn, open(AVSPILL_FIL, "ab") as ut:
+                    shutil.copyfileobj(inn, ut)
+                os.remove(JOURNAL_FIL)
+            else:
+                os.replace(JOURNAL_FIL, AVSPILL_FIL)
+        return _les(AVSPILL_FIL)
+
+@contextmanager
+def avspiller():
+    """
+    Holdes mens én batch fra ta_ut() skrives til ChromaDB. Gir id-ene som er fjernet siden ta_ut(),
+    så de kan filtreres bort. fjern() venter til batchen er ferdig.
+    """
+    with _avspill_lås:
+        yield frozenset(_fjernet_under_avspilling)
+
+def karantene(poster):
+    """Flytter poster fra avspillingsfilen til karantenefilen (kalles fra avspilleren)."""
+    if not poster: return
+    ider = {p[3] for p in poster}
+    with _lås:
+        with open(KARANTENE_FIL, "ab") as f:
+            for post in poster:
+                data = json.dumps(list(post), ensure_ascii=False).encode("utf-8")
+                f.write(_HODE.pack(len(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+        _skriv_om(AVSPILL_FIL, [p for p in _les(AVSPILL_FIL) if p[3] not in ider])
+
+def ferdig():
+    """Kalles når alt fra ta_ut() er trygt skrevet til ChromaDB."""
+    with _lås:
+        if os.path.exists(AVSPILL_FIL):
+            os.remove(AVSPILL_FIL)
+
+def _skriv_om(sti, poster):
+    # Kalles med låsen holdt. Skriver filen på nytt via en midlertidig fil (atomisk bytte).
+    tmp = sti + ".tmp"
+    with open(tmp, "wb") as f:
+        for post in poster:
+            data = json.dumps(list(post), ensure_ascii=False).encode("utf-8")
+            f.write(_HODE.pack(len(data)) + data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, sti)
+
+def fjern(hvor):
+    """Fjerner alle poster der hvor(post) er sann (f.eks. ved !slett_meg). Returnerer de fjernede postene."""
+    fjernet = []
+    with _avspill_lås, _lås:
+        for sti in (AVSPILL_FIL, JOURNAL_FIL):
+            poster = _les(sti)
+            behold = [p for p in poster if not hvor(p)]
+            if len(behold) < len(poster):
+                fjernet += [p for p in poster if hvor(p)]
+                _skriv_om(sti, behold)
+        _fjernet_under_avspilling.update(p[3] for p in fjernet)
+    return fjernet
+
+def ventende():
+    """Billig sjekk (ingen lesing) på om det ligger noe i journalen."""
+    return any(os.path.exists(sti) and os.path.getsize(sti) > 0 for sti in (JOURNAL_FIL, AVSPILL_FIL))
+
+def antall():
+    with _lås:
+        return len(_les(AVSPILL_FIL)) + len(_les(JOURNAL_FIL))
@@ -0,0 +1,108 @@
+import os
+import math
+import asyncio
+import threading
+
+# --- KONFIGURASJON ---
+# Felles kontekst-pakker: tar rangerte tekstbiter (viktigst først) og fyller et token-budsjett
+# per modell, med ekte token-telling der vi har tokenizeren. Prompt-evaluering på den lokale
+# command-r-modellen er det som tar tid, så vi sender heller færre hele biter enn mye halvt.
+
+# Hvor mye KONTEKST vi sender per modell (ikke modellens maks vindu). Kan overstyres per kall.
+BUDSJETT = {
+    "command-r": 6000,     # av num_ctx 8192
+    "mistral": 2500,       # num_ctx er 4096 (NUM_CTX i ai_motor.py); resten går til spørsmål og svar
+    "gemini-2.0-flash": 30000,
+    "gemini-1.5-flash": 30000,
+    "gpt-4o-mini": 20000,
+}
+STANDARD_BUDSJETT = 4000
+
+# Hugging Face-tokenizere for lokale modeller (krever tilgang til repoet; ellers brukes anslag)
+TOKENIZERE = {
+    "command-r": os.getenv("TOKENIZER_COMMAND_R", "CohereForAI/c4ai-command-r-v01"),
+    "mistral": os.getenv("TOKENIZER_MISTRAL", "mistralai/Mistral-7B-Instruct-v0.3"),
+}
+TEGN_PER_TOKEN = 3.5  # Anslag når vi ikke har tokenizer. Litt lavt med vilje (norsk gir flere tokens)
+MIN_REST = 50         # Mindre rest enn dette er ikke verdt en avkuttet bit
+
+_tokenizere = {}
+_lås = threading.Lock()
+
+def _tokenizer(modell):
+    """Laster tokenizeren første gang (kan ta noen sekunder). None hvis den ikke finnes/ikke kan lastes."""
+    navn = TOKENIZERE.get((modell or "").split(":")[0])
+    if not navn: return None
+    with _lås:
+        if navn not in _tokenizere:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizere[navn] = AutoTokenizer.from_pretrained(navn)
+                print(f"🔢 Tokenizer lastet: {navn}")
+            except Exception as e:
+                _tokenizere[navn] = None
+                print(f"⚠️ Fant ikke tokenizer {navn} ({e}). Bruker anslag på tokens.")
+        return _tokenizere[navn]
+
+def tell_tokens(tekst, modell=None):
+    if not tekst: return 0
+    tok = _tokenizer(modell)
+    if tok is None:
+        return math.ceil(len(tekst) / TEGN_PER_TOKEN)
+    return len(tok.encode(tekst, add_special_tokens=False))
+
+def kutt(tekst, modell=None, budsjett=None, fra_slutten=False):
+    """Kutter én tekst til maks `budsjett` tokens. fra_slutten=True beholder slutten i stedet."""
+    budsjett = budsjett or BUDSJETT.get(modell, STANDARD_BUDSJETT)
+    if tell_tokens(tekst, modell) <= budsjett: return tekst
+    tok = _tokenizer(modell)
+    if tok is None:
+        maks = int(budsjett * TEGN_PER_TOKEN)
+        return tekst[-maks:] if fra_slutten else tekst[:maks]
+    ider = tok.encode(tekst, add_special_tokens=False)
+    ider = ider[-budsjett:] if fra_slutten else ider[:budsjett]
+    return tok.decode(ider)
+
+def del_opp(tekst, modell=None, budsjett=None):
+    """Deler én tekst i biter på maks `budsjett` tokens hver (for tekster som ikke får plass hele)."""
+    budsjett = budsjett or BUDSJETT.get(modell, STANDARD_BUDSJETT)
+    if tell_tokens(tekst, modell) <= budsjett: return [tekst]
+    tok = _tokenizer(modell)
+    if tok is None:
+        maks = max(1, int(budsjett * TEGN_PER_TOKEN))
+        return [tekst[i:i + maks] for i in range(0, len(tekst), maks)]
+    ider = tok.encode(tekst, add_special_tokens=False)
+    return [tok.decode(ider[i:i + budsjett]) for i in range(0, len(ider), budsjett)]
+
+def pakk(biter, modell=None, budsjett=None, skille="\n", fra_slutten=False, kutt_siste=False):
+    """
+    Fyller budsjettet grådig med `biter` i rangert rekkefølge (viktigst først). Biter som ikke
+    får plass hoppes over, men mindre biter lenger ned kan fortsatt komme med.
+    fra_slutten=True: siste bit er viktigst (chatlogg/historikk), men rekkefølgen i svaret beholdes.
+    kutt_siste=True: første bit som ikke får plass kuttes til resten av budsjettet i stedet for å hoppes over.
+    """
+    budsjett = budsjett or BUDSJETT.get(modell, STANDARD_BUDSJETT)
+    biter = [b for b in biter if b]
+    rekkefølge = range(len(biter) - 1, -1, -1) if fra_slutten else range(len(biter))
+    skille_tokens = tell_tokens(skille, modell) if skille.strip() else 0
+
+    valgt = {}
+    brukt = 0
+    for i in rekkefølge:
+        kostnad = tell_tokens(biter[i], modell) + (skille_tokens if valgt else 0)
+        if brukt + kostnad <= budsjett:
+            valgt[i] = biter[i]
+            brukt += kostnad
+        elif kutt_siste:
+            rest = budsjett - brukt - (skille_tokens if valgt else 0)
+            if rest >= MIN_REST:
+                valgt[i] = kutt(biter[i], modell, rest, fra_slutten=fra_slutten)
+            break
+    return skille.join(valgt[i] for i in sorted(valgt))
+
+async def apakk(*args, **kwargs):
+    """pakk() utenfor event-loopen (første kall kan laste tokenizeren)."""
+    return await asyncio.to_thread(pakk, *args, **kwargs)
+
+async def akutt(*args, **kwargs):
+    return await asyncio.to_thread(kutt, *args, **kwargs)
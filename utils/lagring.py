@@ -0,0 +1,216 @@
+import os
+import queue
+import atexit
+import sqlite3
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# --- KONFIGURASJON ---
+# Felles SQLite-motor for bot_data.db (utils/database.py) og albert_stats.db (utils/db_handler.py).
+# Før åpnet hvert kall en ny tilkobling, og db_handler skrev blokkerende rett fra event-loopen.
+# Nå har hver database faste tilkoblinger i WAL-modus:
+#  - Én skrivetråd eier skrivetilkoblingene. Alt som ligger i køen når den våkner, skrives i
+#    én transaksjon (gruppe-commit), med et savepoint per jobb så én feil ikke velter resten.
+#  - En liten trådpool med egne lese-tilkoblinger, som i WAL ikke venter på skriveren.
+# Async-kode venter på resultatet uten å blokkere loopen. Tråder kan bruke send() direkte.
+LESERE = 3
+MAKS_BATCH = 200          # jobber per transaksjon
+BUSY_TIMEOUT_MS = 5000
+
+PRAGMAER = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",       # Trygt i WAL: mister i verste fall siste commit ved strømbrudd
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",        # ca. 16 MB sidecache per tilkobling
+    "PRAGMA mmap_size=67108864",
+)
+
+_STOPP = object()
+
+class Lagringsmotor:
+    def __init__(self, lesere=LESERE, maks_batch=MAKS_BATCH):
+        self.maks_batch = maks_batch
+        self._databaser = {}   # navn -> (sti, skjema)
+        self._klare = set()
+        self._klar_lås = threading.Lock()
+        self._kø = queue.Queue()
+        self._skriver = None
+        self._skriver_lås = threading.Lock()
+        self._lesepool = ThreadPoolExecutor(max_workers=lesere, thread_name_prefix="sqlite-les")
+        self._lokal = threading.local()
+        self._lesetilkoblinger = []
+        self.stats = {"jobber": 0, "transaksjoner": 0, "feil": 0, "lesinger": 0}
+
+    def registrer(self, navn, sti, skjema=()):
+        """Melder inn en database. Skjemaet (CREATE ... IF NOT EXISTS) kjøres første gang den brukes."""
+        self._databaser[navn] = (sti, tuple(skjema))
+
+    # --- TILKOBLINGER ---
+    def _koble(self, navn):
+        sti, _ = self._databaser[navn]
+        mappe = os.path.dirname(sti)
+        if mappe and not os.path.exists(mappe): os.makedirs(mappe)
+        conn = sqlite3.connect(sti, isolation_level=None, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+        for pragma in PRAGMAER:
+            conn.execute(pragma)
+        return conn
+
+    def _klar(self, navn):
+        """Lager tabellene før første lesing/skriving (fra skrivetråden eller en lesetråd, aldri loopen)."""
+        if navn in self._klare: return
+        with self._klar_lås:
+            if navn in self._klare: return
+            conn = self._koble(navn)
+            try:
+                conn.execute("BEGIN")
+                for sql in self._databaser[navn][1]:
+                    conn.execute(sql)
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            self._klare.add(navn)
+
+    def _lesetilkobling(self, navn):
+        tilkoblinger = getattr(self._lokal, "tilkoblinger", None)
+        if tilkoblinger is None:
+            tilkoblinger = self._lokal.tilkoblinger = {}
+        if navn not in tilkoblinger:
+            self._klar(navn)
+            conn = self._koble(navn)
+            conn.execute("PRAGMA query_only=ON")
+            tilkoblinger[navn] = conn
+            self._lesetilkoblinger.append(conn)
+        return tilkoblinger[navn]
+
+    # --- SKRIVING ---
+    def _start_skriver(self):
+        with self._skriver_lås:
+            if self._skriver is None or not self._skriver.is_alive():
+                self._skriver = threading.Thread(target=self._skriveløkke, name="sqlite-skriver", daemon=True)
+                self._skriver.start()
+
+    def send(self, navn, jobb):
+        """
+        Legger en skrivejobb i køen og returnerer en concurrent.futures.Future med resultatet.
+        `jobb(conn)` kjøres i skrivetråden. Futuren blir ferdig først når transaksjonen er committet.
+        Blokkerer aldri, så den kan brukes fra hvilken som helst tråd.
+        """
+        if navn not in self._databaser:
+            raise KeyError(f"Ukjent database: {navn}")
+        future = Future()
+        self._kø.put((navn, jobb, future))
+        self._start_skriver()
+        return future
+
+    def _skriveløkke(self):
+        tilkoblinger = {}
+        stopp = False
+        while not stopp:
+            batch = [self._kø.get()]
+            while len(batch) < self.maks_batch:
+                try:
+                    batch.append(self._kø.get_nowait())
+                except queue.Empty:
+                    break
+            if any(j is _STOPP for j in batch):
+                stopp = True
+                batch = [j for j in batch if j is not _STOPP]
+
+            per_db = {}
+            for navn, jobb, future in batch:
+                if future.set_running_or_notify_cancel():
+                    per_db.setdefault(navn, []).append((jobb, future))
+
+            for navn, jobber in per_db.items():
+                try:
+                    if navn not in tilkoblinger:
+                        self._klar(navn)
+                        tilkoblinger[navn] = self._koble(navn)
+                    self._skriv_batch(tilkoblinger[navn], jobber)
+                except Exception as e:
+                    self.stats["feil"] += len(jobber)
+                    print(f"❌ [SQLite] Transaksjon mot {navn} feilet ({len(jobber)} jobber): {e}")
+                    for _, future in jobber:
+                        if not future.done(): future.set_exception(e)
+
+        for conn in tilkoblinger.values():
+            conn.close()
+
+    def _skriv_batch(self, conn, jobber):
+        resultater = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for jobb, future in jobber:
+                conn.execute("SAVEPOINT jobb")
+                try:
+                    resultater.append((future, jobb(conn), None))
+                    conn.execute("RELEASE jobb")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO jobb")
+                    conn.execute("RELEASE jobb")
+                    self.stats["feil"] += 1
+                    resultater.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction: conn.execute("ROLLBACK")
+            raise
+        self.stats["jobber"] += len(jobber)
+        self.stats["transaksjoner"] += 1
+        # Svarene gis først etter commit, så den som venter ser alltid sin egen skriving
+        for future, resultat, feil in resultater:
+            if feil is not None: future.set_exception(feil)
+            else: future.set_result(resultat)
+
+    # --- LESING ---
+    def _les(self, navn, sql, params, én):
+        cursor = self._lesetilkobling(navn).execute(sql, params)
+        try:
+            return cursor.fetchone() if én else cursor.fetchall()
+        finally:
+            cursor.close()
+            self.stats["lesinger"] += 1
+
+    def les_synk(self, navn, sql, params=(), én=False):
+        """Blokkerende lesing (for tråder). Fra async-kode: bruk les()."""
+        return self._lesepool.submit(self._les, navn, sql, params, én).result()
+
+    # --- ASYNC API ---
+    async def skriv(self, navn, sql, params=(), mange=False):
+        """Én skrivesetning (mange=True: executemany). Returnerer rowcount når den er committet."""
+        def jobb(conn):
+            cursor = conn.executemany(sql, params) if mange else conn.execute(sql, params)
+            return cursor.rowcount
+        return await asyncio.wrap_future(self.send(navn, jobb))
+
+    async def utfør(self, navn, jobb):
+        """Vilkårlig skrivejobb `jobb(conn)` i skrivetråden (flere setninger i samme transaksjon)."""
+        return await asyncio.wrap_future(self.send(navn, jobb))
+
+    async def les(self, navn, sql, params=(), én=False):
+        """SELECT fra lesepoolen. Returnerer alle rader, eller én rad (eller None) med én=True."""
+        return await asyncio.get_running_loop().run_in_executor(self._lesepool, self._les, navn, sql, params, én)
+
+    # --- DRIFT ---
+    def status(self):
+        return {**self.stats, "i_kø": self._kø.qsize(),
+                "snitt_batch": round(self.stats["jobber"] / self.stats["transaksjoner"], 1) if self.stats["transaksjoner"] else 0.0}
+
+    def stopp(self, timeout=30.0):
+        """Skriver det som ligger i køen og lukker alle tilkoblinger (ved nedstenging)."""
+        tråd = self._skriver
+        if tråd and tråd.is_alive():
+            self._kø.put(_STOPP)
+            tråd.join(timeout=timeout)
+        self._lesepool.shutdown(wait=True)
+        for conn in self._lesetilkoblinger:
+            try: conn.close()
+            except Exception: pass
+
+motor = Lagringsmotor()
+
+def lagring_status():
+    return motor.status()
+
+atexit.register(motor.stopp)
@@ -1,92 +1,547 @@
-import chromadb
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import functools
+import threading
+import asyncio
+import atexit
 import uuid
+import time
+import re
 import os
+from utils.embedding import embed, skriv_til_samling, embedding_statistikk
+from utils.db_handler import log_telemetri_batch
+from utils import fulltekst, journal
+from utils.chroma import samling, liste_samlinger, chroma_oppe, er_utilgjengelig
 
 # --- KONFIGURASJON ---
-# Vi kobler nå til en lokal server (Docker) i stedet for direkte filtilgang.
-# Sørg for at Docker kjører på port 8000.
-CHROMA_HOST = "localhost"
-CHROMA_PORT = 8081
-
-print(f"🔌 Kobler til ChromaDB Server på {CHROMA_HOST}:{CHROMA_PORT}...")
-
-try:
-    # Koble til via HTTP (Server-modus)
-    client = chromadb.HttpClient(
-        host=CHROMA_HOST, 
-        port=CHROMA_PORT,
-        settings=chromadb.config.Settings(allow_reset=True, anonymized_telemetry=False)
-    )
-    print("✅ Tilkobling til minne-server opprettet.")
-except Exception as e:
-    print(f"❌ KRITISK: Kunne ikke koble til ChromaDB Server. Kjører Docker? Feil: {e}")
-    # Fallback eller stopp her kan vurderes, men vi lar den kræsje så du ser feilen.
-    raise e
+# Tilkoblingen til ChromaDB-serveren (Docker) ligger i utils/chroma.py.
+
+# Write-behind: lagre() legger minner i et buffer som en bakgrunnstråd
+# skriver til Chroma i én bulk-add (ved BATCH_STØRRELSE eller FLUSH_INTERVALL).
+KØ_MAKS = 2000              # Maks antall minner som kan vente i bufferet
+BATCH_STØRRELSE = 100       # Flush straks når så mange ligger klare
+FLUSH_INTERVALL = 2.0       # ...ellers flush etter så mange sekunder
+AVSPILL_FORSØK = 5          # Avspillinger på rad som kan feile (ikke nettverk) før feilende poster settes i karantene
+BACKPRESSURE_TIMEOUT = 5.0  # Hvor lenge alagre() maks venter (i trådpoolen) når bufferet er fullt.
+                            # Synkron lagre() venter aldri: er bufferet fullt, forkastes minnet straks.
+
+# Async-API (alagre/ahent/...) kjører Chroma-kallene i en egen, begrenset trådpool
+# slik at Discord-loopen aldri blokkeres av minne-oppslag.
+MINNE_ARBEIDERE = 4
+
+# Resultat-cache for hent(): like spørsmål innen kort tid gir samme svar uten nytt vektorsøk.
+# Invalideres per server når skrive-køen har skrevet nye minner for den serveren.
+HENT_CACHE_STØRRELSE = 512
+HENT_CACHE_TTL = 60.0  # sekunder
+
+# Ruting: Disse kategoriene er ren telemetri (kostnad, ytelse, terningkast, memes osv.).
+# De går til en billig, append-only SQLite-tabell i stedet for å embeddes i discord_memory,
+# så vektorindeksen som hent() søker i bare inneholder semantisk minne.
+TELEMETRI_KATEGORIER = {
+    "Kostnad", "Performance", "Spillmekanikk", "Humor", "FileWatcher",
+    "Bilde", "AudioWorker", "Soundboard", "Klipp", "Setup", "VOD_Transcribe"
+}
+
+# Oppbevaring: Rå dokumenter i disse kategoriene eldre enn X dager komprimeres til
+# daglige sammendrag per kanal (se cogs/minne_vedlikehold.py) og slettes deretter.
+OPPBEVARING_DAGER = {
+    "Chatlogg": 30
+}
+DIGEST_KATEGORI = "Chatlogg_Digest"
+
+# Hybrid-søk: vektorsøk (Chroma) og nøkkelord-søk (FTS5/BM25, se utils/fulltekst.py)
+# kjøres i parallell og flettes med reciprocal-rank fusion. RRF_K demper vekten av topp-plassene.
+RRF_K = 60
+
+# Hent begge samlingene vi trenger (lat: ingen nettverkskall før de brukes)
+log_collection = samling("system_logs")
 
-# Hent begge samlingene vi trenger
-memory_collection = client.get_or_create_collection(name="discord_memory")
-log_collection = client.get_or_create_collection(name="system_logs")
+# Sharding: Hver server har sin egen minnesamling (discord_memory_<guild_id>), pluss
+# discord_memory_GLOBAL. Et søk treffer da bare sin egen servers data + GLOBAL, i parallell.
+# Den gamle felles samlingen leses fortsatt til migrer_til_shards() har flyttet alt over.
+MINNE_PREFIKS = "discord_memory_"
+memory_collection = samling("discord_memory")  # Gammel felles samling
+_gammel_aktiv = None  # Ukjent til første søk
+
+def _gammel_i_bruk():
+    """Sjekker (én gang) om den gamle felles samlingen fortsatt har innhold."""
+    global _gammel_aktiv
+    if _gammel_aktiv is None:
+        _gammel_aktiv = memory_collection.count() > 0
+    return _gammel_aktiv
+
+def _samlingsnavn(guild_id):
+    return MINNE_PREFIKS + re.sub(r"[^A-Za-z0-9_-]", "_", str(guild_id))
+
+def minnesamling(guild_id):
+    """Minnesamlingen for en server (opprettes første gang den brukes)."""
+    return samling(_samlingsnavn(guild_id))
+
+def alle_minnesamlinger():
+    """Alle shard-samlingene som finnes på serveren."""
+    return [samling(n) for n in liste_samlinger() if n.startswith(MINNE_PREFIKS)]
 
 def logg_feil(kilde, feilmelding):
-    """Lagrer kritiske feil i system-journalen."""
+    """Lagrer kritiske feil i system-journalen. Er ChromaDB nede, havner de i den lokale skrive-journalen."""
+    ts = datetime.now().timestamp()
+    dokument = f"❌ [MINNE-FEIL] Kilde: '{kilde}' | Feil: {feilmelding}"
+    metadata = {
+        "category": "Error",
+        "task": "MinneLagring",
+        "timestamp": ts,
+        "duration": 0
+    }
+    unik_id = f"error_{kilde}_{ts}"
     try:
-        ts = datetime.now().timestamp()
-        log_collection.add(
-            documents=[f"❌ [MINNE-FEIL] Kilde: '{kilde}' | Feil: {feilmelding}"],
-            metadatas=[{
-                "category": "Error",
-                "task": "MinneLagring",
-                "timestamp": ts,
-                "duration": 0
-            }],
-            ids=[f"error_{kilde}_{ts}"]
-        )
+        if not chroma_oppe():
+            # Ikke gjør et nytt kall mot en server vi vet er nede
+            journal.skriv([("logg", dokument, metadata, unik_id)])
+            print(f"⚠️ Feil lagt i lokal journal (ChromaDB nede): {feilmelding}")
+            return
+        log_collection.add(documents=[dokument], metadatas=[metadata], ids=[unik_id])
         print(f"⚠️ Feil loggført i journalen: {feilmelding}")
     except Exception as e:
+        if er_utilgjengelig(e):
+            try:
+                journal.skriv([("logg", dokument, metadata, unik_id)])
+                return
+            except Exception as je:
+                e = je
         print(f"💀 KRISE: Klarte ikke logge feilen til DB: {e}")
 
-def lagre(tekst, user, guild_id, channel_id, kategori="Generelt", kilde="Chat"):
+class HentCache:
+    """Liten LRU-cache med TTL for hent()-resultater. Trådsikker."""
+    def __init__(self, maks=HENT_CACHE_STØRRELSE, ttl=HENT_CACHE_TTL):
+        self.maks = maks
+        self.ttl = ttl
+        self._data = OrderedDict()  # nøkkel -> (utløper, verdi)
+        self._lås = threading.Lock()
+        self.treff = 0
+        self.bom = 0
+        self.utkastet = 0
+        self.invalidert = 0
+
+    @staticmethod
+    def normaliser(tekst):
+        return re.sub(r"\s+", " ", str(tekst).lower()).strip(" .,!?")
+
+    def nøkkel(self, sokeord, guild_id, ekskluder_kategori, kun_kategori, n_results):
+        return (self.normaliser(sokeord), str(guild_id), ekskluder_kategori, kun_kategori, n_results)
+
+    def hent(self, nøkkel):
+        """Returnerer (funnet, verdi)."""
+        with self._lås:
+            element = self._data.get(nøkkel)
+            if element and element[0] > time.monotonic():
+                self._data.move_to_end(nøkkel)
+                self.treff += 1
+                return True, element[1]
+            if element:
+                del self._data[nøkkel]
+            self.bom += 1
+            return False, None
+
+    def sett(self, nøkkel, verdi):
+        with self._lås:
+            self._data[nøkkel] = (time.monotonic() + self.ttl, verdi)
+            self._data.move_to_end(nøkkel)
+            while len(self._data) > self.maks:
+                self._data.popitem(last=False)
+                self.utkastet += 1
+
+    def invalider_guild(self, guild_id):
+        """Fjerner alle oppslag for en server. GLOBAL-minner er med i alle søk, så de tømmer alt."""
+        guild_id = str(guild_id)
+        with self._lås:
+            if guild_id == "GLOBAL":
+                fjernet = len(self._data)
+                self._data.clear()
+            else:
+                gamle = [k for k in self._data if k[1] == guild_id]
+                for k in gamle:
+                    del self._data[k]
+                fjernet = len(gamle)
+            self.invalidert += fjernet
+
+    def statistikk(self):
+        with self._lås:
+            totalt = self.treff + self.bom
+            return {
+                "størrelse": len(self._data),
+                "maks": self.maks,
+                "ttl": self.ttl,
+                "treff": self.treff,
+                "bom": self.bom,
+                "treffrate": round(self.treff / totalt * 100, 1) if totalt else 0.0,
+                "utkastet": self.utkastet,
+                "invalidert": self.invalidert
+            }
+
+hent_cache = HentCache()
+
+class MinneSkriver:
     """
-    Lagrer minne. Ved feil, logges det til systemjournalen.
+    Samler minner i et buffer og skriver dem til Chroma i bulk fra en egen tråd.
+    Holder HTTP-kallet og embedding-jobben unna event-loopen.
     """
-    try:
-        timestamp = datetime.now().timestamp()
-        
-        metadata = {
-            "user": str(user),
-            "guild_id": str(guild_id),
-            "channel_id": str(channel_id),
-            "kategori": str(kategori),
-            "kilde": str(kilde),
-            "timestamp": timestamp
-        }
-
-        # Unik ID
-        unik_id = f"{guild_id}_{channel_id}_{uuid.uuid4()}"
-
-        memory_collection.add(
-            documents=[tekst],
-            metadatas=[metadata],
-            ids=[unik_id]
+    def __init__(self, maks=KØ_MAKS, batch=BATCH_STØRRELSE, intervall=FLUSH_INTERVALL):
+        self.maks = maks
+        self.batch = batch
+        self.intervall = intervall
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._tråd = None
+        self._stopp = False
+        self._skriver_nå = 0
+        self.forkastet = 0
+        self._avspill_feil = 0
+
+    def start(self):
+        with self._cond:
+            self._start()
+
+    def _start(self):
+        # Kalles med låsen holdt. Starter tråden først når det faktisk finnes noe å skrive.
+        if self._tråd is None or not self._tråd.is_alive():
+            self._stopp = False
+            self._tråd = threading.Thread(target=self._løkke, name="MinneSkriver", daemon=True)
+            self._tråd.start()
+
+    def legg_til(self, dokument, metadata, unik_id, mål="minne", vent=0.0):
+        """
+        Legger et minne i bufferet. Er bufferet fullt, venter vi (backpressure) i maks `vent` sekunder.
+        Er det fortsatt fullt, forkastes posten og vi returnerer False.
+        mål="telemetri" sender posten til SQLite i stedet for Chroma.
+        """
+        with self._cond:
+            self._start()
+            if len(self._buffer) >= self.maks:
+                self._cond.notify_all()
+                ledig = vent > 0 and self._cond.wait_for(lambda: len(self._buffer) < self.maks, timeout=vent)
+                if not ledig:
+                    print(f"⚠️ Minne-køen er full ({len(self._buffer)}). Forkaster minne fra {metadata.get('kilde', 'Ukjent')} ({unik_id}).")
+                    self.forkastet += 1
+                    return False
+            self._buffer.append((dokument, metadata, unik_id, mål))
+            if len(self._buffer) >= self.batch:
+                self._cond.notify_all()
+            return True
+
+    def _ta_batch(self):
+        # Kalles med låsen holdt. Tar ut alt som ligger klart og vekker ventende skrivere.
+        batch = self._buffer
+        self._buffer = []
+        if batch:
+            self._skriver_nå += 1
+        self._cond.notify_all()
+        return batch
+
+    def _løkke(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopp or len(self._buffer) >= self.batch, timeout=self.intervall)
+                batch = self._ta_batch()
+                if self._stopp and not batch:
+                    return
+            if batch:
+                self._skriv(batch)
+            if journal.ventende() and chroma_oppe():
+                self._spill_av_journal()
+
+    def _skriv(self, batch):
+        minner = [b for b in batch if b[3] == "minne"]
+        telemetri = [b for b in batch if b[3] == "telemetri"]
+        try:
+            if minner:
+                self._skriv_minner(minner)
+            if telemetri:
+                self._skriv_telemetri(telemetri)
+        finally:
+            with self._cond:
+                self._skriver_nå -= 1
+                self._cond.notify_all()
+
+    def _skriv_minner(self, batch):
+        # Én bulk-add per server-samling
+        per_guild = {}
+        for b in batch:
+            per_guild.setdefault(b[1]["guild_id"], []).append(b)
+
+        for guild_id, poster in per_guild.items():
+            if not chroma_oppe():
+                self._journalfør(poster)
+                continue
+            try:
+                skriv_til_samling(
+                    minnesamling(guild_id),
+                    documents=[b[0] for b in poster],
+                    metadatas=[b[1] for b in poster],
+                    ids=[b[2] for b in poster]
+                )
+            except Exception as e:
+                if er_utilgjengelig(e):
+                    self._journalfør(poster)
+                    continue
+                print(f"❌ Minne-lagringsfeil ({len(poster)} minner, server {guild_id}): {e}")
+                kilder = sorted({str(b[1].get("kilde", "Ukjent")) for b in poster})
+                logg_feil(kilde=",".join(kilder), feilmelding=str(e))
+                continue
+            try:
+                fulltekst.indekser([(b[2], b[0], b[1]) for b in poster])
+            except Exception as e:
+                print(f"⚠️ Nøkkelord-indeksen ble ikke oppdatert ({len(poster)} minner): {e}")
+            hent_cache.invalider_guild(guild_id)
+
+    def _journalfør(self, poster):
+        """ChromaDB er nede: legg minnene i den lokale journalen og i FTS, så hent() fortsatt finner dem."""
+        try:
+            journal.skriv([("minne", b[0], b[1], b[2]) for b in poster])
+        except Exception as e:
+            print(f"💀 KRISE: Klarte ikke skrive {len(poster)} minner til journalen: {e}")
+            return
+        try:
+            fulltekst.indekser([(b[2], b[0], b[1]) for b in poster])
+        except Exception as e:
+            print(f"⚠️ Nøkkelord-indeksen ble ikke oppdatert ({len(poster)} minner): {e}")
+        for guild_id in {b[1]["guild_id"] for b in poster}:
+            hent_cache.invalider_guild(guild_id)
+        print(f"📓 ChromaDB nede: {len(poster)} minner lagt i lokal journal.")
+
+    def _spill_av_journal(self):
+        """Skriver alt fra journalen til ChromaDB i bulk. Upsert, så en avbrutt avspilling kan tas på nytt."""
+        poster = journal.ta_ut()
+        try:
+            per_mål = {}
+            for mål, dok, meta, unik_id in poster:
+                nøkkel = ("minne", str(meta.get("guild_id"))) if mål == "minne" else ("logg", None)
+                per_mål.setdefault(nøkkel, []).append((dok, meta, unik_id))
+
+            for (mål, guild_id), del_poster in per_mål.items():
+                shard = minnesamling(guild_id) if mål == "minne" else log_collection
+                for i in range(0, len(del_poster), self.batch):
+                    # Låst mot journal.fjern(): det !slett_meg har fjernet siden ta_ut() skal ikke inn igjen
+                    with journal.avspiller() as fjernet:
+                        bit = [p for p in del_poster[i:i+self.batch] if p[2] not in fjernet]
+                        if not bit: continue
+                        try:
+                            self._upsert(shard, bit)
+                        except Exception as e:
+                            if er_utilgjengelig(e) or self._avspill_feil + 1 < AVSPILL_FORSØK:
+                                raise
+                            self._isoler(shard, mål, bit)
+                if mål == "minne":
+                    hent_cache.invalider_guild(guild_id)
+        except Exception as e:
+            if not er_utilgjengelig(e):
+                self._avspill_feil += 1
+            print(f"⚠️ Avspilling av journalen stoppet (forsøk {self._avspill_feil}/{AVSPILL_FORSØK}), prøver igjen senere: {e}")
+            return
+        self._avspill_feil = 0
+        journal.ferdig()
+        if poster:
+            print(f"📓 Journal spilt av: {len(poster)} poster skrevet til ChromaDB.")
+
+    def _upsert(self, shard, bit):
+        skriv_til_samling(
+            shard,
+            documents=[p[0] for p in bit],
+            metadatas=[p[1] for p in bit],
+            ids=[p[2] for p in bit],
+            upsert=True
         )
+
+    def _isoler(self, shard, mål, bit):
+        """Batchen har feilet AVSPILL_FORSØK ganger: skriv én og én, og sett de som feiler i karantene."""
+        karantene = []
+        for p in bit:
+            try:
+                self._upsert(shard, [p])
+            except Exception as e:
+                if er_utilgjengelig(e): raise
+                karantene.append((mål, *p))
+        if karantene:
+            journal.karantene(karantene)
+            print(f"🧪 {len(karantene)} journalposter avvises av ChromaDB og er flyttet til {journal.KARANTENE_FIL}.")
+
+    def _skriv_telemetri(self, batch):
+        try:
+            log_telemetri_batch([(b[0], b[1]) for b in batch]).result()
+        except Exception as e:
+            print(f"❌ Telemetri-lagringsfeil ({len(batch)} poster): {e}")
+
+    def har_plass(self):
+        with self._cond:
+            return len(self._buffer) < self.maks
+
+    def antall_ventende(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def tøm(self, timeout=30.0):
+        """Skriver alt som ligger i bufferet NÅ, og venter på skrivinger som er i gang."""
+        with self._cond:
+            batch = self._ta_batch()
+        if batch:
+            self._skriv(batch)
+        with self._cond:
+            self._cond.wait_for(lambda: self._skriver_nå == 0, timeout=timeout)
+
+    def stopp(self, timeout=30.0):
+        """Tømmer bufferet og stopper tråden (brukes ved nedstenging)."""
+        with self._cond:
+            self._stopp = True
+            self._cond.notify_all()
+            tråd = self._tråd
+        if tråd and tråd.is_alive():
+            tråd.join(timeout=timeout)
+        self.tøm(timeout=timeout)
+
+skriver = MinneSkriver()
+
+# Ligger det igjen poster i journalen fra forrige kjøring, starter vi skrivetråden så de spilles av
+if journal.ventende():
+    skriver.start()
+
+def tøm_minnekø():
+    """Tvinger ut alle ventende minner (f.eks ved cog_unload)."""
+    skriver.tøm()
+
+def stopp_minneskriver():
+    """Tømmer køen og stopper skrivetråden. Kalles ved nedstenging."""
+    skriver.stopp()
+
+atexit.register(stopp_minneskriver)
+
+def _ny_post(user, guild_id, channel_id, kategori, kilde, timestamp):
+    """Metadata og unik id for et nytt minne."""
+    metadata = {
+        "user": str(user),
+        "guild_id": str(guild_id),
+        "channel_id": str(channel_id),
+        "kategori": str(kategori),
+        "kilde": str(kilde),
+        "timestamp": timestamp if timestamp is not None else datetime.now().timestamp()
+    }
+    return metadata, f"{guild_id}_{channel_id}_{uuid.uuid4()}"
+
+def lagre_nå(tekst, user, guild_id, channel_id, kategori="Generelt", kilde="Chat", timestamp=None):
+    """
+    Skriver ett minne direkte til server-samlingen, utenom skrive-køen, og kaster ved feil.
+    For når kallstedet må vite at minnet faktisk ligger i ChromaDB (f.eks. før originaler slettes).
+    """
+    metadata, unik_id = _ny_post(user, guild_id, channel_id, kategori, kilde, timestamp)
+    skriv_til_samling(minnesamling(guild_id), documents=[tekst], metadatas=[metadata], ids=[unik_id])
+    try:
+        fulltekst.indekser([(unik_id, tekst, metadata)])
+    except Exception as e:
+        print(f"⚠️ Nøkkelord-indeksen ble ikke oppdatert ({unik_id}): {e}")
+    hent_cache.invalider_guild(guild_id)
+    return unik_id
+
+def lagre(tekst, user, guild_id, channel_id, kategori="Generelt", kilde="Chat", timestamp=None, vent=0.0):
+    """
+    Legger minnet i skrive-køen (write-behind). Selve Chroma-kallet skjer i bakgrunnen.
+    Blokkerer ikke: er køen full, forkastes minnet (med en loggmelding). Fra async-kode: bruk alagre().
+    Telemetri-kategorier (se TELEMETRI_KATEGORIER) havner i SQLite, ikke i vektorminnet.
+    timestamp kan settes for å tidfeste minnet bakover.
+    Ved feil, logges det til systemjournalen.
+    """
+    try:
+        metadata, unik_id = _ny_post(user, guild_id, channel_id, kategori, kilde, timestamp)
+        mål = "telemetri" if str(kategori) in TELEMETRI_KATEGORIER else "minne"
+        skriver.legg_til(tekst, metadata, unik_id, mål=mål, vent=vent)
         
     except Exception as e:
         # HER skjer loggingen du ba om
         print(f"❌ Minne-lagringsfeil: {e}")
         logg_feil(kilde=kilde, feilmelding=str(e))
 
+def _spørring(tekst):
+    """Spørrevektor fra embedding-cachen. Faller tilbake til at Chroma embedder selv."""
+    try:
+        return {"query_embeddings": embed([tekst], lagre=False)}
+    except Exception as e:
+        print(f"⚠️ Embedding-cache utilgjengelig for søk: {e}")
+        return {"query_texts": [tekst]}
+
+# Hvert hent() sender opptil fire jobber hit (server-shard, GLOBAL, gammel samling, FTS)
+_søk_executor = ThreadPoolExecutor(max_workers=MINNE_ARBEIDERE * 4, thread_name_prefix="MinneSøk")
+
+def _kombiner(*filtre):
+    """Slår sammen where-filtre med $and (Chroma krever minst to ledd i $and)."""
+    filtre = [f for f in filtre if f]
+    if not filtre:
+        return None
+    return filtre[0] if len(filtre) == 1 else {"$and": filtre}
+
+def _vektorsøk(samling, spørring, where, n):
+    """Returnerer (doc_id, tekst, metadata, avstand) fra én samling."""
+    res = samling.query(**spørring, where=where, n_results=n)
+    if not res['documents'] or not res['documents'][0]:
+        return []
+    avstander = (res.get('distances') or [[0.0] * len(res['ids'][0])])[0]
+    return list(zip(res['ids'][0], res['documents'][0], res['metadatas'][0], avstander))
+
+def _rrf(*lister, n):
+    """
+    Reciprocal-rank fusion av flere rangerte lister med (doc_id, tekst, metadata).
+    Dokumenter som scorer i begge søkene havner øverst.
+    """
+    poeng, dokumenter = {}, {}
+    for liste in lister:
+        for plass, (doc_id, doc, meta) in enumerate(liste):
+            poeng[doc_id] = poeng.get(doc_id, 0.0) + 1.0 / (RRF_K + plass + 1)
+            dokumenter.setdefault(doc_id, (doc, meta))
+    beste = sorted(poeng, key=poeng.get, reverse=True)[:n]
+    return [(doc_id, *dokumenter[doc_id]) for doc_id in beste]
+
+def _vektorsøk_gammel(spørring, guilds, where, n):
+    """Søk i den gamle felles samlingen, så lenge den ikke er migrert."""
+    if not _gammel_i_bruk():
+        return []
+    return _vektorsøk(memory_collection, spørring, _kombiner({"guild_id": {"$in": guilds}}, where), n)
+
+def _hybrid_søk(tekst, guilds, n, where=None, **fts_filter):
+    """
+    Vektorsøk i hver server-shard + FTS-søk, alt i parallell.
+    Vektortreffene flettes på avstand, deretter med FTS via RRF. Returnerer (doc_id, tekst, metadata).
+    """
+    guilds = [str(g) for g in dict.fromkeys(str(g) for g in guilds)]
+    fts_jobb = _søk_executor.submit(fulltekst.søk, tekst, guild_ids=guilds, n=n, **fts_filter)
+
+    spørring = _spørring(tekst)
+    jobber = [_søk_executor.submit(_vektorsøk, minnesamling(g), spørring, where, n) for g in guilds]
+    jobber.append(_søk_executor.submit(_vektorsøk_gammel, spørring, guilds, where, n))
+
+    vektor_treff = []
+    for jobb in jobber:
+        try:
+            vektor_treff.extend(jobb.result())
+        except Exception as e:
+            # Uten vektorsøket kan vi fortsatt svare med nøkkelord-treff
+            if chroma_oppe():
+                print(f"⚠️ Vektorsøk feilet, bruker resten: {e}")
+    vektor_treff.sort(key=lambda t: t[3])
+    vektor_treff = [t[:3] for t in vektor_treff[:n]]
+
+    try:
+        fts_treff = fts_jobb.result()
+    except Exception as e:
+        print(f"⚠️ Nøkkelord-søk feilet: {e}")
+        fts_treff = []
+
+    return _rrf(vektor_treff, fts_treff, n=n)
+
 def hent(sokeord, guild_id, n_results=5, ekskluder_kategori=None, kun_kategori=None):
-    """Henter minne isolert til server."""
+    """Henter minne isolert til server (hybrid vektor + nøkkelord). Svar caches kort (se HentCache)."""
+    cache_nøkkel = hent_cache.nøkkel(sokeord, guild_id, ekskluder_kategori, kun_kategori, n_results)
+    funnet, svar = hent_cache.hent(cache_nøkkel)
+    if funnet:
+        return svar
+
     try:
-        server_filter = {
-            "$or": [
-                {"guild_id": str(guild_id)},
-                {"guild_id": "GLOBAL"}
-            ]
-        }
-        
-        final_filter = server_filter
+        # Serverisolasjonen ligger i hvilke samlinger vi spør, så filteret gjelder bare kategori
         extra_filters = []
         
         if ekskluder_kategori:
@@ -95,23 +550,16 @@ def hent(sokeord, guild_id, n_results=5, ekskluder_kategori=None, kun_kategori=N
         if kun_kategori:
             extra_filters.append({"kategori": kun_kategori})
 
-        if extra_filters:
-            all_conditions = [server_filter] + extra_filters
-            final_filter = {"$and": all_conditions}
-
-        res = memory_collection.query(
-            query_texts=[sokeord],
-            where=final_filter,
-            n_results=n_results
+        treff = _hybrid_søk(
+            sokeord, [guild_id, "GLOBAL"], n_results,
+            where=_kombiner(*extra_filters),
+            ekskluder_kategori=ekskluder_kategori,
+            kun_kategori=kun_kategori
         )
         
         historikk = []
-        if res['documents'] and res['documents'][0]:
-            docs = res['documents'][0]
-            metas = res['metadatas'][0]
-            
-            for i, doc in enumerate(docs):
-                meta = metas[i]
+        if treff:
+            for _, doc, meta in treff:
                 timestamp = meta.get('timestamp', 0)
                 bruker = meta.get('user', 'Ukjent')
                 # kilde = meta.get('kilde', 'Chat') # Ubrukt variabel fjernet for ryddighet
@@ -120,7 +568,9 @@ def hent(sokeord, guild_id, n_results=5, ekskluder_kategori=None, kun_kategori=N
                 dato = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
                 historikk.append(f"[{dato}] [{kat}] {bruker}: {doc}")
         
-        return "\n".join(historikk) if historikk else None
+        svar = "\n".join(historikk) if historikk else None
+        hent_cache.sett(cache_nøkkel, svar)
+        return svar
 
     except Exception as e:
         print(f"⚠️ Kunne ikke hente minne: {e}")
@@ -129,14 +579,18 @@ def hent(sokeord, guild_id, n_results=5, ekskluder_kategori=None, kun_kategori=N
 def slett_kategori(guild_id, kategori):
     """Sletter alt minne i en kategori for en server."""
     try:
-        memory_collection.delete(
-            where={
-                "$and": [
-                    {"guild_id": str(guild_id)},
-                    {"kategori": kategori}
-                ]
-            }
-        )
+        minnesamling(guild_id).delete(where={"kategori": kategori})
+        if _gammel_i_bruk():
+            memory_collection.delete(
+                where={
+                    "$and": [
+                        {"guild_id": str(guild_id)},
+                        {"kategori": kategori}
+                    ]
+                }
+            )
+        fulltekst.slett_kategori(guild_id, kategori)
+        hent_cache.invalider_guild(guild_id)
         return True
     except Exception as e:
         print(f"❌ Feil ved sletting: {e}")
@@ -144,19 +598,207 @@ def slett_kategori(guild_id, kategori):
         return False
 
 def søk_i_kilde(spørsmål, kilde_navn, guild_id, antall=5):
-    """Søker spesifikt i en kilde (f.eks en bok)."""
+    """Søker spesifikt i en kilde (f.eks en bok). Nøkkelord-søket fanger eksakte tabelloverskrifter."""
     try:
-        res = memory_collection.query(
-            query_texts=[spørsmål],
+        treff = _hybrid_søk(
+            spørsmål, [guild_id], antall,
+            where={"kilde": kilde_navn},
+            kilde=kilde_navn
+        )
+        return [doc for _, doc, _ in treff]
+    except Exception as e:
+        print(f"🔍 Søkefeil i kilde '{kilde_navn}': {e}")
+        return []
+
+def _alle_for_vedlikehold():
+    samlinger = alle_minnesamlinger()
+    if _gammel_i_bruk():
+        samlinger.append(memory_collection)
+    return samlinger
+
+def hent_utløpte(kategori, eldre_enn, grense=5000):
+    """Henter rå dokumenter i en kategori som er eldre enn timestamp 'eldre_enn' (fra alle servere)."""
+    funnet = []
+    for shard in _alle_for_vedlikehold():
+        if len(funnet) >= grense:
+            break
+        res = shard.get(
             where={
                 "$and": [
-                    {"kilde": kilde_navn},
-                    {"guild_id": str(guild_id)}
+                    {"kategori": kategori},
+                    {"timestamp": {"$lt": eldre_enn}}
                 ]
             },
-            n_results=antall
+            limit=grense - len(funnet),
+            include=["documents", "metadatas"]
         )
-        return res['documents'][0] if res['documents'] else []
-    except Exception as e:
-        print(f"🔍 Søkefeil i kilde '{kilde_navn}': {e}")
-        return []
\ No newline at end of file
+        funnet.extend(zip(res['ids'], res['documents'], res['metadatas']))
+    return funnet
+
+def slett_ider(ids, guilds=(), batch=500):
+    """
+    Sletter dokumenter i bulk og invaliderer hent-cachen for berørte servere.
+    Med guilds slettes det bare i de serverenes samlinger, ellers i alle.
+    """
+    samlinger = [minnesamling(g) for g in guilds] if guilds else alle_minnesamlinger()
+    if _gammel_i_bruk():
+        samlinger.append(memory_collection)
+    for shard in samlinger:
+        for i in range(0, len(ids), batch):
+            shard.delete(ids=ids[i:i+batch])
+    fulltekst.slett(ids)
+    for guild_id in guilds:
+        hent_cache.invalider_guild(guild_id)
+    if not guilds:
+        hent_cache.invalider_guild("GLOBAL")
+    return len(ids)
+
+def gjelder_bruker(navn, dokument, metadata):
+    """Samme treff som !meg / !slett_meg bruker: brukernavnet i teksten eller i en metadataverdi."""
+    navn = str(navn).lower()
+    return navn in str(dokument).lower() or any(navn in str(v).lower() for v in (metadata or {}).values())
+
+def glem_ventende(navn):
+    """
+    Fjerner brukerens poster fra den lokale journalen (så de ikke spilles inn igjen i ChromaDB
+    etter at de er slettet der), fra FTS-indeksen de ble lagt i, og tømmer hent-cachen.
+    Skrive-køen bør tømmes først (tøm_minnekø). Returnerer antall fjernede journalposter.
+    """
+    fjernet = journal.fjern(lambda p: gjelder_bruker(navn, p[1], p[2]))
+    minne_ider = [p[3] for p in fjernet if p[0] == "minne"]
+    if minne_ider:
+        fulltekst.slett(minne_ider)
+    hent_cache.invalider_guild("GLOBAL")
+    return len(fjernet)
+
+def bygg_nøkkelindeks(side=1000):
+    """Bygger FTS-indeksen på nytt fra alle minnesamlingene (engangsjobb / reparasjon)."""
+    fulltekst.tøm()
+    totalt = 0
+    for shard in _alle_for_vedlikehold():
+        offset = 0
+        while True:
+            res = shard.get(limit=side, offset=offset, include=["documents", "metadatas"])
+            if not res['ids']:
+                break
+            fulltekst.indekser(list(zip(res['ids'], res['documents'], res['metadatas'])))
+            totalt += len(res['ids'])
+            offset += side
+    hent_cache.invalider_guild("GLOBAL")
+    return totalt
+
+def migrer_til_shards(batch=500):
+    """
+    Engangsjobb: flytter alt fra den gamle felles discord_memory over i server-samlingene.
+    Eksisterende embeddings gjenbrukes, og id-ene beholdes (så FTS-indeksen er fortsatt gyldig).
+    Trygg å kjøre på nytt hvis den blir avbrutt (upsert + sletting batch for batch).
+    """
+    global _gammel_aktiv
+    flyttet = 0
+    while True:
+        res = memory_collection.get(limit=batch, include=["documents", "metadatas", "embeddings"])
+        if not res['ids']:
+            break
+        embeddings = res.get('embeddings')
+        per_guild = {}
+        for i, doc_id in enumerate(res['ids']):
+            meta = res['metadatas'][i] or {}
+            vektor = [float(x) for x in embeddings[i]] if embeddings is not None and len(embeddings) > i else None
+            per_guild.setdefault(str(meta.get("guild_id", "GLOBAL")), []).append((doc_id, res['documents'][i], meta, vektor))
+
+        for guild_id, poster in per_guild.items():
+            shard = minnesamling(guild_id)
+            if all(p[3] is not None for p in poster):
+                shard.upsert(
+                    ids=[p[0] for p in poster],
+                    documents=[p[1] for p in poster],
+                    metadatas=[p[2] for p in poster],
+                    embeddings=[p[3] for p in poster]
+                )
+            else:
+                skriv_til_samling(shard, [p[1] for p in poster], [p[2] for p in poster], [p[0] for p in poster], upsert=True)
+
+        memory_collection.delete(ids=res['ids'])
+        flyttet += len(res['ids'])
+        print(f"📦 Migrert {flyttet} minner til server-samlinger...")
+
+    _gammel_aktiv = False
+    hent_cache.invalider_guild("GLOBAL")
+    return flyttet
+
+def minne_statistikk():
+    """Tall for å dimensjonere cache og skrive-kø."""
+    return {
+        "hent_cache": hent_cache.statistikk(),
+        "skrive_kø": skriver.antall_ventende(),
+        "forkastet": skriver.forkastet,
+        "embedding": embedding_statistikk(),
+        "nøkkelindeks": fulltekst.antall(),
+        "journal": journal.antall()
+    }
+
+# --- ASYNC API ---
+# Samme funksjoner som over, men trygge å kalle fra listeners og kommandoer.
+# De synkrone funksjonene beholdes, så kallstedene kan flyttes over én og én.
+
+_executor = ThreadPoolExecutor(max_workers=MINNE_ARBEIDERE, thread_name_prefix="Minne")
+
+async def _i_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def alagre(tekst, user, guild_id, channel_id, kategori="Generelt", kilde="Chat", timestamp=None):
+    """Async lagre(). Venter i trådpoolen (ikke på loopen) hvis skrive-køen er full."""
+    if skriver.har_plass():
+        # Rask vei: bare et append i bufferet, ingen grunn til å bytte tråd
+        lagre(tekst, user, guild_id, channel_id, kategori=kategori, kilde=kilde, timestamp=timestamp)
+    else:
+        await _i_executor(lagre, tekst, user, guild_id, channel_id, kategori=kategori, kilde=kilde, timestamp=timestamp,
+                          vent=BACKPRESSURE_TIMEOUT)
+
+async def alagre_nå(tekst, user, guild_id, channel_id, kategori="Generelt", kilde="Chat", timestamp=None):
+    """Async lagre_nå(). Kaster hvis minnet ikke ble skrevet."""
+    return await _i_executor(lagre_nå, tekst, user, guild_id, channel_id, kategori=kategori, kilde=kilde, timestamp=timestamp)
+
+async def ahent(sokeord, guild_id, n_results=5, ekskluder_kategori=None, kun_kategori=None):
+    """Async hent()."""
+    return await _i_executor(
+        hent, sokeord, guild_id,
+        n_results=n_results, ekskluder_kategori=ekskluder_kategori, kun_kategori=kun_kategori
+    )
+
+async def aslett_kategori(guild_id, kategori):
+    """Async slett_kategori()."""
+    return await _i_executor(slett_kategori, guild_id, kategori)
+
+async def asøk_i_kilde(spørsmål, kilde_navn, guild_id, antall=5):
+    """Async søk_i_kilde()."""
+    return await _i_executor(søk_i_kilde, spørsmål, kilde_navn, guild_id, antall=antall)
+
+async def atøm_minnekø():
+    """Async tøm_minnekø()."""
+    await _i_executor(tøm_minnekø)
+
+async def ahent_utløpte(kategori, eldre_enn, grense=5000):
+    """Async hent_utløpte()."""
+    return await _i_executor(hent_utløpte, kategori, eldre_enn, grense=grense)
+
+async def aslett_ider(ids, guilds=()):
+    """Async slett_ider()."""
+    return await _i_executor(slett_ider, ids, guilds)
+
+async def aglem_ventende(navn):
+    """Async glem_ventende()."""
+    return await _i_executor(glem_ventende, navn)
+
+async def abygg_nøkkelindeks():
+    """Async bygg_nøkkelindeks()."""
+    return await _i_executor(bygg_nøkkelindeks)
+
+async def amigrer_til_shards():
+    """Async migrer_til_shards()."""
+    return await _i_executor(migrer_til_shards)
+
+async def aminne_statistikk():
+    """Async minne_statistikk(). Journalen leses fra disk og FTS-tellingen tar indekslåsen."""
+    return await _i_executor(minne_statistikk)
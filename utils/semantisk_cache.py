@@ -0,0 +1,130 @@
+import os
+import math
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.embedding import embed
+
+# --- KONFIGURASJON ---
+# Svar-cache på betydning i stedet for eksakt tekst. #kode-hjelp, #chatgpt og #matlagingstips får
+# de samme spørsmålene om og om igjen med litt andre ord, og hvert av dem koster en full generering.
+# Spørsmålet embeddes (samme modell som minnet), og et nylig svar med høy nok
+# likhet i samme persona (kanal + modell + systemprompt) brukes direkte.
+TERSKEL = float(os.getenv("SEMANTISK_TERSKEL", "0.92"))     # Cosinus-likhet som regnes som samme spørsmål
+TTL = int(os.getenv("SEMANTISK_TTL", str(3 * 24 * 3600)))    # sekunder et svar kan gjenbrukes
+MAKS_PER_PERSONA = 500
+# Lange spørsmål (limt inn kode, logger) kuttes av embedding-modellen etter et par hundre tokens,
+# så to forskjellige kodesnutter med lik start kan se like ut. Slike spørsmål caches ikke.
+MAKS_SPØRSMÅL = 500  # tegn
+
+_personaer = {}  # persona -> {"system": hash av systemprompt, "poster": [(vektor, spørsmål, svar, tid)]}
+_lås = threading.Lock()
+# Spørsmålsvektorer lagres ikke i den faste embedding-cachen (engangstekster). Vi husker de siste
+# her, så lagre() etter en bom i finn() ikke må embedde det samme spørsmålet på nytt.
+_vektorer = OrderedDict()
+SISTE_VEKTORER = 256
+
+stats = {"treff": 0, "bom": 0, "lagret": 0, "invalidert": 0, "hoppet_over": 0}
+
+def _system_hash(modell, system_prompt):
+    return hashlib.sha256(f"{modell}\0{system_prompt}".encode("utf-8")).hexdigest()
+
+def _normaliser(vektor):
+    lengde = math.sqrt(sum(x * x for x in vektor)) or 1.0
+    return [x / lengde for x in vektor]
+
+def _vektor(spørsmål):
+    tekst = spørsmål.strip()
+    with _lås:
+        if tekst in _vektorer:
+            _vektorer.move_to_end(tekst)
+            return _vektorer[tekst]
+    vektor = _normaliser(embed([tekst], lagre=False)[0])
+    with _lås:
+        _vektorer[tekst] = vektor
+        while len(_vektorer) > SISTE_VEKTORER:
+            _vektorer.popitem(last=False)
+    return vektor
+
+def kan_caches(spørsmål):
+    return bool(spørsmål and spørsmål.strip()) and len(spørsmål) <= MAKS_SPØRSMÅL
+
+def _poster(persona, modell, system_prompt):
+    """Postene for personaen. Er systemprompten (eller modellen) endret, kastes de gamle svarene."""
+    h = _system_hash(modell, system_prompt)
+    data = _personaer.get(persona)
+    if data is None or data["system"] != h:
+        if data is not None and data["poster"]:
+            stats["invalidert"] += len(data["poster"])
+            print(f"🧽 [Semantisk cache] Systemprompten for {persona} er endret. Glemmer {len(data['poster'])} svar.")
+        data = _personaer[persona] = {"system": h, "poster": []}
+    grense = time.time() - TTL
+    data["poster"] = [p for p in data["poster"] if p[3] >= grense]
+    return data["poster"]
+
+def finn(persona, modell, system_prompt, spørsmål, terskel=None):
+    """Returnerer (svar, likhet) for det mest like spørsmålet over terskelen, ellers None. Blokkerende."""
+    if not kan_caches(spørsmål):
+        stats["hoppet_over"] += 1
+        return None
+    vektor = _vektor(spørsmål)
+    terskel = TERSKEL if terskel is None else terskel
+    with _lås:
+        beste, beste_likhet = None, -1.0
+        for v, _, svar, _ in _poster(persona, modell, system_prompt):
+            likhet = sum(a * b for a, b in zip(vektor, v))
+            if likhet > beste_likhet:
+                beste, beste_likhet = svar, likhet
+        if beste is not None and beste_likhet >= terskel:
+            stats["treff"] += 1
+            return beste, beste_likhet
+        stats["bom"] += 1
+        return None
+
+def lagre(persona, modell, system_prompt, spørsmål, svar):
+    if not kan_caches(spørsmål) or not svar or not svar.strip(): return
+    vektor = _vektor(spørsmål)  # Som regel husket fra finn()
+    with _lås:
+        poster = _poster(persona, modell, system_prompt)
+        poster.append((vektor, spørsmål, svar, time.time()))
+        if len(poster) > MAKS_PER_PERSONA:
+            del poster[:len(poster) - MAKS_PER_PERSONA]
+        stats["lagret"] += 1
+
+def glem(persona=None, guild_id=None):
+    """Glemmer én persona, alle personaer i en server (guild_id), eller alt."""
+    with _lås:
+        if guild_id is not None:
+            for p in [p for p in _personaer if p.startswith(f"{guild_id}/")]:
+                del _personaer[p]
+        elif persona is None: _personaer.clear()
+        else: _personaer.pop(persona, None)
+
+async def afinn(*args, **kwargs):
+    """finn() utenfor event-loopen (embedding kan ta litt tid, og laster modellen første gang)."""
+    try:
+        return await asyncio.to_thread(finn, *args, **kwargs)
+    except Exception as e:
+        print(f"⚠️ Semantisk cache-oppslag feilet: {e}")
+        return None
+
+async def alagre(*args, **kwargs):
+    try:
+        await asyncio.to_thread(lagre, *args, **kwargs)
+    except Exception as e:
+        print(f"⚠️ Kunne ikke lagre i semantisk cache: {e}")
+
+def semantisk_statistikk():
+    oppslag = stats["treff"] + stats["bom"]
+    with _lås:
+        størrelse = sum(len(d["poster"]) for d in _personaer.values())
+    return {
+        **stats,
+        "størrelse": størrelse,
+        "personaer": len(_personaer),
+        "treffrate": round(stats["treff"] / oppslag * 100, 1) if oppslag else 0.0,
+        "terskel": TERSKEL,
+        "ttl": TTL
+    }
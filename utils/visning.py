@@ -0,0 +1,52 @@
+import time
+from contextlib import aclosing
+
+# --- KONFIGURASJON ---
+# Viser et AI-svar i Discord mens det strømmer inn (astream_gemini / astream_mistral),
+# i stedet for å vente på hele svaret. Én melding redigeres fortløpende, og svar over
+# Discords grense fortsetter i nye meldinger.
+MAKS_LENGDE = 1900
+OPPDATER_HVERT = 1.5  # sekunder. Discord tåler ikke redigering mye oftere enn dette
+MARKØR = " ▌"
+
+def _del_opp(tekst):
+    return [tekst[i:i + MAKS_LENGDE] for i in range(0, len(tekst), MAKS_LENGDE)] or [""]
+
+async def vis_strøm(kanal, strøm, overskrift="", svar_til=None, intervall=OPPDATER_HVERT):
+    """
+    Leser tekstbiter fra `strøm` og viser dem i `kanal` etter hvert.
+    svar_til: melding å svare på (første melding blir et reply). Returnerer hele teksten.
+    """
+    meldinger = []
+    vist = []
+    tekst = ""
+
+    async def tegn(ferdig):
+        deler = _del_opp(overskrift + tekst)
+        if not ferdig:
+            deler[-1] += MARKØR
+        for i, innhold in enumerate(deler):
+            if i < len(meldinger):
+                if vist[i] != innhold:
+                    await meldinger[i].edit(content=innhold)
+                    vist[i] = innhold
+            else:
+                if not meldinger and svar_til is not None:
+                    meldinger.append(await svar_til.reply(innhold))
+                else:
+                    meldinger.append(await kanal.send(innhold))
+                vist.append(innhold)
+
+    sist = 0
+    # Feiler Discord-kallet midt i strømmen, lukkes generatoren straks (slipper LLM-køplassen og tilkoblingen)
+    async with aclosing(strøm):
+        async for bit in strøm:
+            tekst += bit
+            if time.monotonic() - sist >= intervall and tekst.strip():
+                await tegn(ferdig=False)
+                sist = time.monotonic()
+
+    if not tekst.strip():
+        tekst = "🤷 (Tomt svar)"
+    await tegn(ferdig=True)
+    return tekst
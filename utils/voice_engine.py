@@ -8,7 +8,7 @@ import time
 from pydub import AudioSegment, silence
 from pydub.effects import speedup, normalize
 # Vi logger stemme-generering til systemet
-from utils.minne import lagre
+from utils.minne import alagre
 
 # --- KONFIGURASJON ---
 CACHE_DIR = "./data/voice_cache"
@@ -235,7 +235,7 @@ async def generate_voice(text, mood="neutral"):
         # LOGG TIL SYSTEMET
         try:
             char_count = len(text)
-            lagre(
+            await alagre(
                 tekst=f"Lyd generert ({mood}): {char_count} tegn på {duration:.2f}s",
                 user="VoiceEngine",
                 guild_id="SYSTEM",